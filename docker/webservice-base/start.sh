@@ -15,4 +15,5 @@ TIME=`date`
 echo "$TIME - connected successfully"
 
 simcity init -u simcityadmin -p simcity &&
-  exec python -m bottle scripts.app --bind 0.0.0.0:9090 -s gevent
+  exec python -m simcityweb.prefork scripts.app --bind 0.0.0.0:9090 \
+    ${SIMCITY_WORKERS:+--workers $SIMCITY_WORKERS}
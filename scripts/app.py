@@ -13,37 +13,192 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import functools
+import mimetypes
+import shutil
 import tempfile
 
 from gevent import monkey; monkey.patch_all()  # noqa E702
 
 import bottle
 from bottle import (post, get, run, delete, request, response, HTTPResponse,
-                    static_file, hook)
+                    hook)
 import simcity
 from simcity.util import listfiles
-from simcityweb.util import SimulationConfig, view_to_json
-from simcityweb import error
+from simcityweb.compression import CompressionPlugin, static_file
+from simcityweb.conditional import (ConditionalPlugin, check_etag, file_etag,
+                                    value_etag, rev_etag)
+from simcityweb.registry import SimulationRegistry, SimulationCatalogue
+from simcityweb.validation import ValidatorCache
+from simcityweb.submission import SubmissionScheduler
+from simcityweb.attachments import AttachmentCache, attachment_key
+from simcityweb.cache import ViewCache, DocumentCache
+from simcityweb.changes import ChangesFeed, ChangesFollower
+from simcityweb.mock import MOCK_ENV, mock_config, mock_storage
+from simcityweb.storage import CouchDBStorage, LocalStorage
+from simcityweb.tiles import TileCache, check_tile
+from simcityweb.totals import (OverviewTotals, CategoryCounter,
+                               ViewCategories, task_categories, job_categories,
+                               TASK_CATEGORIES, JOB_CATEGORIES)
+from simcityweb.tasks import (task_properties, bulk_save, chunks,
+                              BulkSubmission, parse_bulk_get, bulk_get,
+                              parse_bulk_delete, bulk_delete, couchdb_error,
+                              COUCHDB_EXCEPTIONS)
+from simcityweb.util import (view_to_json, etag_matches, not_modified,
+                             parse_fields, project)
+from simcityweb.views import (parse_limit, stream_view, stream_rows,
+                              view_page, page_to_json, ListViewResults,
+                              PAGE_SIZE)
+from simcityweb import error, serialization
+from simcityweb.pool import PooledSession, use_session, with_session
 from couchdb.http import (ResourceConflict, Unauthorized, ResourceNotFound,
-                          PreconditionFailed, ServerError)
+                          ServerError, Session)
 import os
-import json
+import time
 import accept_types
 
-simcity.init(None)
+# The mock webservice (scripts/mock.py) serves the example tasks in memory,
+# without configuration file or databases
+if os.environ.get(MOCK_ENV) == '1':
+    config = mock_config()
+else:
+    simcity.init(None)
+    config = simcity.get_config()
 
-config_sim = simcity.get_config().section('Simulations')
-couch_cfg = simcity.get_config().section('task-db')
+config_sim = config.section('Simulations')
+couch_cfg = config.section('task-db')
 prefix = '/explore'
 
+# JSON library, chosen before any JSON is parsed at startup
+serialization.use_backend(config_sim.get('json_backend') or None)
+
+# Tasks are stored in CouchDB, or, without jobs, with storage = local in an
+# SQLite database on this node or with storage = mock in memory
+local_storage = config_sim.get('storage', 'couchdb') != 'couchdb'
+
+# Keep-alive connections to CouchDB, shared by the task and job databases
+couchdb_session = PooledSession(
+    timeout=float(config_sim.get('couchdb_timeout', 60)),
+    max_connections=int(config_sim.get('couchdb_max_connections', 10)),
+    wait_timeout=float(config_sim.get('couchdb_pool_timeout', 10)))
+if not local_storage:
+    use_session(simcity.get_task_database().db, couchdb_session)
+    use_session(simcity.get_job_database().db, couchdb_session)
+
+# Parsed simulation configurations, shared between requests
+registry = SimulationRegistry('simulations')
+catalogue = SimulationCatalogue(registry)
+try:
+    catalogue.refresh()
+except Exception:
+    # a broken simulation file must not keep the webservice from starting;
+    # the error is reported by /simulate, which refreshes the catalogue
+    pass
+validators = ValidatorCache(registry, 'schemas')
+
+
+def submit_if_needed(host, max_jobs):
+    if local_storage:
+        return None  # without job database, there is nothing to submit
+    return simcity.submit_if_needed(host, max_jobs)
+
+
+# Checks whether jobs need to be submitted after tasks are added. If
+# submission fails, the user can still call /explore/job.
+submissions = SubmissionScheduler(
+    lambda host: submit_if_needed(host, 1),
+    interval=float(config_sim.get('submit_interval', 5)))
+
+# Downloaded attachments of tasks
+attachments = AttachmentCache(
+    config_sim.get('attachment_cache',
+                   os.path.join(tempfile.gettempdir(), 'simcity-attachments')),
+    max_size=int(config_sim.get('attachment_cache_size', 1024)) * 1024 ** 2)
+
+# GeoJSON tiles of attachments, cached with the attachments
+tiles = TileCache(attachments,
+                  max_indexes=int(config_sim.get('tile_index_cache_size', 16)))
+
+# Ensemble design documents that are known to exist. The views of all
+# simulations are created and indexed in the background at startup.
+views = ViewCache(simcity.ensemble_view,
+                  max_size=int(config_sim.get('view_cache_size', 1024)))
+if not local_storage:
+    try:
+        views.start_warm(
+            simcity.get_task_database(), registry.simulations(),
+            lambda db, design_doc: db.view('all_docs', design_doc=design_doc,
+                                           limit=0).rows)
+    except Exception:
+        pass  # views are created on their first request instead
+
+# Task documents, in the CouchDB task database, in the local database or, in
+# the mock webservice, in memory
+if config_sim.get('storage') == 'mock':
+    storage = mock_storage()
+elif local_storage:
+    storage = LocalStorage(config_sim.get('local_database',
+                                          'simcity-tasks.sqlite'))
+else:
+    storage = CouchDBStorage(
+        simcity.get_task_database, views,
+        public_url=couch_cfg['public_url'] + couch_cfg['database']
+        if 'public_url' in couch_cfg else None)
+
+
+def changes_of(get_database):
+    # continuous feeds stay open, so they do not use pooled connections
+    def changes(since):
+        return with_session(get_database().db, Session()).changes(
+            feed='continuous', include_docs=True, heartbeat=30000,
+            since=since)
+    return changes
+
+
+# Changes of the task database, from a single changes feed per process that
+# the status events, the totals and the document cache share
+changes = ChangesFeed(storage.changes)
+
+# Totals of tasks and jobs, counted once from the views of the databases and
+# then updated from the changes of the task and job databases
+totals = OverviewTotals(
+    CategoryCounter(storage, task_categories, TASK_CATEGORIES,
+                    transient=('pending', 'in_progress')),
+    CategoryCounter(None if local_storage
+                    else ViewCategories(simcity.get_job_database,
+                                        JOB_CATEGORIES),
+                    job_categories, JOB_CATEGORIES,
+                    transient=('pending_jobs', 'running_jobs',
+                               'finished_jobs', 'active_jobs')))
+totals.tasks.follow(changes)
+changes.start()
+if local_storage:
+    totals.jobs.seed()
+else:
+    job_changes = ChangesFollower(changes_of(simcity.get_job_database))
+    totals.jobs.follow(job_changes)
+    job_changes.start()
+
+# Task documents; finished tasks are served without asking the database
+documents = DocumentCache(
+    storage.get, storage.rev,
+    max_size=int(config_sim.get('document_cache_size', 64)) * 1024 ** 2)
+changes.listeners.append(documents.changed)
+
 # Get project directory
 file_dir = os.path.dirname(os.path.realpath(__file__))
 project_dir = os.path.dirname(file_dir)
 
-# Remove spaces from json output
+
+# Encode and decode json with the configured or the fastest installed
+# library, without spaces in the output
+json_dumps = serialization.dumps
+bottle.json_loads = serialization.loads
+
 bottle.uninstall('json')
-bottle.install(bottle.JSONPlugin(
-    json_dumps=lambda x: json.dumps(x, separators=(',', ':'))))
+bottle.install(CompressionPlugin())
+bottle.install(ConditionalPlugin())
+bottle.install(bottle.JSONPlugin(json_dumps=json_dumps))
 
 
 @hook('before_request')
@@ -78,21 +233,8 @@ def get_doc():
 
 @get(prefix + '/simulate')
 def simulate_list():
-    simulations = {}
     try:
-        for f in listfiles('simulations'):
-            if not (f.endswith('.yaml') or f.endswith('.json')) \
-               or f.endswith('.min.json'):
-                continue
-
-            name = f[:-5]
-            config = SimulationConfig(name, 'simulations')
-            simulations[name] = {
-                'name': name,
-                'versions': config.get_versions()
-            }
-
-        return simulations
+        catalogue.refresh()
     except HTTPResponse as ex:
         return ex
     except KeyError as ex:
@@ -100,11 +242,19 @@ def simulate_list():
     except ValueError as ex:
         return error(412, str(ex))
 
+    if etag_matches(catalogue.etag, request.get_header('If-None-Match')):
+        return not_modified(catalogue.etag)
+
+    response.content_type = 'application/json'
+    response.set_header('ETag', catalogue.etag)
+    return catalogue.body
+
 
 @get(prefix + '/simulate/<name>')
 def get_simulation_by_name(name):
     try:
-        config = SimulationConfig(name, 'simulations')
+        config = registry.get(name)
+        check_etag(value_etag(name, config.signature))
         return {'name': name, 'versions': config.get_versions()}
     except HTTPResponse as ex:
         return ex
@@ -117,9 +267,10 @@ def get_simulation_by_name(name):
 @get(prefix + '/simulate/<name>/<version>')
 def get_simulation_by_name_version(name, version=None):
     try:
-        config = SimulationConfig(name, 'simulations')
+        config = registry.get(name)
         sim = config.get_simulation(version)
-        chosen_sim = sim.description
+        check_etag(value_etag(name, sim.version, config.signature))
+        chosen_sim = dict(sim.description)
         chosen_sim['name'] = sim.name
         chosen_sim['version'] = sim.version
         return chosen_sim
@@ -149,12 +300,7 @@ def simulate_name_version(name, version=None):
         del query['_id']
 
     try:
-        config = SimulationConfig(name, 'simulations')
-        sim = config.get_simulation(version)
-        sim = sim.description
-        sim['type'] = 'object'
-        sim['additionalProperties'] = False
-        simcity.parse_parameters(query, sim)
+        simulation, duration = validators.validate(name, version, query)
     except HTTPResponse as ex:
         return ex
     except KeyError as ex:
@@ -164,44 +310,94 @@ def simulate_name_version(name, version=None):
     except EnvironmentError as ex:
         return error(500, ex.message)
 
-    task_props = {
-        'name': name,
-        'command': sim['command'],
-        'arguments': sim.get('arguments', []),
-        'parallelism': sim.get('parallelism', '*'),
-        'version': version,
-        'input': query,
-    }
-    if 'ensemble' in query:
-        task_props['ensemble'] = query['ensemble']
-    if 'simulation' in query:
-        task_props['simulation'] = query['simulation']
-    if 'defaultFeatureType' in sim:
-        task_props['defaultFeatureType'] = sim['defaultFeatureType']
-    if 'resourceTypeUrl' in sim:
-        task_props['typeUrl'] = sim['resourceTypeUrl']
-
-    if task_id is not None:
-        task_props['_id'] = task_id
+    task_props = task_properties(name, version, simulation.description,
+                                 query, task_id=task_id)
 
+    doc = simcity.Task(task_props).value
     try:
-        token = simcity.add_task(task_props)
+        storage.save(doc)
     except ResourceConflict:
         return error(409, "simulation name " + task_id + " already taken")
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
 
-    try:
-        simcity.submit_if_needed(config_sim['default_host'], 1)
-    except:
-        pass  # too bad. User can call /explore/job.
+    submissions.request(config_sim['default_host'])
 
     response.status = 201  # created
-    url = '{0}/simulation/{1}'.format(prefix, token.id)
+    response.set_header('Server-Timing',
+                        'validate;dur={0:.3f}'.format(1000 * duration))
+    url = '{0}/simulation/{1}'.format(prefix, doc['_id'])
     response.set_header('Location', url)
-    return token.value
+    return doc
+
+
+@post(prefix + '/simulate/<name>/<version>/_bulk')
+def simulate_bulk(name, version):
+    try:
+        limit = request.query.get('limit')
+        if limit is not None:
+            limit = int(limit)
+    except ValueError:
+        return error(412, "limit must be an integer")
+
+    try:
+        validator = validators.get(name, version)
+        submission = BulkSubmission(request.json,
+                                    validator.simulation.description,
+                                    limit=limit)
+    except HTTPResponse as ex:
+        return ex
+    except KeyError as ex:
+        return error(404, str(ex))
+    except ValueError as ex:
+        return error(412, str(ex))
+    except EnvironmentError as ex:
+        return error(500, ex.message)
+
+    max_size = int(config_sim.get('max_bulk_size', 10000))
+    if len(submission) > max_size:
+        return error(413, "{0} simulations requested, at most {1} allowed"
+                          .format(len(submission), max_size))
+
+    if request.query.get('dry_run') in ('1', 'true'):
+        return {'count': len(submission)}
+
+    start = time.time()
+    errors = submission.validate(
+        lambda query: validators.timed_validate(validator, query))
+    response.set_header('Server-Timing', 'validate;dur={0:.3f}'
+                        .format(1000 * (time.time() - start)))
+    if errors:
+        return HTTPResponse({'error': 'parameters do not validate',
+                             'tasks': errors}, 412)
+
+    response.status = 201  # created
+    response.content_type = 'application/json'
+    return stream_bulk_submission(name, version, validator, submission)
+
+
+def stream_bulk_submission(name, version, validator, submission):
+    """ Save the tasks of a bulk submission in chunks, streaming the result
+    of each task as a JSON array. """
+    tasks = submission.tasks(name, version, validator.fill_defaults)
+    separator = ''
+    yield '{"tasks":['
+    try:
+        for chunk in chunks(tasks):
+            docs = [simcity.Task(props).value for props in chunk]
+            for result in bulk_save(storage, docs):
+                yield separator + json_dumps(result)
+                separator = ','
+    except (Unauthorized, ServerError, EnvironmentError) as ex:
+        yield separator + json_dumps({'error': str(ex)})
+    yield ']}'
+
+    submissions.request(config_sim['default_host'])
 
 
 @get(prefix + '/schema')
 def schema_list():
+    check_etag(file_etag('schemas'))
     files = listfiles('schemas')
     return {'schemas': [f[:-5] for f in files if f.endswith('.json')]}
 
@@ -214,6 +410,7 @@ def schema_name(name):
 
 @get(prefix + '/resource')
 def resource_list():
+    check_etag(file_etag('resources'))
     files = listfiles('resources')
     return {"resources": [f[:-5] for f in files if f.endswith('.json')]}
 
@@ -226,14 +423,26 @@ def resource_name(name):
 
 @get(prefix + '/view/totals')
 def overview():
-    try:
-        return simcity.overview_total()
-    except:
-        return error(500, "cannot read overview")
+    snapshot = totals.snapshot()
+    if snapshot is None and local_storage:
+        return error(503, "totals are not counted yet")
+    elif snapshot is None:
+        try:
+            return simcity.overview_total()
+        except:
+            return error(500, "cannot read overview")
+
+    counts, etag = snapshot
+    if etag_matches(etag, request.get_header('If-None-Match')):
+        return not_modified(etag)
+    response.set_header('ETag', etag)
+    return counts
 
 
 @post(prefix + '/job')
 def submit_job():
+    if local_storage:
+        return error(503, "jobs cannot be submitted without job database")
     host = request.query.get('host', default=config_sim['default_host'])
     try:
         job = simcity.submit_if_needed(host, int(config_sim['max_jobs']))
@@ -253,59 +462,180 @@ def submit_job():
 def simulations_view(name, version):
     try:
         ensemble = request.query.get('ensemble')
-        config = SimulationConfig(name, 'simulations')
+        config = registry.get(name)
         sim = config.get_simulation(version)
-        version = sim.version
-        db = simcity.get_task_database()
-        design_doc = simcity.ensemble_view(db, name, version,
-                                           ensemble=ensemble)
-
-        return view_to_json(db.view('all_docs', design_doc=design_doc))
+        return ensemble_view_page(name, sim.version, ensemble)
     except KeyError as ex:
         return error(404, str(ex))
     except ValueError as ex:
         return error(412, str(ex))
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
+
+
+def ensemble_view_page(name, version, ensemble):
+    query = storage.view(name, version, ensemble)
+
+    # rows are keyed by task id, so the id is the whole cursor
+    startkey = request.query.get('startkey_docid') or None
+    fields = parse_fields(request.query.get('fields'))
+    stream = request.query.get('stream') in ('1', 'true')
+    limit = PAGE_SIZE if stream else parse_limit(request.query.get('limit'))
+
+    # the first page gives the update sequence of the ETag, without asking
+    # the database for it separately
+    page = view_page(query, limit, startkey, startkey, fields,
+                     update_seq=True)
+    if page[0].update_seq is not None:
+        check_etag(value_etag(page[0].update_seq, request.path,
+                              request.query_string))
+    if stream:
+        response.content_type = 'application/json'
+        return stream_view(query, startkey=startkey, startkey_docid=startkey,
+                           dumps=json_dumps, fields=fields, first_page=page)
+    return page_to_json(*page)
 
 
 @get(prefix + '/view/jobs')
 def jobs_view():
-    return view_to_json(simcity.get_job_database().view('active_jobs'))
+    if local_storage:
+        return view_to_json(ListViewResults([], 0, 0))
+    db = simcity.get_job_database()
+    check_etag(value_etag(db.db.info()['update_seq'], request.path))
+    return view_to_json(db.view('active_jobs'))
+
+
+@get(prefix + '/changes/simulations')
+def simulation_changes():
+    subscription = changes.subscribe(
+        ids=request.query.getall('id'),
+        ensemble=request.query.get('ensemble'),
+        name=request.query.get('name'))
+    response.content_type = 'text/event-stream'
+    response.set_header('Cache-Control', 'no-cache')
+    response.set_header('X-Accel-Buffering', 'no')
+    return changes.stream(subscription)
+
+
+@post(prefix + '/simulations/_bulk_get')
+def bulk_get_simulations():
+    try:
+        ids, fields = parse_bulk_get(
+            request.json, max_size=int(config_sim.get('max_bulk_size', 10000)))
+    except HTTPResponse as ex:
+        return ex
+    except ValueError as ex:
+        return error(412, str(ex))
+
+    response.content_type = 'application/json'
+    return stream_rows(bulk_get(storage.rows, ids, fields), dumps=json_dumps)
 
 
 @get(prefix + '/simulation/<id>')
 def get_simulation(id):
     try:
-        return simcity.get_task_database().get(id)
-    except ValueError:
+        doc = documents.get(id)
+    except ResourceNotFound:
         return error(404, "simulation does not exist")
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
+
+    fields = parse_fields(request.query.get('fields'))
+    if fields is None:
+        check_etag(rev_etag(doc['_rev']))
+        return doc
+    check_etag(value_etag(doc['_rev'], fields))
+    return project(doc, fields)
 
 
 @get(prefix + '/simulation/<id>/<attachment>')
 def get_attachment(id, attachment):
     try:
-        task = simcity.get_task(id)
-    except ValueError:
+        task = simcity.Task(storage.get(id))
+    except ResourceNotFound:
         return error(404, "simulation does not exist")
-
-    if attachment in task.attachments:
-        url = simcity.get_task_database().url.rstrip('/')
-
-        if 'public_url' in couch_cfg:
-            url = couch_cfg['public_url'] + couch_cfg['database']
-
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
+
+    path = storage.attachment_file(id, attachment)
+    url = storage.attachment_url(id, attachment)
+    if path is not None:
+        return static_file(os.path.basename(path), root=os.path.dirname(path))
+    elif attachment in task.attachments and url is not None:
         response.status = 302  # temporary redirect
-        response.set_header('Location',
-                            '{0}/{1}/{2}'.format(url, id, attachment))
+        response.set_header('Location', url)
     elif attachment in task.files:
-        download_dir = tempfile.mkdtemp()
-        simcity.download_attachment(task, download_dir, attachment)
-        content_type = task.files[attachment].get('content_type', 'auto')
-        return static_file(attachment, mimetype=content_type,
-                           root=download_dir)
+        metadata = task.files[attachment]
+        key = attachment_key(id, task.value.get('_rev'),
+                             metadata.get('digest'), attachment)
+        try:
+            path = download_attachment(task, attachment, key)
+        except EnvironmentError:
+            return error(502, "cannot download attachment")
+
+        content_type = metadata.get('content_type')
+        if content_type is None:
+            content_type = mimetypes.guess_type(attachment)[0] or 'auto'
+        return static_file(os.path.basename(path), mimetype=content_type,
+                           root=attachments.path)
     else:
         return error(404, "attachment not found")
 
 
+def download_attachment(task, attachment, key):
+    """ Path of an attachment of a task in the attachment cache, which is
+    downloaded if it is not cached yet. """
+    def fetch(target):
+        download_dir = tempfile.mkdtemp(
+            prefix=os.path.basename(target) + '.', suffix='.tmp',
+            dir=attachments.path)
+        try:
+            simcity.download_attachment(task, download_dir, attachment)
+            os.rename(os.path.join(download_dir, attachment), target)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+    return attachments.get(key, fetch)
+
+
+@get(prefix + '/simulation/<id>/<attachment>/tiles/<z:int>/<x:int>/<y:int>')
+def get_attachment_tile(id, attachment, z, x, y):
+    try:
+        check_tile(z, x, y)
+        task = simcity.Task(storage.get(id))
+    except ValueError as ex:
+        return error(404, str(ex))
+    except ResourceNotFound:
+        return error(404, "simulation does not exist")
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
+
+    path = storage.attachment_file(id, attachment)
+    if path is not None:
+        # a file on this node is indexed once for all tasks that have it
+        key = attachment_key(path, None, file_etag(path), attachment)
+    else:
+        if attachment in task.files:
+            metadata = task.files[attachment]
+        elif attachment in task.attachments:
+            metadata = task.attachments[attachment]
+        else:
+            return error(404, "attachment not found")
+        key = attachment_key(id, task.value.get('_rev'),
+                             metadata.get('digest'), attachment)
+    if path is None:
+        # downloaded only if the tile and the tile index are not cached
+        path = functools.partial(download_attachment, task, attachment, key)
+    try:
+        path = tiles.get(key, path, z, x, y)
+    except ValueError as ex:
+        return error(412, str(ex))
+    except EnvironmentError:
+        return error(502, "cannot download attachment")
+    return static_file(os.path.basename(path), root=attachments.path,
+                       mimetype='application/geo+json')
+
+
 @delete(prefix + '/simulation/<id>')
 def del_simulation(id):
     rev = request.query.get('rev')
@@ -314,27 +644,81 @@ def del_simulation(id):
     if rev is None:
         return error(409, "revision not specified")
 
-    task = simcity.Document({'_id': id, '_rev': rev})
-
     try:
-        simcity.get_task_database().delete(task)
+        storage.delete(id, rev)
+        documents.invalidate(id)
         return {'ok': True}
-    except Unauthorized:
-        return error(401, "unauthorized")
-    except ResourceNotFound:
-        return error(404, "document not found")
-    except ResourceConflict:
-        return error(409, "resource conflict")
-    except PreconditionFailed:
-        return error(412, "precondition failed")
-    except ServerError:
-        return error(502, "CouchDB connection failed")
+    except COUCHDB_EXCEPTIONS as ex:
+        return error(*couchdb_error(ex))
+
+
+@post(prefix + '/simulations/_bulk_delete')
+def bulk_delete_simulations():
+    try:
+        docs, selector = parse_bulk_delete(
+            request.json, max_size=int(config_sim.get('max_bulk_size', 10000)))
+    except HTTPResponse as ex:
+        return ex
+    except ValueError as ex:
+        return error(412, str(ex))
+
+    if selector is not None:
+        name, version, ensemble = selector
+        try:
+            version = registry.get(name).get_simulation(version).version
+            docs = storage.revisions(name, version, ensemble)
+        except KeyError as ex:
+            return error(404, str(ex))
+        except ValueError as ex:
+            return error(412, str(ex))
+        except COUCHDB_EXCEPTIONS as ex:
+            return error(*couchdb_error(ex))
+
+    response.content_type = 'application/json'
+    return stream_bulk_delete(storage, docs)
+
+
+def stream_bulk_delete(database, docs):
+    """ Delete documents in chunks, streaming the result of each deletion
+    as a JSON array. """
+    separator = ''
+    yield '{"tasks":['
+    try:
+        for result in bulk_delete(database, docs):
+            documents.invalidate(result['id'])
+            yield separator + json_dumps(result)
+            separator = ','
+    except (Unauthorized, ServerError, EnvironmentError) as ex:
+        yield separator + json_dumps({'error': str(ex)})
+    yield ']}'
+
+
+# Statistics of the components of the webservice, by name
+statistics = {
+    'validation': validators.stats,
+    'submission': submissions.stats,
+    'attachments': attachments.stats,
+    'tiles': tiles.stats,
+    'views': views.stats,
+    'changes': changes.stats,
+    'totals': totals.stats,
+    'couchdb': couchdb_session.connection_pool.stats,
+    'documents': documents.stats,
+    'storage': storage.stats,
+}
+
+
+@get(prefix + '/stats')
+def get_stats():
+    stats = dict((name, stats_of()) for name, stats_of in statistics.items())
+    stats['pid'] = os.getpid()
+    return stats
 
 
 @get(prefix + '/hosts')
 def get_hosts():
     hosts = {}
-    for section in simcity.get_config().sections():
+    for section in config.sections():
         if section.endswith('-host'):
             host_name = section[:-5]
             hosts[host_name] = {}
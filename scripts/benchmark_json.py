@@ -0,0 +1,83 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the speed of the installed JSON libraries on a view response and
+# on GeoJSON. Run as python -m scripts.benchmark_json [rows].
+
+from __future__ import print_function
+
+from simcityweb import serialization
+import os
+import sys
+import timeit
+
+project_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def view_response(n):
+    """ A response of /view/simulations with n rows. """
+    rows = []
+    for i in range(n):
+        task_id = 'task_{0:06d}'.format(i)
+        rows.append({'id': task_id, 'key': task_id, 'value': {
+            'id': task_id, 'rev': '3-{0:032x}'.format(i),
+            'ensemble': 'myensemble',
+            'url': '/couchdb/simcity/{0}'.format(task_id),
+            'error': [], 'lock': 1439388534 + i, 'done': 1439390617 + i,
+            'input': {
+                'fires': [{'x': 77.5 + i * 1e-4, 'y': 13.1 - i * 1e-4}
+                          for _ in range(10)],
+                'numberOfFireStations': 3,
+            },
+        }})
+    return {'total_rows': n, 'offset': 0, 'rows': rows}
+
+
+def geojson_response():
+    with open(os.path.join(project_dir, 'mock_results',
+                           'WardGeoResponse.json')) as f:
+        return serialization.load(f)
+
+
+def best_time(function, number):
+    """ Best time in milliseconds of a call to function. """
+    times = timeit.repeat(function, number=number, repeat=5)
+    return min(times) / number * 1000
+
+
+def benchmark(payloads, number=10):
+    previous = serialization.backend()
+    print('{0:<10} {1:<8} {2:>10} {3:>10} {4:>10}'.format(
+        'payload', 'library', 'size (kB)', 'dumps (ms)', 'loads (ms)'))
+    try:
+        for name, value in payloads:
+            for backend in serialization.BACKENDS:
+                serialization.use_backend(backend)
+                text = serialization.dumps(value)
+                dumps_time = best_time(
+                    lambda: serialization.dumps(value), number)
+                loads_time = best_time(
+                    lambda: serialization.loads(text), number)
+                print('{0:<10} {1:<8} {2:>10.1f} {3:>10.2f} {4:>10.2f}'
+                      .format(name, backend, len(text) / 1024.0, dumps_time,
+                              loads_time))
+    finally:
+        serialization.use_backend(previous)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    benchmark([('view', view_response(n)), ('geojson', geojson_response())])
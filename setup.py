@@ -12,9 +12,11 @@ setup(name='simcityweb',
       author_email='j.borgdorff@esciencecenter.nl',
       url='https://esciencecenter.nl/projects/sim-city/',
       packages=['simcityweb'],
-      install_requires=["gevent", "bottle", "accept-types", 'simcity[xenon]'],
+      install_requires=["gevent", "bottle", "accept-types", "jsonschema",
+                        'simcity[xenon]'],
       extras_require={
           'test': ['pytest', 'pytest-flake8'],
+          'brotli': ['brotli'],
       },
       dependency_links=[simcity_url],
       )
@@ -15,11 +15,13 @@
 # limitations under the License.
 
 from .util import get_json, error, Simulation, SimulationConfig
+from .registry import SimulationRegistry
 
 __all__ = [
     'get_json',
     'error',
     'abort',
     'SimulationConfig',
-    'Simulation'
+    'Simulation',
+    'SimulationRegistry',
 ]
@@ -0,0 +1,206 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .compression import EXTENSIONS
+from collections import OrderedDict
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+
+def attachment_key(task_id, rev, digest, filename):
+    """ Cache key of an attachment of a given task revision. """
+    parts = [task_id, rev or '', digest or '', filename]
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class AttachmentCache(object):
+    """ On-disk cache of downloaded attachments.
+
+    Files are stored under their key and evicted least recently used first
+    when the total size exceeds max_size bytes. Files and directories ending
+    in .tmp are incomplete downloads; they are named after the key and the
+    id of the downloading process, and are removed at startup if that
+    process no longer runs. When several requests ask for the same missing
+    file, it is downloaded only once; the other requests wait for that
+    download. Compressed variants of a file are removed together with it.
+
+    Several processes may share the directory. Each of them limits the size
+    of the files it knows of, and files that another process downloaded or
+    evicted are picked up on their next request.
+    """
+    def __init__(self, path, max_size=1024 ** 3):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._downloads = {}
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._scan()
+
+    def get(self, key, fetch):
+        """ Path of the cached file with given key.
+
+        On a miss, fetch(target) is called to write the file to path target.
+        Errors raised by fetch are raised to all waiting requests. """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    size = self._entries.pop(key)
+                    if os.path.isfile(self.filename(key)):
+                        self._entries[key] = size
+                        self.hits += 1
+                        return self.filename(key)
+                    self.size -= size  # evicted by another process
+
+                if key not in self._downloads and self._adopt(key):
+                    self.hits += 1
+                    return self.filename(key)
+
+                download = self._downloads.get(key)
+                if download is None:
+                    download = self._downloads[key] = Download()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                download.done.wait()
+                if download.error is not None:
+                    raise download.error
+                continue
+
+            self.misses += 1
+            try:
+                self._fetch(key, fetch)
+                return self.filename(key)
+            except Exception as ex:
+                download.error = ex
+                raise
+            finally:
+                with self._lock:
+                    del self._downloads[key]
+                download.done.set()
+
+    def filename(self, key):
+        return os.path.join(self.path, key)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _fetch(self, key, fetch):
+        target = self.filename(key)
+        tmp = '{0}.{1}.{2}.tmp'.format(target, os.getpid(), uuid.uuid4().hex)
+        try:
+            fetch(tmp)
+            os.rename(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        with self._lock:
+            size = os.path.getsize(target)
+            self._entries[key] = size
+            self.size += size
+            self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        while self.size > self.max_size and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self.size -= size
+            self.evictions += 1
+            filename = self.filename(key)
+            for path in [filename] + [filename + ext
+                                      for ext in EXTENSIONS.values()]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _adopt(self, key):
+        """ Add a file that another process downloaded. Must be called with
+        the lock held. """
+        try:
+            size = os.path.getsize(self.filename(key))
+        except OSError:
+            return False
+        self._entries[key] = size
+        self.size += size
+        self._evict(keep=key)
+        return True
+
+    def _scan(self):
+        """ Add files left by a previous process, oldest first. """
+        files = []
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            if name.endswith('.tmp'):
+                if downloading(name):
+                    continue
+                elif os.path.isdir(filename):
+                    shutil.rmtree(filename, ignore_errors=True)
+                else:
+                    os.remove(filename)
+            elif '.' not in name and os.path.isfile(filename):
+                stat = os.stat(filename)
+                files.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.size += size
+        self._evict()
+
+
+def downloading(name):
+    """ Whether the process that created a temporary file, named
+    key.pid.*.tmp, is still running. """
+    try:
+        pid = int(name.split('.')[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False  # left by an earlier process with the same id
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
+
+
+class Download(object):
+    """ Download in progress, shared by all requests for the same file. """
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
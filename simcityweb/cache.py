@@ -0,0 +1,215 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import serialization
+from .changes import task_status
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """ Thread-safe mapping of at most max_size items.
+
+    If weigh is given, the total weigh(value) of all items is at most
+    max_size instead. When it is full, the least recently used items are
+    removed. """
+    def __init__(self, max_size=1024, weigh=None):
+        self.max_size = max_size
+        self.weigh = weigh
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                item = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = item
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        weight = 1 if self.weigh is None else self.weigh(value)
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (value, weight)
+            self.size += weight
+            while self.size > self.max_size and len(self._items) > 1:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def peek(self, key, default=None):
+        """ Get an item without marking it as used. """
+        item = self._items.get(key)
+        return default if item is None else item[0]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._remove(key)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+        return item
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            'entries': len(self._items),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class ViewCache(object):
+    """ Remembers which ensemble design documents exist.
+
+    create(db, name, version, ensemble=ensemble) checks for or creates the
+    design document of an ensemble and returns its name, like
+    simcity.ensemble_view. It is only called the first time an ensemble is
+    requested, or again after invalidate, for instance when the design
+    document turned out to be deleted.
+    """
+    def __init__(self, create, max_size=1024):
+        self.create = create
+        self._design_docs = LRUCache(max_size)
+
+    def get(self, db, name, version, ensemble=None):
+        key = (name, version, ensemble)
+        design_doc = self._design_docs.get(key)
+        if design_doc is None:
+            design_doc = self.create(db, name, version, ensemble=ensemble)
+            self._design_docs.put(key, design_doc)
+        return design_doc
+
+    def invalidate(self, name, version, ensemble=None):
+        self._design_docs.pop((name, version, ensemble))
+
+    def warm(self, db, simulations, query=None):
+        """ Create the design documents of given (name, version) pairs.
+
+        If given, query(db, design_doc) is called for each of them to build
+        the view index. Errors are ignored; the view will be created on
+        its first request instead. Returns the number of views warmed. """
+        warmed = 0
+        for name, version in simulations:
+            try:
+                design_doc = self.get(db, name, version)
+                if query is not None:
+                    query(db, design_doc)
+            except Exception:
+                self.invalidate(name, version)
+                continue
+            warmed += 1
+        return warmed
+
+    def start_warm(self, db, simulations, query=None):
+        """ Warm the views in a background thread. """
+        thread = threading.Thread(target=self.warm,
+                                  args=(db, simulations, query),
+                                  name='view-warmup')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stats(self):
+        return self._design_docs.stats()
+
+
+class DocumentCache(object):
+    """ Read-through cache of task documents, of at most max_size bytes of
+    JSON.
+
+    fetch(doc_id) returns a document and revision(doc_id) its current
+    revision, or None if it was deleted. Finished and failed tasks are
+    served from the cache without asking the database; other tasks are
+    revalidated with revision first. Pass the changes of the database to
+    changed, so that finished tasks that are changed after all are evicted.
+    """
+    def __init__(self, fetch, revision, max_size=64 * 1024 ** 2):
+        self.fetch = fetch
+        self.revision = revision
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+        self._documents = LRUCache(
+            max_size, weigh=lambda doc: len(serialization.dumps(doc)))
+
+    def get(self, doc_id):
+        """ Get a document; raises the same errors as fetch. """
+        doc = self._documents.get(doc_id)
+        if doc is not None:
+            if task_status(doc) in ('done', 'error'):
+                self.hits += 1
+                return doc
+            self.revalidations += 1
+            if self.revision(doc_id) == doc['_rev']:
+                self.hits += 1
+                return doc
+            self._documents.pop(doc_id)
+
+        self.misses += 1
+        doc = self.fetch(doc_id)
+        self._documents.put(doc_id, doc)
+        return doc
+
+    def invalidate(self, doc_id):
+        if self._documents.pop(doc_id) is not None:
+            self.invalidations += 1
+
+    def changed(self, change):
+        """ Evict a document if change is about another revision. """
+        doc = self._documents.peek(change['id'])
+        if doc is None:
+            return
+        if (change.get('deleted') or
+                (change.get('doc') or {}).get('_rev') != doc['_rev']):
+            self._documents.pop(change['id'])
+            self.invalidations += 1
+
+    def stats(self):
+        stats = self._documents.stats()
+        requests = self.hits + self.misses
+        stats.update({
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / requests if requests else 0.0,
+            'revalidations': self.revalidations,
+            'invalidations': self.invalidations,
+        })
+        return stats
@@ -0,0 +1,275 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import serialization
+from six.moves import queue
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def task_status(doc):
+    """ Status of a task document: pending, in_progress, done or error. """
+    lock = doc.get('lock', 0)
+    done = doc.get('done', 0)
+    if lock == -1 or done == -1:
+        return 'error'
+    elif done > 0:
+        return 'done'
+    elif lock > 0:
+        return 'in_progress'
+    else:
+        return 'pending'
+
+
+def task_event(change):
+    """ Status event of a change of the task database, or None if the change
+    is not about a task. """
+    if change.get('deleted'):
+        return {'id': change['id'], 'status': 'deleted',
+                'seq': change.get('seq')}
+
+    doc = change.get('doc')
+    if doc is None or doc.get('type', 'task') != 'task':
+        return None
+
+    return {
+        'id': change['id'],
+        'rev': doc.get('_rev'),
+        'seq': change.get('seq'),
+        'name': doc.get('name'),
+        'version': doc.get('version'),
+        'ensemble': doc.get('ensemble'),
+        'status': task_status(doc),
+        'lock': doc.get('lock', 0),
+        'done': doc.get('done', 0),
+        'errors': len(doc.get('error', [])),
+    }
+
+
+def sse_message(data, event=None, event_id=None):
+    """ Format data as a Server-Sent Events message. """
+    lines = []
+    if event_id is not None:
+        lines.append('id: {0}'.format(event_id))
+    if event is not None:
+        lines.append('event: {0}'.format(event))
+    lines.append('data: {0}'.format(serialization.dumps(data)))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription(object):
+    """ Status events of a client, filtered by task id, ensemble or
+    simulation name.
+
+    Events are buffered up to max_size; a client that falls further behind
+    is closed, so that it does not hold up the other clients. Deleted tasks
+    only have an id, so they only match subscriptions without ensemble or
+    name filter. """
+    def __init__(self, ids=None, ensemble=None, name=None, max_size=1000):
+        self.ids = frozenset(ids) if ids else None
+        self.ensemble = ensemble
+        self.name = name
+        self.closed = False
+        self.events = queue.Queue(max_size)
+
+    def matches(self, event):
+        if self.ids is not None and event['id'] not in self.ids:
+            return False
+        if (self.ensemble is not None and
+                event.get('ensemble') != self.ensemble):
+            return False
+        if self.name is not None and event.get('name') != self.name:
+            return False
+        return True
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.close()
+
+    def get(self, timeout=None):
+        """ Next event, or None on timeout or when the subscription was
+        closed. """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.events.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+class ChangesFollower(object):
+    """ Follows the changes of a database in a background thread.
+
+    changes(since) must return an iterator over the changes after sequence
+    since, like couchdb.Database.changes(feed='continuous',
+    include_docs=True, since=since). Each change is passed to publish and to
+    the functions in listeners; a listener that fails is logged and does not
+    keep the change from the other listeners. If the feed ends or fails, it
+    is resumed from the last sequence after a delay that doubles up to
+    max_backoff seconds.
+
+    If seed is set, it is called in the background thread before the first
+    change is read, and returns the sequence to follow the changes from, so
+    that a listener can read the state of the database first.
+    """
+    def __init__(self, changes, since='now', max_backoff=60.0):
+        self.changes = changes
+        self.since = since
+        self.max_backoff = max_backoff
+        self.listeners = []
+        self.seed = None
+        self.seeded = False
+        self.reconnects = 0
+        self.listener_errors = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start the background thread, if it is not running. """
+        if self.changes is None:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self.run, name=type(self).__name__)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def run(self):
+        backoff = 1.0
+        while True:
+            try:
+                if self.consume():
+                    backoff = 1.0
+            except Exception:
+                logger.exception('changes feed failed; resuming after %s in '
+                                 '%.0f seconds', self.since, backoff)
+            self.reconnects += 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def consume(self):
+        """ Publish changes from the feed until it ends, starting after the
+        last sequence. Returns whether any change was received. """
+        if not self.seeded:
+            if self.seed is not None:
+                self.since = self.seed()
+            self.seeded = True
+        received = False
+        for change in self.changes(self.since):
+            received = True
+            if 'last_seq' in change:
+                self.since = change['last_seq']
+            else:
+                self.publish(change)
+        return received
+
+    def publish(self, change):
+        if 'seq' in change:
+            self.since = change['seq']
+        for listener in list(self.listeners):
+            self.notify(listener, change)
+
+    def notify(self, listener, change):
+        """ Pass a change to a listener, logging its errors. """
+        try:
+            listener(change)
+        except Exception:
+            self.listener_errors += 1
+            logger.exception('listener %r failed on change %s of %s',
+                             listener, change.get('seq'), change.get('id'))
+
+
+class ChangesFeed(ChangesFollower):
+    """ A single subscription to the changes of the task database, shared
+    by all clients and by the listeners of the process.
+
+    The feed starts with the first subscriber, if it was not started
+    before. Without changes function, events are only published by calling
+    publish.
+    """
+    def __init__(self, changes=None, since='now', max_backoff=60.0):
+        ChangesFollower.__init__(self, changes, since, max_backoff)
+        self.events = 0
+        self._subscriptions = set()
+
+    def subscribe(self, ids=None, ensemble=None, name=None):
+        subscription = Subscription(ids, ensemble, name)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, change):
+        """ Pass a change to the listeners and send it to all matching
+        subscribers. """
+        ChangesFollower.publish(self, change)
+        self.notify(self.send, change)
+
+    def send(self, change):
+        event = task_event(change)
+        if event is None:
+            return
+
+        self.events += 1
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.closed:
+                self.unsubscribe(subscription)
+            elif subscription.matches(event):
+                subscription.put(event)
+
+    def stream(self, subscription, heartbeat=15.0):
+        """ Server-Sent Events of a subscription, with a comment every
+        heartbeat seconds to keep the connection open. Unsubscribes when
+        the client disconnects. """
+        try:
+            yield 'retry: 5000\n\n'
+            while not subscription.closed:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield sse_message(event, event='status',
+                                      event_id=event.get('seq'))
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            'subscribers': len(self._subscriptions),
+            'events': self.events,
+            'reconnects': self.reconnects,
+            'listener_errors': self.listener_errors,
+            'since': self.since,
+        }
@@ -0,0 +1,268 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .conditional import file_etag
+from .util import (etag_matches, matching_etag, not_modified,
+                   encoded_etag)
+import bottle
+from bottle import HTTPResponse, request, response
+import functools
+import mimetypes
+import os
+import six
+import uuid
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported encodings, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+
+# Maximum compression level per encoding, used for precompressed files
+MAX_LEVEL = {'br': 11, 'gzip': 9}
+
+
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """ Best content encoding according to an Accept-Encoding header, or
+    None if the client does not accept any of the encodings. """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[parts[0].strip().lower()] = quality
+
+    default = qualities.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def add_vary(headers, field):
+    """ Add a request header field to the Vary header of a response, after
+    the fields that it already varies by. """
+    fields = [f.strip() for f in headers.get_header('Vary', '').split(',')
+              if f.strip()]
+    if '*' in fields or field.lower() in [f.lower() for f in fields]:
+        return
+    headers.set_header('Vary', ', '.join(fields + [field]))
+
+
+def compressible(content_type):
+    if not content_type:
+        return False
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type == 'text/event-stream':
+        return False
+    return (content_type.startswith('text/') or
+            content_type in COMPRESSIBLE_TYPES or
+            content_type.endswith('+json') or content_type.endswith('+xml'))
+
+
+class Compressor(object):
+    """ Incremental compressor for a content encoding. """
+    def __init__(self, encoding, level):
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                                16 + zlib.MAX_WBITS)
+            self.compress = self._compressor.compress
+            self.flush = self._compressor.flush
+        elif encoding == 'br' and brotli is not None:
+            self._compressor = brotli.Compressor(quality=level)
+            self.compress = self._compressor.process
+            self.flush = self._compressor.finish
+        else:
+            raise ValueError('unsupported encoding {0}'.format(encoding))
+
+
+def compress(data, encoding, level):
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level):
+    compressor = Compressor(encoding, level)
+    for chunk in chunks:
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def precompress(path, encoding, chunk_size=64 * 1024):
+    """ Path of a compressed variant of a file, kept next to it.
+
+    The variant is created on first use, or when the file was modified after
+    the variant was created, with the maximum compression level. Returns None
+    if the variant cannot be written. """
+    variant = path + EXTENSIONS[encoding]
+    try:
+        if os.path.getmtime(variant) >= os.path.getmtime(path):
+            return variant
+    except OSError:
+        pass
+
+    tmp = '{0}.{1}.tmp'.format(variant, uuid.uuid4().hex)
+    try:
+        compressor = Compressor(encoding, MAX_LEVEL[encoding])
+        with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+        os.rename(tmp, variant)
+        return variant
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+
+
+def static_file(filename, root, mimetype='auto', threshold=1024):
+    """ Like bottle.static_file, but serves a precompressed variant of the
+    file if the client accepts it. """
+    if mimetype == 'auto':
+        mimetype = mimetypes.guess_type(filename)[0] or 'auto'
+
+    encoding = negotiate(request.get_header('Accept-Encoding'))
+    if (encoding is not None and compressible(mimetype) and
+            request.get_header('Range') is None):
+        root = os.path.abspath(root) + os.sep
+        path = os.path.abspath(os.path.join(root, filename.strip('/\\')))
+        if (path.startswith(root) and os.path.isfile(path) and
+                os.path.getsize(path) >= threshold):
+            variant = precompress(path, encoding)
+            if variant is not None:
+                rv = _static_file(os.path.basename(variant),
+                                  os.path.dirname(variant), mimetype)
+                if rv.status_code < 400:
+                    rv.set_header('Content-Encoding', encoding)
+                add_vary(rv, 'Accept-Encoding')
+                return rv
+
+    rv = _static_file(filename, root, mimetype)
+    if compressible(mimetype):
+        add_vary(rv, 'Accept-Encoding')
+    return rv
+
+
+def _static_file(filename, root, mimetype):
+    """ bottle.static_file with a strong ETag of the served file. """
+    root = os.path.abspath(root) + os.sep
+    path = os.path.abspath(os.path.join(root, filename.strip('/\\')))
+    if not path.startswith(root) or not os.path.isfile(path):
+        return bottle.static_file(filename, root=root, mimetype=mimetype)
+
+    etag = file_etag(path)
+    if etag_matches(etag, request.get_header('If-None-Match')):
+        return not_modified(etag)
+    rv = bottle.static_file(filename, root=root, mimetype=mimetype)
+    if rv.status_code < 400:
+        rv.set_header('ETag', etag)
+    return rv
+
+
+class CompressionPlugin(object):
+    """ Compresses dynamic responses of compressible content types.
+
+    Bodies of at least threshold bytes and streamed bodies are compressed
+    with the encoding negotiated with the client; their ETag gets the
+    encoding as suffix. Install this plugin before the JSON plugin, so that
+    it receives the serialized JSON.
+    """
+    name = 'compression'
+    api = 2
+
+    def __init__(self, threshold=1024, level=6):
+        self.threshold = threshold
+        self.level = level
+
+    def apply(self, callback, route):
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            try:
+                rv = callback(*args, **kwargs)
+            except HTTPResponse as resp:
+                rv = resp
+            return self.compress(rv)
+        return wrapper
+
+    def compress(self, rv):
+        if isinstance(rv, HTTPResponse):
+            headers, body = rv, rv.body
+        else:
+            headers, body = response, rv
+
+        if headers.status_code == 304 and 'ETag' in headers:
+            # the representation that the client has is still valid
+            tag = matching_etag(headers['ETag'],
+                                request.get_header('If-None-Match'))
+            if tag is not None and tag != '*':
+                headers.set_header('ETag', tag)
+            return rv
+
+        if (not compressible(headers.content_type) or
+                'Content-Encoding' in headers):
+            return rv
+        add_vary(headers, 'Accept-Encoding')
+
+        encoding = negotiate(request.get_header('Accept-Encoding'))
+        if (encoding is None or headers.status_code in (204, 304) or
+                request.get_header('Range') is not None):
+            return rv
+
+        level = min(self.level, MAX_LEVEL[encoding])
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+        if isinstance(body, six.binary_type):
+            if len(body) < self.threshold:
+                return rv
+            body = compress(body, encoding, level)
+        elif hasattr(body, '__iter__') and not hasattr(body, 'read'):
+            body = compress_stream(body, encoding, level)
+        else:
+            return rv
+
+        headers.set_header('Content-Encoding', encoding)
+        if 'ETag' in headers:
+            headers.set_header('ETag', encoded_etag(headers['ETag'], encoding))
+        if 'Content-Length' in headers:
+            del headers['Content-Length']
+
+        if isinstance(rv, HTTPResponse):
+            rv.body = body
+            return rv
+        return body
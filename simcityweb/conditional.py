@@ -0,0 +1,109 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .util import make_etag, etag_matches, not_modified
+from bottle import HTTPResponse, request, response
+from couchdb.http import ResourceNotFound
+import functools
+import json
+import os
+import six
+
+
+def file_etag(*paths):
+    """ Strong ETag of files or directories, from their modification time
+    and size. Missing paths are included as such. """
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append([path, stat.st_mtime, stat.st_size])
+        except OSError:
+            parts.append([path, None, None])
+    return make_etag(json.dumps(parts).encode('utf-8'))
+
+
+def value_etag(*values):
+    """ Strong ETag of JSON-serializable values, such as a database
+    update sequence together with the query parameters. """
+    return make_etag(json.dumps(values, sort_keys=True).encode('utf-8'))
+
+
+def rev_etag(rev):
+    """ ETag of a CouchDB document revision, as CouchDB sends it. """
+    return '"{0}"'.format(rev)
+
+
+def document_rev(database, doc_id):
+    """ Current revision of a document, with a HEAD request instead of
+    fetching the document. Returns None if it does not exist.
+
+    database is a couchdb.Database. """
+    if doc_id[:1] == '_':
+        resource = database.resource(*doc_id.split('/', 1))
+    else:
+        resource = database.resource(doc_id)
+    try:
+        _, headers, _ = resource.head()
+    except ResourceNotFound:
+        return None
+    etag = headers.get('ETag')
+    return etag.strip('"') if etag else None
+
+
+def check_etag(etag):
+    """ Answer 304 Not Modified if the request has a matching
+    If-None-Match header, otherwise set the ETag of the response.
+
+    Call this before building the response body; it raises the 304
+    response as an HTTPResponse. """
+    if etag_matches(etag, request.get_header('If-None-Match')):
+        raise not_modified(etag)
+    response.set_header('ETag', etag)
+
+
+class ConditionalPlugin(object):
+    """ Adds an ETag to successful GET responses that do not have one yet,
+    computed from the serialized body, and answers If-None-Match requests
+    for an unchanged body with 304 Not Modified.
+
+    This still builds the body; routes that can compute their ETag cheaply
+    call check_etag first. Install this plugin after the compression plugin
+    and before the JSON plugin, so that it sees the uncompressed JSON. """
+    name = 'conditional'
+    api = 2
+
+    def apply(self, callback, route):
+        if route.method not in ('GET', 'HEAD'):
+            return callback
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            rv = callback(*args, **kwargs)
+            if (isinstance(rv, HTTPResponse) or response.status_code != 200 or
+                    'ETag' in response):
+                return rv
+
+            body = rv.encode('utf-8') if isinstance(rv, six.text_type) else rv
+            if not isinstance(body, six.binary_type):
+                return rv
+
+            etag = make_etag(body)
+            if etag_matches(etag, request.get_header('If-None-Match')):
+                return not_modified(etag)
+            response.set_header('ETag', etag)
+            return rv
+        return wrapper
@@ -0,0 +1,88 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import functools
+import random
+import time
+
+
+def parse_latency(value):
+    """ Parse latency rules like /explore/view/*=0.05~0.02;*=0.01 into a
+    list of (pattern, delay, jitter) tuples, in seconds.
+
+    Raises ValueError if a rule is not of the form PATTERN=DELAY[~JITTER]
+    or has a negative delay or jitter. """
+    rules = []
+    for item in value.split(';'):
+        if not item.strip():
+            continue
+        pattern, sep, delay = item.strip().rpartition('=')
+        if not sep or not pattern:
+            raise ValueError('latency {0} is not of the form '
+                             'PATTERN=DELAY[~JITTER]'.format(item))
+        delay, _, jitter = delay.partition('~')
+        delay, jitter = float(delay), float(jitter or 0)
+        if delay < 0 or jitter < 0:
+            raise ValueError('latency of {0} is negative'.format(pattern))
+        rules.append((pattern.strip(), delay, jitter))
+    return rules
+
+
+class LatencyPlugin(object):
+    """ Delays requests before they are handled, to mimic the latency of
+    CouchDB and of the infrastructure behind the webservice.
+
+    The first rule whose pattern matches the route, like
+    /explore/simulation/* or POST /explore/*, delays it by its delay plus or
+    minus at most its jitter seconds. Routes without a matching rule are
+    not delayed. Under gevent, a delay only blocks its own request.
+    """
+    name = 'latency'
+    api = 2
+
+    def __init__(self, rules, sleep=None):
+        self.rules = list(rules)
+        self.sleep = sleep
+        self.random = random.Random()
+        self.delayed = 0
+
+    def latency(self, method, rule):
+        """ The (delay, jitter) of a route, or None if it is not delayed. """
+        for pattern, delay, jitter in self.rules:
+            if (fnmatch.fnmatchcase(rule, pattern) or
+                    fnmatch.fnmatchcase('{0} {1}'.format(method, rule),
+                                        pattern)):
+                return delay, jitter
+        return None
+
+    def apply(self, callback, route):
+        latency = self.latency(route.method, route.rule)
+        if latency is None or latency == (0, 0):
+            return callback
+        delay, jitter = latency
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            self.delayed += 1
+            # time.sleep is looked up now, as gevent may have patched it
+            sleep = self.sleep or time.sleep
+            sleep(max(0, delay + self.random.uniform(-jitter, jitter)))
+            return callback(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        return {'rules': len(self.rules), 'delayed': self.delayed}
@@ -0,0 +1,101 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .storage import MockStorage
+from .synthetic import (TaskGenerator, StatusSimulator, parse_distribution,
+                        parse_simulations)
+from .taskstore import TaskStore
+from . import serialization
+import os
+
+# Environment variable that makes the webservice serve the mock tasks,
+# without configuration file or databases
+MOCK_ENV = 'SIMCITY_MOCK'
+
+
+class MockConfig(object):
+    """ Configuration of the mock webservice, like simcity.Config. """
+    def __init__(self, sections):
+        self._sections = sections
+
+    def section(self, name):
+        return self._sections.get(name, {})
+
+    def sections(self):
+        return list(self._sections)
+
+
+def mock_config():
+    """ Configuration of the mock webservice: tasks are stored by
+    mock_storage and there are no job hosts. """
+    return MockConfig({'Simulations': {
+        'storage': 'mock',
+        'max_jobs': '1',
+        'max_bulk_size': '10000',
+        'default_host': 'mock',
+    }})
+
+
+def load_tasks(directory):
+    """ Rows of the task documents in the JSON files in a directory. """
+    rows = []
+    for root, _, files in os.walk(directory, topdown=False):
+        for name in files:
+            if name.endswith('.json'):
+                with open(os.path.join(root, name)) as f:
+                    rows.append(serialization.load(f))
+    return rows
+
+
+def mock_storage(environ=os.environ, tasks='mock_tasks',
+                 results='mock_results'):
+    """ Storage with the example tasks in the tasks directory and synthetic
+    tasks shaped like them, with the files in the results directory as
+    attachments.
+
+    The synthetic tasks for load tests, and the status changes of tasks
+    over time, are configured with environment variables:
+    SIMCITY_MOCK_TASKS: number of tasks to generate
+    SIMCITY_MOCK_SIMULATIONS: simulations, like matsim:0.5,matsim:0.4
+    SIMCITY_MOCK_ENSEMBLES: number of ensembles
+    SIMCITY_MOCK_STATUS: fraction of tasks per status, like
+        pending=0.5,done=0.5
+    SIMCITY_MOCK_RATE: number of tasks that start and finish per second
+    SIMCITY_MOCK_ERROR_RATE: fraction of tasks that finish with an error
+    SIMCITY_MOCK_SEED: random seed
+    """
+    store = TaskStore()
+    examples = load_tasks(tasks)
+    for row in examples:
+        store.put(row)
+
+    generator = TaskGenerator(
+        [row['value'] for row in examples],
+        simulations=parse_simulations(environ['SIMCITY_MOCK_SIMULATIONS'])
+        if environ.get('SIMCITY_MOCK_SIMULATIONS') else None,
+        ensembles=int(environ.get('SIMCITY_MOCK_ENSEMBLES', 10)),
+        distribution=parse_distribution(environ['SIMCITY_MOCK_STATUS'])
+        if environ.get('SIMCITY_MOCK_STATUS') else None,
+        seed=environ.get('SIMCITY_MOCK_SEED'))
+    for row in generator.tasks(int(environ.get('SIMCITY_MOCK_TASKS', 0))):
+        store.put(row)
+
+    simulator = StatusSimulator(
+        store, generator,
+        rate=float(environ.get('SIMCITY_MOCK_RATE', 0)),
+        error_rate=float(environ.get('SIMCITY_MOCK_ERROR_RATE', 0.05)))
+    simulator.start()
+    return MockStorage(store, results=results, simulator=simulator)
@@ -0,0 +1,206 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from couchdb import Database
+from couchdb.http import ConnectionPool, ServerError, Session
+from couchdb.util import urlsplit
+import threading
+import time
+
+
+class PoolTimeout(ServerError):
+    """ No connection to CouchDB became available in time. """
+    def __init__(self, host, timeout):
+        ServerError.__init__(self, (503, (
+            'pool_timeout', 'no connection to {0} available after {1} '
+            'seconds'.format(host, timeout))))
+
+
+def pool_key(url):
+    """ Scheme and host of a URL, as ConnectionPool groups them. """
+    return tuple(urlsplit(url, 'http', False)[:2])
+
+
+def use_session(database, session):
+    """ Send all requests of a couchdb.Database through session. """
+    database.resource.session = session
+    return database
+
+
+def with_session(database, session):
+    """ A copy of a couchdb.Database, with the same credentials, that
+    uses another session. """
+    copy = Database(database.resource.url, session=session)
+    copy.resource.credentials = database.resource.credentials
+    return copy
+
+
+class BoundedConnectionPool(ConnectionPool):
+    """ Keep-alive connections to CouchDB, at most max_connections in use
+    per host.
+
+    Requests wait for a connection to be returned for at most wait_timeout
+    seconds, or without limit if it is None, and then raise PoolTimeout. At
+    most max_idle connections per host are kept open for reuse. Connections
+    that are not returned because a request failed must be discarded, so
+    that their slot becomes available again; PooledSession does this.
+    """
+    def __init__(self, timeout=None, max_connections=10, max_idle=None,
+                 wait_timeout=None, **kwargs):
+        ConnectionPool.__init__(self, timeout, **kwargs)
+        self.max_connections = max_connections
+        self.max_idle = max_connections if max_idle is None else max_idle
+        self.wait_timeout = wait_timeout
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self._active = {}
+        self._checked_out = {}
+        self._available = threading.Condition()
+        self._local = threading.local()
+
+    def get(self, url):
+        key = pool_key(url)
+        with self._available:
+            self.requests += 1
+            if self._active.get(key, 0) >= self.max_connections:
+                self._wait(key)
+            self._active[key] = self._active.get(key, 0) + 1
+
+        try:
+            with self.lock:
+                idle = len(self.conns.get(key, ()))
+            conn = ConnectionPool.get(self, url)
+        except Exception:
+            self._return(key)
+            raise
+
+        if idle == 0:
+            self.created += 1
+        with self._available:
+            self._checked_out[conn] = key
+        self.owned().append(conn)
+        return conn
+
+    def release(self, url, conn):
+        with self._available:
+            key = self._checked_out.pop(conn, None)
+        if key is None:
+            return
+
+        with self.lock:
+            idle = self.conns.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        self._return(key)
+
+    def owned(self):
+        """ Connections taken by the current thread or greenlet. """
+        try:
+            return self._local.owned
+        except AttributeError:
+            self._local.owned = []
+            return self._local.owned
+
+    def discard(self, conn):
+        """ Close a connection that was not released after use. """
+        with self._available:
+            key = self._checked_out.pop(conn, None)
+        if key is None:
+            return
+        conn.close()
+        self.discarded += 1
+        self._return(key)
+
+    def stats(self):
+        hosts = {}
+        with self.lock:
+            for (scheme, host), conns in self.conns.items():
+                hosts['{0}://{1}'.format(scheme, host)] = {
+                    'active': self._active.get((scheme, host), 0),
+                    'idle': len(conns),
+                }
+        return {
+            'max_connections': self.max_connections,
+            'max_idle': self.max_idle,
+            'requests': self.requests,
+            'waits': self.waits,
+            'wait_seconds': self.wait_time,
+            'max_wait_seconds': self.max_wait_time,
+            'timeouts': self.timeouts,
+            'created': self.created,
+            'discarded': self.discarded,
+            'hosts': hosts,
+        }
+
+    def _wait(self, key):
+        """ Wait until a connection to key is returned. Must be called with
+        the _available condition held. """
+        self.waits += 1
+        start = time.time()
+        try:
+            while self._active.get(key, 0) >= self.max_connections:
+                if self.wait_timeout is None:
+                    self._available.wait()
+                    continue
+                remaining = start + self.wait_timeout - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(key[1], self.wait_timeout)
+                self._available.wait(remaining)
+        finally:
+            duration = time.time() - start
+            self.wait_time += duration
+            self.max_wait_time = max(self.max_wait_time, duration)
+
+    def _return(self, key):
+        with self._available:
+            self._active[key] -= 1
+            self._available.notify()
+
+
+class PooledSession(Session):
+    """ couchdb.http.Session that uses a BoundedConnectionPool.
+
+    Connections of requests that raise an error are discarded instead of
+    being lost to the pool. Assign an instance to the session attribute of
+    the resource of a couchdb.Database to use it for that database. """
+    def __init__(self, timeout=None, max_connections=10, max_idle=None,
+                 wait_timeout=None, **kwargs):
+        Session.__init__(self, timeout=timeout, **kwargs)
+        self.connection_pool = BoundedConnectionPool(
+            timeout, max_connections=max_connections, max_idle=max_idle,
+            wait_timeout=wait_timeout)
+
+    def request(self, *args, **kwargs):
+        pool = self.connection_pool
+        owned = pool.owned()
+        start = len(owned)
+        try:
+            return Session.request(self, *args, **kwargs)
+        except Exception:
+            for conn in owned[start:]:
+                pool.discard(conn)
+            raise
+        finally:
+            del owned[start:]
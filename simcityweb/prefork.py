@@ -0,0 +1,318 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from .serve import parse_bind
+import argparse
+import errno
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+
+def listen(host, port, backlog=1024):
+    """ Listening TCP socket, to be shared by all workers. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def serve(target, sock, heartbeat_fd, heartbeat=1.0, graceful_timeout=30.0):
+    """ Serve a bottle application with gevent on an inherited socket.
+
+    target is the module of the application, as for bottle.load_app. A byte
+    is written to heartbeat_fd every heartbeat seconds while the event loop
+    is responsive, starting when the application is loaded. On SIGTERM, the
+    worker stops accepting connections and waits at most graceful_timeout
+    seconds for open requests. """
+    from gevent import monkey
+    monkey.patch_all()
+    import bottle
+    import gevent
+    from gevent.event import Event
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    listener = socket.fromfd(sock.fileno(), sock.family, sock.type)
+    sock.close()
+    app = bottle.load_app(target)
+    # a pool, so that stop can wait for open requests
+    server = WSGIServer(listener, app, spawn=Pool())
+
+    def beat():
+        while True:
+            try:
+                os.write(heartbeat_fd, b'.')
+            except OSError as ex:
+                if ex.errno != errno.EAGAIN:
+                    raise
+            gevent.sleep(heartbeat)
+
+    stopped = Event()
+
+    def stop():
+        server.stop(timeout=graceful_timeout)
+        stopped.set()
+
+    signal_handler = getattr(gevent, 'signal_handler', None) or gevent.signal
+    signal_handler(signal.SIGTERM, gevent.spawn, stop)
+    server.start()
+    gevent.spawn(beat)
+    stopped.wait()
+
+
+class Worker(object):
+    """ A forked worker process, as seen by the supervisor. """
+    def __init__(self, pid, heartbeat_fd):
+        self.pid = pid
+        self.heartbeat_fd = heartbeat_fd
+        self.last_beat = time.time()
+        self.started = self.last_beat
+        self.ready = False
+        self.stopping = None
+
+    def stop(self, sig=signal.SIGTERM):
+        if self.stopping is None:
+            self.stopping = time.time()
+        try:
+            os.kill(self.pid, sig)
+        except OSError as ex:
+            if ex.errno != errno.ESRCH:
+                raise
+
+
+class Supervisor(object):
+    """ Pre-forks workers that serve a bottle application on a shared
+    socket, and keeps their number constant.
+
+    Every worker imports the application itself after it is forked, so
+    caches and background threads of the application are per worker.
+    Workers whose event loop does not write a heartbeat for timeout seconds
+    are killed and replaced, as are workers that exit. Loading the
+    application, which may wait for the databases, may take startup_timeout
+    seconds before the first heartbeat. On SIGHUP, a new set of workers is
+    started and the old workers are stopped gracefully, which reloads the
+    application code and configuration. On SIGTERM or SIGINT, all workers
+    are stopped gracefully.
+    """
+    def __init__(self, target, host='localhost', port=9090, workers=None,
+                 timeout=30.0, graceful_timeout=30.0, heartbeat=1.0,
+                 startup_timeout=120.0):
+        self.target = target
+        self.host = host
+        self.port = port
+        self.num_workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.graceful_timeout = graceful_timeout
+        self.heartbeat = heartbeat
+        self.workers = {}
+        self.restarts = 0
+        self.kills = 0
+        self._signals = []
+        self._next_spawn = 0
+
+    def run(self):
+        self.socket = listen(self.host, self.port)
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame:
+                          self._signals.append(signum))
+        self.log('listening on http://{0}:{1}/ with {2} workers'
+                 .format(self.host, self.port, self.num_workers))
+        for _ in range(self.num_workers):
+            self.spawn()
+        try:
+            while self.step():
+                pass
+        finally:
+            self.socket.close()
+
+    def step(self):
+        """ Handle signals, heartbeats and exited workers once. Returns
+        False when all workers stopped after SIGTERM or SIGINT. """
+        stopping = False
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum == signal.SIGHUP:
+                self.reload()
+            else:
+                stopping = True
+                for worker in list(self.workers.values()):
+                    worker.stop()
+        if stopping:
+            self.shutdown()
+            return False
+
+        self.read_heartbeats(timeout=self.heartbeat)
+        self.reap()
+        self.check()
+        if self.running() < self.num_workers and \
+                time.time() >= self._next_spawn:
+            self.spawn()
+        return True
+
+    def running(self):
+        return sum(1 for worker in self.workers.values()
+                   if worker.stopping is None)
+
+    def spawn(self):
+        """ Fork a new worker. Workers that exit right after they start are
+        replaced at most once per second. """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(read_fd)
+                for worker in self.workers.values():
+                    os.close(worker.heartbeat_fd)
+                for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, signal.SIG_DFL)
+                set_nonblocking(write_fd)
+                serve(self.target, self.socket, write_fd,
+                      heartbeat=self.heartbeat,
+                      graceful_timeout=self.graceful_timeout)
+            except BaseException as ex:
+                print('worker {0} failed: {1}'.format(os.getpid(), ex),
+                      file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        set_nonblocking(read_fd)
+        self.workers[pid] = Worker(pid, read_fd)
+        self._next_spawn = time.time() + 1.0
+        self.log('started worker {0}'.format(pid))
+
+    def reload(self):
+        """ Replace all workers by new ones. """
+        self.restarts += 1
+        self.log('reloading')
+        for worker in list(self.workers.values()):
+            worker.stop()
+        self._next_spawn = 0
+        for _ in range(self.num_workers):
+            self.spawn()
+
+    def read_heartbeats(self, timeout):
+        fds = dict((worker.heartbeat_fd, worker)
+                   for worker in self.workers.values())
+        try:
+            readable, _, _ = select.select(list(fds), [], [], timeout)
+        except (select.error, OSError):
+            return  # interrupted by a signal
+        now = time.time()
+        for fd in readable:
+            try:
+                os.read(fd, 1024)
+            except OSError:
+                continue
+            fds[fd].last_beat = now
+            fds[fd].ready = True
+
+    def reap(self):
+        """ Forget workers that exited. """
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno != errno.ECHILD:
+                    raise
+                break
+            if pid == 0:
+                break
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.heartbeat_fd)
+            if worker.stopping is None:
+                self.log('worker {0} exited with status {1}'
+                         .format(pid, status))
+
+    def check(self):
+        """ Kill workers without heartbeat, workers that take too long to
+        start and workers that take too long to stop. """
+        now = time.time()
+        for worker in list(self.workers.values()):
+            timeout = self.timeout if worker.ready else self.startup_timeout
+            if worker.stopping is not None:
+                if now - worker.stopping > self.graceful_timeout + 5:
+                    worker.stop(signal.SIGKILL)
+            elif now - worker.last_beat > timeout:
+                self.log('worker {0} missed its {1} for {2:.0f} seconds; '
+                         'killing it'.format(
+                             worker.pid,
+                             'heartbeat' if worker.ready else 'startup',
+                             now - worker.last_beat))
+                self.kills += 1
+                worker.stop(signal.SIGKILL)
+
+    def shutdown(self):
+        """ Wait until all workers stopped. """
+        self.log('stopping')
+        while self.workers:
+            self.read_heartbeats(timeout=0.1)
+            self.reap()
+            self.check()
+
+    def log(self, message):
+        print('supervisor {0}: {1}'.format(os.getpid(), message),
+              file=sys.stderr)
+
+
+def set_nonblocking(fd):
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve a bottle application with pre-forked gevent '
+                    'workers.')
+    parser.add_argument('target', help='application module, e.g. scripts.app')
+    parser.add_argument('-b', '--bind', default='localhost:9090',
+                        help='address to listen on, host:port')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of workers (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds without heartbeat before a worker is '
+                             'killed')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds that a stopping worker may take to '
+                             'finish open requests')
+    parser.add_argument('--startup-timeout', type=float, default=120.0,
+                        help='seconds that a worker may take to load the '
+                             'application before its first heartbeat')
+    args = parser.parse_args(argv)
+
+    host, port = parse_bind(args.bind)
+    Supervisor(args.target, host=host, port=port,
+               workers=args.workers, timeout=args.timeout,
+               graceful_timeout=args.graceful_timeout,
+               startup_timeout=args.startup_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import serialization
+from .util import SimulationConfig, Simulation, freeze, make_etag
+import os
+import threading
+import time
+
+SOURCE_EXTENSIONS = ('.yaml', '.json')
+
+
+def source_signature(path, name):
+    """ Modification signature of the files a simulation is loaded from.
+
+    Returns None if no source file exists. """
+    signature = []
+    for ext in SOURCE_EXTENSIONS:
+        try:
+            stat = os.stat(os.path.join(path, name + ext))
+        except OSError:
+            continue
+        signature.append((ext, stat.st_mtime, stat.st_size))
+
+    return tuple(signature) if signature else None
+
+
+def simulation_names(path):
+    """ Names of the simulations configured in a directory. """
+    names = set()
+    for f in os.listdir(path):
+        if f.endswith('.min.json'):
+            continue
+        for ext in SOURCE_EXTENSIONS:
+            if f.endswith(ext):
+                names.add(f[:-len(ext)])
+    return names
+
+
+class FrozenSimulationConfig(SimulationConfig):
+    """ SimulationConfig with read-only simulation descriptions. """
+    def __init__(self, name, path, signature=None):
+        self.signature = signature
+        SimulationConfig.__init__(self, name, path)
+
+    def make_simulation(self, sim, name, version):
+        return Simulation(name, version, freeze(sim[version]))
+
+
+class SimulationRegistry(object):
+    """ Process-wide cache of parsed simulation configurations.
+
+    A configuration is parsed once, with its aliases resolved, and reloaded
+    only when the file it was read from changes. Simulation descriptions are
+    frozen so they can safely be shared between requests; copy them before
+    making changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """ Get the SimulationConfig of a simulation.
+
+        Raises the same errors as SimulationConfig. """
+        signature = source_signature(self.path, name)
+        config = self._configs.get(name)
+        if (config is not None and signature is not None and
+                config.signature == signature):
+            return config
+
+        with self._lock:
+            config = self._configs.get(name)
+            if (config is not None and signature is not None and
+                    config.signature == signature):
+                return config
+
+            try:
+                config = FrozenSimulationConfig(name, self.path, signature)
+            except Exception:
+                self._configs.pop(name, None)
+                raise
+
+            if signature is not None:
+                self._configs[name] = config
+            return config
+
+    def simulations(self):
+        """ All (name, version) pairs of the simulations that can be
+        loaded, with aliases resolved. """
+        pairs = set()
+        for name in simulation_names(self.path):
+            try:
+                config = self.get(name)
+            except Exception:
+                continue
+            for sim in config.simulations.values():
+                if isinstance(sim, Simulation):
+                    pairs.add((name, sim.version))
+        return sorted(pairs)
+
+    def invalidate(self, name=None):
+        """ Forget a cached configuration, or all of them. """
+        with self._lock:
+            if name is None:
+                self._configs.clear()
+            else:
+                self._configs.pop(name, None)
+
+
+class SimulationCatalogue(object):
+    """ Serialized list of all simulations and their versions.
+
+    The list is kept as JSON bytes with a strong ETag. At most once per
+    interval seconds, the simulation directory is checked for added,
+    removed or changed files, and only those are reloaded.
+    """
+    def __init__(self, registry, interval=2.0):
+        self.registry = registry
+        self.interval = interval
+        self.body = None
+        self.etag = None
+        self._entries = {}
+        self._signatures = {}
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """ Update the catalogue if the check interval has passed.
+
+        Raises the same errors as SimulationConfig if a simulation could
+        not be loaded; it will be retried on the next refresh. """
+        now = time.time()
+        if (not force and self._checked is not None and
+                now - self._checked < self.interval):
+            return
+
+        with self._lock:
+            self._checked = now
+            path = self.registry.path
+            names = simulation_names(path)
+            changed = False
+
+            for name in set(self._entries) - names:
+                del self._entries[name]
+                del self._signatures[name]
+                changed = True
+
+            try:
+                for name in names:
+                    signature = source_signature(path, name)
+                    if self._signatures.get(name) == signature:
+                        continue
+                    config = self.registry.get(name)
+                    self._entries[name] = {
+                        'name': name,
+                        'versions': config.get_versions(),
+                    }
+                    self._signatures[name] = signature
+                    changed = True
+            finally:
+                if changed or self.body is None:
+                    self._serialize()
+
+    def _serialize(self):
+        body = serialization.dumps(self._entries,
+                                   sort_keys=True).encode('utf-8')
+        self.body, self.etag = body, make_etag(body)
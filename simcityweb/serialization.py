@@ -0,0 +1,107 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _json_dumps(value, sort_keys=False):
+    return json.dumps(value, separators=(',', ':'), sort_keys=sort_keys)
+
+
+def _orjson_dumps(value, sort_keys=False):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        return orjson.dumps(value, option=option).decode('utf-8')
+    except TypeError:
+        return _json_dumps(value, sort_keys)
+
+
+def _ujson_dumps(value, sort_keys=False):
+    try:
+        return ujson.dumps(value, sort_keys=sort_keys,
+                           escape_forward_slashes=False)
+    except (TypeError, OverflowError):
+        return _json_dumps(value, sort_keys)
+
+
+# Installed JSON libraries as name: (dumps, loads), fastest first. Whatever
+# the library, dumps returns compact JSON text, and values that it cannot
+# encode, such as integers of more than 64 bits, are encoded by the json
+# module instead. orjson decodes such integers as floats.
+BACKENDS = OrderedDict()
+if orjson is not None:
+    BACKENDS['orjson'] = (_orjson_dumps, orjson.loads)
+if ujson is not None:
+    BACKENDS['ujson'] = (_ujson_dumps, ujson.loads)
+BACKENDS['json'] = (_json_dumps, json.loads)
+
+_current = {}
+
+
+def use_backend(name=None):
+    """ Encode and decode JSON with given library, or with the fastest
+    installed one if name is None.
+
+    Raises ValueError if the library is not installed. """
+    if name is None:
+        name = next(iter(BACKENDS))
+    try:
+        dumps_function, loads_function = BACKENDS[name]
+    except KeyError:
+        raise ValueError('JSON library {0} is not installed; choose from {1}'
+                         .format(name, ', '.join(BACKENDS)))
+    _current.update(name=name, dumps=dumps_function, loads=loads_function)
+
+
+def backend():
+    """ Name of the JSON library in use. """
+    return _current['name']
+
+
+def dumps(value, sort_keys=False):
+    """ Compact JSON text of a value. """
+    return _current['dumps'](value, sort_keys)
+
+
+def loads(data):
+    """ Value of JSON text, given as text or UTF-8 bytes.
+
+    Raises ValueError if it is not valid JSON. """
+    return _current['loads'](data)
+
+
+def load(f):
+    return loads(f.read())
+
+
+def dump(value, f):
+    f.write(dumps(value))
+
+
+use_backend()
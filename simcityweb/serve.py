@@ -0,0 +1,82 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .latency import parse_latency
+import argparse
+import os
+
+# Servers that an application can be served with: wsgiref handles one
+# connection at a time, gevent handles concurrent keep-alive connections in
+# a single process and prefork runs a gevent server per core.
+SERVERS = ('wsgiref', 'gevent', 'prefork')
+
+# Environment variable with the latency rules of the application
+LATENCY_ENV = 'SIMCITY_LATENCY'
+
+
+def parse_bind(value):
+    """ Parse an address like localhost:9090 into a (host, port) tuple. """
+    host, _, port = value.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def serve(target, server='gevent', host='localhost', port=9090,
+          workers=None):
+    """ Serve a bottle application, given as module name as for
+    bottle.load_app, with one of SERVERS.
+
+    The application is only imported after gevent patched the standard
+    library, so the caller must not have imported it. """
+    if server == 'prefork':
+        from .prefork import Supervisor
+        Supervisor(target, host=host, port=port, workers=workers).run()
+        return
+    if server == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    import bottle
+    bottle.run(app=target, server=server, host=host, port=port)
+
+
+def main(target, argv=None, description=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-s', '--server', choices=SERVERS, default='gevent',
+                        help='server backend (default: gevent)')
+    parser.add_argument('-b', '--bind', default='localhost:9090',
+                        help='address to listen on, host:port')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of prefork workers (default: number '
+                             'of CPUs)')
+    parser.add_argument('--latency', action='append', default=[],
+                        metavar='PATTERN=DELAY[~JITTER]',
+                        help='delay routes matching PATTERN, like '
+                             '"/explore/view/*=0.05~0.02", by DELAY plus or '
+                             'minus JITTER seconds; the first matching '
+                             'rule applies')
+    args = parser.parse_args(argv)
+
+    if args.latency:
+        rules = ';'.join(args.latency)
+        try:
+            parse_latency(rules)
+        except ValueError as ex:
+            parser.error(str(ex))
+        # passed by environment, so that prefork workers see it too
+        os.environ[LATENCY_ENV] = rules
+
+    host, port = parse_bind(args.bind)
+    serve(target, server=args.server, host=host, port=port,
+          workers=args.workers)
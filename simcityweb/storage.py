@@ -0,0 +1,617 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .changes import task_status
+from .conditional import document_rev
+from .pool import with_session
+from .tasks import chunks
+from .taskstore import TaskStore
+from .totals import TASK_CATEGORIES, view_counts, view_members
+from .views import ListViewResults, iter_view
+from . import serialization
+from couchdb.http import ResourceConflict, ResourceNotFound, Session
+from contextlib import contextmanager
+from uuid import uuid4
+import copy
+import functools
+import os
+import sqlite3
+import threading
+
+
+class TaskStorage(object):
+    """ Storage of the task documents that the routes of the webservice
+    read and write.
+
+    Drivers raise the exceptions of tasks.COUCHDB_ERRORS, so that routes
+    report errors the same way whatever the driver. Changes are given like
+    the changes feed of CouchDB with include_docs, as dicts with seq, id and
+    doc, or deleted instead of doc.
+    """
+    def save(self, doc):
+        """ Save a document and set its new _rev. Raises ResourceConflict
+        if its _rev is not the current revision. """
+        raise NotImplementedError
+
+    def get(self, task_id):
+        """ A document. Raises ResourceNotFound if it does not exist. """
+        raise NotImplementedError
+
+    def rev(self, task_id):
+        """ Current revision of a document, or None if it does not exist. """
+        raise NotImplementedError
+
+    def delete(self, task_id, rev):
+        """ Delete a document. Raises ResourceNotFound or ResourceConflict.
+        """
+        raise NotImplementedError
+
+    def update(self, docs):
+        """ Save or delete documents at once, like couchdb.Database.update,
+        so that they can be passed to tasks.bulk_save and bulk_delete. """
+        raise NotImplementedError
+
+    def rows(self, keys):
+        """ Rows of _all_docs with include_docs for given ids. """
+        raise NotImplementedError
+
+    def view(self, name, version, ensemble=None):
+        """ Query function of the tasks of a simulation version, or of one
+        of its ensembles, for views.view_page. """
+        raise NotImplementedError
+
+    def revisions(self, name, version, ensemble=None):
+        """ (id, rev) pairs of the tasks of a simulation version or ensemble.
+        """
+        return ((row['id'], row['value']['rev'])
+                for row in iter_view(self.view(name, version, ensemble)))
+
+    def update_seq(self):
+        raise NotImplementedError
+
+    def changes(self, since):
+        """ Changes after sequence since, waiting for new changes. """
+        raise NotImplementedError
+
+    def category_counts(self):
+        """ Number of tasks per status and the update sequence they were
+        counted at, for totals.CategoryCounter. """
+        raise NotImplementedError
+
+    def category_members(self, status):
+        """ Ids of the tasks with a status. """
+        raise NotImplementedError
+
+    def attachment_url(self, task_id, attachment):
+        """ URL that an attachment of a task can be downloaded from, or None
+        if the storage does not serve attachments. """
+        return None
+
+    def attachment_file(self, task_id, attachment):
+        """ Path of a file on this node with an attachment of a task, or None
+        if the attachment must be downloaded. """
+        return None
+
+    def stats(self):
+        return {}
+
+
+class CouchDBStorage(TaskStorage):
+    """ Tasks in the CouchDB task database of SIM-CITY.
+
+    get_database returns the simcity task database; views is a
+    cache.ViewCache of the ensemble design documents. public_url is the URL
+    of the database that clients download attachments from, if it is not
+    the URL of the database itself.
+    """
+    def __init__(self, get_database, views, public_url=None):
+        self.get_database = get_database
+        self.views = views
+        self.public_url = public_url
+
+    @property
+    def db(self):
+        return self.get_database().db
+
+    def save(self, doc):
+        return self.db.save(doc)
+
+    def get(self, task_id):
+        doc = self.db.get(task_id)
+        if doc is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        return doc
+
+    def rev(self, task_id):
+        return document_rev(self.db, task_id)
+
+    def delete(self, task_id, rev):
+        self.db.delete({'_id': task_id, '_rev': rev})
+
+    def update(self, docs):
+        return self.db.update(docs)
+
+    def rows(self, keys):
+        return self.db.view('_all_docs', keys=keys, include_docs=True).rows
+
+    def view(self, name, version, ensemble=None):
+        database = self.get_database()
+        design_doc = self.views.get(database, name, version, ensemble=ensemble)
+
+        def query(**params):
+            try:
+                return database.view('all_docs', design_doc=design_doc,
+                                     **params)
+            except ResourceNotFound:
+                # the design document was removed after it was cached
+                self.views.invalidate(name, version, ensemble)
+                return database.view(
+                    'all_docs', design_doc=self.views.get(
+                        database, name, version, ensemble=ensemble),
+                    **params)
+        return query
+
+    def update_seq(self):
+        return self.db.info()['update_seq']
+
+    def changes(self, since):
+        # continuous feeds stay open, so they do not use pooled connections
+        return with_session(self.db, Session()).changes(
+            feed='continuous', include_docs=True, heartbeat=30000,
+            since=since)
+
+    def category_counts(self):
+        return view_counts(self.get_database(), TASK_CATEGORIES)
+
+    def category_members(self, status):
+        return view_members(self.get_database(), status)
+
+    def attachment_url(self, task_id, attachment):
+        url = self.public_url or self.get_database().url
+        return '{0}/{1}/{2}'.format(url.rstrip('/'), task_id, attachment)
+
+
+class LocalStorage(TaskStorage):
+    """ Tasks in an SQLite database, for running the webservice on a single
+    node without CouchDB.
+
+    Documents are stored as JSON, with their simulation name, version,
+    ensemble and status in indexed columns, so that views are range scans
+    and totals are counted by the database. Every change gets the next
+    sequence number, allocated in the transaction that writes it, so that
+    several processes may share a database file; deleted documents are kept
+    without their contents, so that the changes feed reports them.
+    Revisions look like those of CouchDB. The storage may be used from
+    several threads. The changes feed looks for changes of other processes
+    every heartbeat seconds.
+    """
+    def __init__(self, path=':memory:', heartbeat=1.0):
+        self.path = path
+        self.heartbeat = heartbeat
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        # transactions are started explicitly by _transaction
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        with self._lock:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    rev TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    name TEXT,
+                    version TEXT,
+                    ensemble TEXT,
+                    status TEXT,
+                    doc TEXT);
+                CREATE UNIQUE INDEX IF NOT EXISTS tasks_seq ON tasks (seq);
+                CREATE INDEX IF NOT EXISTS tasks_version
+                    ON tasks (name, version, deleted, id);
+                CREATE INDEX IF NOT EXISTS tasks_ensemble
+                    ON tasks (name, version, ensemble, deleted, id);
+                CREATE INDEX IF NOT EXISTS tasks_status
+                    ON tasks (deleted, status);
+            ''')
+
+    @contextmanager
+    def _transaction(self, write=True):
+        """ Transaction on the database. A write transaction holds the write
+        lock of the database file from the start, so that the revisions it
+        checks and the sequence numbers it allocates are not changed by
+        other processes; a read transaction sees one state of the
+        database. """
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def _current_seq(self):
+        return self._db.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM tasks').fetchone()[0]
+
+    def save(self, doc):
+        with self._transaction():
+            doc_id, rev = self._save(doc)
+        self._notify()
+        return doc_id, rev
+
+    def _save(self, doc):
+        doc_id = doc.setdefault('_id', uuid4().hex)
+        current = self._current_rev(doc_id)
+        if doc.get('_rev') != current:
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        doc['_rev'] = next_rev(current)
+        if doc.get('type', 'task') == 'task':
+            status = task_status(doc)
+        else:
+            status = None
+        self._db.execute(
+            'INSERT OR REPLACE INTO tasks (id, rev, seq, deleted, name, '
+            'version, ensemble, status, doc) VALUES (?, ?, ?, 0, ?, ?, ?, '
+            '?, ?)', (doc_id, doc['_rev'], self._current_seq() + 1,
+                      doc.get('name'),
+                      doc.get('version'), doc.get('ensemble'), status,
+                      serialization.dumps(doc)))
+        return doc_id, doc['_rev']
+
+    def get(self, task_id):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT doc FROM tasks WHERE id = ? AND deleted = 0',
+                (task_id,)).fetchone()
+        if row is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        return serialization.loads(row[0])
+
+    def rev(self, task_id):
+        with self._lock:
+            return self._current_rev(task_id)
+
+    def _current_rev(self, task_id):
+        row = self._db.execute(
+            'SELECT rev FROM tasks WHERE id = ? AND deleted = 0',
+            (task_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def delete(self, task_id, rev):
+        with self._transaction():
+            self._delete(task_id, rev)
+        self._notify()
+
+    def _delete(self, task_id, rev):
+        current = self._current_rev(task_id)
+        if current is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        if rev != current:
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        rev = next_rev(current)
+        self._db.execute(
+            'UPDATE tasks SET rev = ?, seq = ?, deleted = 1, status = NULL, '
+            'doc = NULL WHERE id = ?', (rev, self._current_seq() + 1, task_id))
+        return rev
+
+    def update(self, docs):
+        results = []
+        with self._transaction():
+            for doc in docs:
+                doc_id = doc.get('_id')
+                try:
+                    if doc.get('_deleted'):
+                        rev = self._delete(doc_id, doc.get('_rev'))
+                    else:
+                        doc_id, rev = self._save(doc)
+                    results.append((True, doc_id, rev))
+                except (ResourceConflict, ResourceNotFound) as ex:
+                    results.append((False, doc_id, ex))
+        self._notify()
+        return results
+
+    def rows(self, keys):
+        found = {}
+        with self._lock:
+            for chunk in chunks(keys, 500):
+                found.update(
+                    (row[0], row[1:]) for row in self._db.execute(
+                        'SELECT id, rev, deleted, doc FROM tasks WHERE id IN '
+                        '({0})'.format(','.join('?' * len(chunk))), chunk))
+        rows = []
+        for key in keys:
+            if key not in found:
+                rows.append({'key': key, 'error': 'not_found'})
+                continue
+            rev, deleted, doc = found[key]
+            if deleted:
+                rows.append({'id': key, 'key': key, 'doc': None,
+                             'value': {'rev': rev, 'deleted': True}})
+            else:
+                rows.append({'id': key, 'key': key, 'value': {'rev': rev},
+                             'doc': serialization.loads(doc)})
+        return rows
+
+    def view(self, name, version, ensemble=None):
+        return functools.partial(self._view, name, version, ensemble)
+
+    def _view(self, name, version, ensemble, limit=None, startkey=None,
+              startkey_docid=None, update_seq=False):
+        """ Rows of the tasks of a view, keyed and sorted by id, like
+        taskstore.SortedView. """
+        where, params = 'name = ? AND version = ? AND deleted = 0', [
+            name, version]
+        if ensemble is not None:
+            where += ' AND ensemble = ?'
+            params.append(ensemble)
+
+        with self._transaction(write=False):
+            seq = self._current_seq() if update_seq else None
+            total = self._db.execute(
+                'SELECT COUNT(*) FROM tasks WHERE ' + where,
+                params).fetchone()[0]
+            offset = 0
+            if startkey is not None:
+                # the key is the id, so a later docid skips the startkey row
+                after = (startkey_docid is not None and
+                         startkey_docid > startkey)
+                offset = self._db.execute(
+                    'SELECT COUNT(*) FROM tasks WHERE {0} AND id {1} ?'
+                    .format(where, '<=' if after else '<'),
+                    params + [startkey]).fetchone()[0]
+                where += ' AND id {0} ?'.format('>' if after else '>=')
+                params.append(startkey)
+            cursor = self._db.execute(
+                'SELECT id, doc FROM tasks WHERE {0} ORDER BY id LIMIT ?'
+                .format(where), params + [-1 if limit is None else limit])
+            rows = [{'id': task_id, 'key': task_id,
+                     'value': serialization.loads(doc)}
+                    for task_id, doc in cursor]
+        return ListViewResults(rows, total, offset, seq)
+
+    def revisions(self, name, version, ensemble=None):
+        where, params = 'name = ? AND version = ? AND deleted = 0', [
+            name, version]
+        if ensemble is not None:
+            where += ' AND ensemble = ?'
+            params.append(ensemble)
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, rev FROM tasks WHERE {0} ORDER BY id'
+                .format(where), params).fetchall()
+
+    def counts(self):
+        """ Number of tasks per status. """
+        counts = dict((status, 0) for status in TASK_CATEGORIES)
+        with self._lock:
+            counts.update(self._db.execute(
+                'SELECT status, COUNT(*) FROM tasks WHERE deleted = 0 AND '
+                'status IS NOT NULL GROUP BY status'))
+        return counts
+
+    def category_counts(self):
+        with self._transaction(write=False):
+            return self.counts(), self._current_seq()
+
+    def category_members(self, status):
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                'SELECT id FROM tasks WHERE deleted = 0 AND status = ?',
+                (status,))]
+
+    def update_seq(self):
+        with self._lock:
+            return self._current_seq()
+
+    def changes(self, since):
+        """ Changes after sequence since, or after the current sequence if
+        since is 'now'. Waits for new changes; yields {'last_seq': seq}
+        every heartbeat seconds without changes, so that the feed can be
+        resumed by ChangesFollower. """
+        if since == 'now':
+            since = self.update_seq()
+        while True:
+            result = self.snapshot(since)
+            for change in result['results']:
+                yield change
+            since = result['last_seq']
+            with self._changed:
+                if self._current_seq() == since:
+                    self._changed.wait(self.heartbeat)
+                if self._current_seq() == since:
+                    yield {'last_seq': since}
+
+    def snapshot(self, since):
+        """ Changes after sequence since, as {'results': changes,
+        'last_seq': seq}. """
+        if since == 'now':
+            since = self.update_seq()
+        with self._transaction(write=False):
+            cursor = self._db.execute(
+                'SELECT id, rev, seq, deleted, doc FROM tasks WHERE seq > ? '
+                'ORDER BY seq', (since or 0,))
+            results = []
+            for task_id, rev, seq, deleted, doc in cursor:
+                change = {'seq': seq, 'id': task_id,
+                          'changes': [{'rev': rev}]}
+                if deleted:
+                    change['deleted'] = True
+                else:
+                    change['doc'] = serialization.loads(doc)
+                results.append(change)
+            last_seq = self._current_seq()
+        return {'results': results, 'last_seq': max(last_seq, since or 0)}
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._transaction(write=False):
+            tasks = self._db.execute(
+                'SELECT COUNT(*) FROM tasks WHERE deleted = 0').fetchone()[0]
+            seq = self._current_seq()
+        return {'path': self.path, 'tasks': tasks, 'update_seq': seq}
+
+
+class MockStorage(TaskStorage):
+    """ Tasks of the mock webservice in a taskstore.TaskStore in memory.
+
+    The attachments of every task are the files in the results directory.
+    A synthetic.StatusSimulator of the store, if any, changes the tasks
+    over time; its changes are in the changes feed like all others.
+    Deleted tasks are forgotten, except by the changes feed.
+    """
+    def __init__(self, store=None, results=None, simulator=None,
+                 heartbeat=1.0):
+        self.store = TaskStore() if store is None else store
+        self.results = results
+        self.simulator = simulator
+        self.heartbeat = heartbeat
+
+    def save(self, doc):
+        with self.store.changed:
+            return self._save(doc)
+
+    def _save(self, doc):
+        doc_id = doc.setdefault('_id', uuid4().hex)
+        current = self.rev(doc_id)
+        if doc.get('_rev') != current:
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        doc['_rev'] = next_rev(current)
+        # rows of the store are not changed in place
+        self.store.put({'id': doc_id, 'key': doc_id,
+                        'value': copy.deepcopy(doc)})
+        return doc_id, doc['_rev']
+
+    def get(self, task_id):
+        row = self.store.get(task_id)
+        if row is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        return copy.deepcopy(row['value'])
+
+    def rev(self, task_id):
+        row = self.store.get(task_id)
+        return None if row is None else row['value']['_rev']
+
+    def delete(self, task_id, rev):
+        with self.store.changed:
+            self._delete(task_id, rev)
+
+    def _delete(self, task_id, rev):
+        current = self.rev(task_id)
+        if current is None:
+            raise ResourceNotFound(('not_found', 'missing'))
+        if rev != current:
+            raise ResourceConflict(('conflict', 'Document update conflict.'))
+        self.store.delete(task_id)
+        return next_rev(current)
+
+    def update(self, docs):
+        results = []
+        with self.store.changed:
+            for doc in docs:
+                doc_id = doc.get('_id')
+                try:
+                    if doc.get('_deleted'):
+                        rev = self._delete(doc_id, doc.get('_rev'))
+                    else:
+                        doc_id, rev = self._save(doc)
+                    results.append((True, doc_id, rev))
+                except (ResourceConflict, ResourceNotFound) as ex:
+                    results.append((False, doc_id, ex))
+        return results
+
+    def rows(self, keys):
+        rows = []
+        for key in keys:
+            row = self.store.get(key)
+            if row is None:
+                rows.append({'key': key, 'error': 'not_found'})
+            else:
+                rows.append({'id': key, 'key': key,
+                             'value': {'rev': row['value']['_rev']},
+                             'doc': row['value']})
+        return rows
+
+    def view(self, name, version, ensemble=None):
+        return functools.partial(self._view, name, version, ensemble)
+
+    def _view(self, name, version, ensemble, limit=None, startkey=None,
+              startkey_docid=None, update_seq=False):
+        with self.store.changed:
+            result = self.store.view(name, version, ensemble)(
+                limit=limit, startkey=startkey,
+                startkey_docid=startkey_docid)
+            if update_seq:
+                result.update_seq = self.store.update_seq
+            return result
+
+    def revisions(self, name, version, ensemble=None):
+        with self.store.changed:
+            return [(task_id, self.store[task_id]['value']['_rev'])
+                    for task_id in self.store.ids(name, version, ensemble)]
+
+    def update_seq(self):
+        return self.store.update_seq
+
+    def changes(self, since):
+        """ Changes after sequence since, or after the current sequence if
+        since is 'now', like LocalStorage.changes. """
+        if since == 'now':
+            since = self.store.update_seq
+        while True:
+            with self.store.changed:
+                if self.store.update_seq == since:
+                    self.store.changed.wait(self.heartbeat)
+                changes = self.store.changes(since)
+            if not changes:
+                yield {'last_seq': since}
+            for seq, task_id, row in changes:
+                if row is None:
+                    yield {'seq': seq, 'id': task_id, 'deleted': True}
+                else:
+                    yield {'seq': seq, 'id': task_id,
+                           'changes': [{'rev': row['value']['_rev']}],
+                           'doc': row['value']}
+                since = seq
+
+    def category_counts(self):
+        with self.store.changed:
+            return self.store.counts(), self.store.update_seq
+
+    def category_members(self, status):
+        return self.store.with_status(status)
+
+    def attachment_file(self, task_id, attachment):
+        if self.results is None:
+            return None
+        path = os.path.join(self.results, attachment)
+        return path if os.path.isfile(path) else None
+
+    def stats(self):
+        stats = {'tasks': len(self.store),
+                 'update_seq': self.store.update_seq}
+        if self.simulator is not None:
+            stats['transitions'] = self.simulator.stats()
+        return stats
+
+
+def next_rev(rev):
+    """ Revision following rev, or the first revision if rev is None. """
+    number = 0 if rev is None else int(rev.split('-', 1)[0])
+    return '{0}-{1}'.format(number + 1, uuid4().hex)
@@ -0,0 +1,134 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class HostState(object):
+    """ Submission history of a single host. """
+    def __init__(self):
+        self.pending = 0
+        self.requests = 0
+        self.checks = 0
+        self.failures = 0
+        self.last_check = None
+        self.last_outcome = None
+        self.next_check = 0
+
+    def to_dict(self):
+        return {
+            'pending': self.pending,
+            'requests': self.requests,
+            'checks': self.checks,
+            'failures': self.failures,
+            'last_check': self.last_check,
+            'last_outcome': self.last_outcome,
+            'next_check': self.next_check,
+        }
+
+
+class SubmissionScheduler(object):
+    """ Checks in the background whether jobs need to be submitted.
+
+    Request handlers call request(host) instead of submitting a job
+    themselves. All requests for a host are coalesced into at most one call
+    of submit(host) per interval seconds. If submit raises an error, the
+    host is retried with exponential backoff, up to max_backoff seconds.
+    """
+    def __init__(self, submit, interval=5.0, max_backoff=300.0):
+        self.submit = submit
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.hosts = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def request(self, host):
+        """ Request a submission check for host; returns immediately. """
+        state = self._host(host)
+        state.pending += 1
+        state.requests += 1
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """ Start the background thread, if it is not running. """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run,
+                                                name='submission-scheduler')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            self._wakeup.wait(self.process())
+
+    def process(self, now=None):
+        """ Check the hosts with pending requests whose interval and backoff
+        have passed.
+
+        Returns the number of seconds until the next check is due, or None if
+        there are no pending requests. """
+        if now is None:
+            now = time.time()
+
+        timeout = None
+        for host, state in list(self.hosts.items()):
+            if state.pending == 0:
+                continue
+            if state.next_check > now:
+                wait = state.next_check - now
+                timeout = wait if timeout is None else min(timeout, wait)
+                continue
+
+            state.pending = 0
+            state.checks += 1
+            state.last_check = now
+            try:
+                job = self.submit(host)
+            except Exception as ex:
+                state.pending += 1  # retry
+                state.failures += 1
+                state.last_outcome = 'error: {0}'.format(ex)
+                state.next_check = now + min(
+                    self.interval * 2 ** state.failures, self.max_backoff)
+                wait = state.next_check - now
+                timeout = wait if timeout is None else min(timeout, wait)
+            else:
+                state.failures = 0
+                state.last_outcome = ('submitted' if job is not None
+                                      else 'not needed')
+                state.next_check = now + self.interval
+
+        return timeout
+
+    def stats(self):
+        return {
+            'queue_depth': sum(state.pending
+                               for state in self.hosts.values()),
+            'hosts': dict((host, state.to_dict())
+                          for host, state in self.hosts.items()),
+        }
+
+    def _host(self, host):
+        try:
+            return self.hosts[host]
+        except KeyError:
+            return self.hosts.setdefault(host, HostState())
@@ -0,0 +1,188 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .storage import next_rev
+from .totals import TASK_CATEGORIES
+import copy
+import random
+import threading
+import time
+
+# Fraction of generated tasks per status
+DEFAULT_DISTRIBUTION = {'pending': 0.5, 'in_progress': 0.1, 'done': 0.35,
+                        'error': 0.05}
+
+
+def parse_distribution(value):
+    """ Parse a status distribution like pending=0.5,done=0.5. Weights are
+    normalized to sum to one.
+
+    Raises ValueError for unknown statuses or negative weights. """
+    weights = {}
+    for item in value.split(','):
+        status, _, weight = item.partition('=')
+        status = status.strip()
+        if status not in TASK_CATEGORIES:
+            raise ValueError('unknown status {0}; choose from {1}'.format(
+                status, ', '.join(TASK_CATEGORIES)))
+        weights[status] = float(weight)
+        if weights[status] < 0:
+            raise ValueError('weight of {0} is negative'.format(status))
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError('status distribution is empty')
+    return dict((status, w / total) for status, w in weights.items())
+
+
+def parse_simulations(value):
+    """ Parse simulation versions like matsim:0.5,matsim:0.4 into a list
+    of (name, version) pairs. """
+    simulations = []
+    for item in value.split(','):
+        name, _, version = item.strip().partition(':')
+        if not name or not version:
+            raise ValueError('simulation {0} is not of the form name:version'
+                             .format(item))
+        simulations.append((name, version))
+    return simulations
+
+
+class TaskGenerator(object):
+    """ Synthetic tasks shaped like example task documents.
+
+    Each task is a copy of a random example, assigned to one of the given
+    (name, version) pairs, to one of a number of ensembles and to a status
+    drawn from distribution. Without simulations, those of the examples are
+    used. Finished tasks get the uploads of the first finished example.
+    """
+    def __init__(self, examples, simulations=None, ensembles=10,
+                 distribution=None, seed=None):
+        if not examples:
+            raise ValueError('no example tasks to generate tasks from')
+        self.examples = list(examples)
+        self.simulations = simulations or sorted(set(
+            (doc['name'], doc['version']) for doc in self.examples))
+        self.ensembles = ensembles
+        self.statuses = sorted((distribution or DEFAULT_DISTRIBUTION).items())
+        self.random = random.Random(seed)
+        self.uploads = next((doc['uploads'] for doc in self.examples
+                             if doc.get('uploads')), {})
+
+    def tasks(self, count, prefix='synthetic_'):
+        """ Rows of count new tasks, like the rows of a view. """
+        now = time.time()
+        for i in range(count):
+            yield self.task('{0}{1:07d}'.format(prefix, i), now)
+
+    def task(self, task_id, now=None):
+        doc = copy.deepcopy(self.random.choice(self.examples))
+        name, version = self.random.choice(self.simulations)
+        ensemble = 'ensemble_{0}'.format(self.random.randrange(self.ensembles))
+        doc.pop('status', None)
+        doc.update(_id=task_id, _rev=next_rev(None), name=name,
+                   version=version, ensemble=ensemble)
+        if isinstance(doc.get('input'), dict):
+            doc['input']['ensemble'] = ensemble
+        doc['lock'] = 0
+        self.set_status(doc, self.status(), now, spread=3600)
+        return {'id': task_id, 'key': task_id, 'value': doc}
+
+    def status(self):
+        """ A random status from the distribution. """
+        x = self.random.random()
+        for status, weight in self.statuses:
+            x -= weight
+            if x < 0:
+                return status
+        return self.statuses[-1][0]
+
+    def set_status(self, doc, status, now=None, spread=0):
+        """ Set the lock, done, error and uploads fields of a document to
+        match a status, as a job would at a random time in the spread
+        seconds before now. A finished task keeps the time it was locked.
+        Nested values are replaced, not changed, so that a shallow copy of
+        a document can be passed. """
+        now = int(now or time.time()) - self.random.randint(0, spread)
+        lock = doc.get('lock', 0)
+        doc['lock'], doc['done'] = 0, 0
+        doc['error'], doc['uploads'] = [], {}
+        if status == 'in_progress':
+            doc['lock'] = now
+        elif status == 'done':
+            doc['done'] = now
+            doc['lock'] = lock if lock > 0 else now - self.random.randint(
+                1, 600)
+            doc['uploads'] = dict(
+                (name, '/explore/simulation/{0}/{1}'.format(
+                    doc['_id'], url.rsplit('/', 1)[-1]))
+                for name, url in self.uploads.items())
+        elif status == 'error':
+            doc['lock'], doc['done'] = -1, -1
+            doc['error'] = [{'time': now, 'message': 'synthetic error',
+                             'exception': 'SimulationError'}]
+
+
+class StatusSimulator(object):
+    """ Moves tasks of a TaskStore through their statuses in a background
+    thread, as jobs would.
+
+    Every interval seconds, rate * interval pending tasks are locked and as
+    many tasks in progress finish, error_rate of them with an error.
+    """
+    def __init__(self, store, generator, rate=10.0, error_rate=0.05,
+                 interval=1.0):
+        self.store = store
+        self.generator = generator
+        self.rate = rate
+        self.error_rate = error_rate
+        self.interval = interval
+        self.transitions = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.rate > 0:
+            self._thread = threading.Thread(target=self.run,
+                                            name=type(self).__name__)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def run(self):
+        while True:
+            self.step(max(1, int(round(self.rate * self.interval))))
+            time.sleep(self.interval)
+
+    def step(self, count):
+        """ Finish count tasks in progress and lock count pending tasks. """
+        for task_id in self.store.with_status('in_progress', count):
+            if self.generator.random.random() < self.error_rate:
+                self.advance(task_id, 'error')
+            else:
+                self.advance(task_id, 'done')
+        for task_id in self.store.with_status('pending', count):
+            self.advance(task_id, 'in_progress')
+
+    def advance(self, task_id, status):
+        def change(row):
+            doc = dict(row['value'])
+            self.generator.set_status(doc, status)
+            doc['_rev'] = next_rev(doc.get('_rev'))
+            return {'id': task_id, 'key': task_id, 'value': doc}
+
+        if self.store.update(task_id, change) is not None:
+            self.transitions += 1
+
+    def stats(self):
+        return {'rate': self.rate, 'transitions': self.transitions}
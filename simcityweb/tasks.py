@@ -0,0 +1,273 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .util import ParameterSweep, project
+from couchdb.http import (ResourceConflict, Unauthorized, ResourceNotFound,
+                          PreconditionFailed, ServerError)
+import itertools
+import six
+
+# Number of documents saved per _bulk_docs request
+BULK_CHUNK_SIZE = 500
+
+# Errors of CouchDB requests, with the status and message for the client
+COUCHDB_ERRORS = (
+    (Unauthorized, 401, "unauthorized"),
+    (ResourceNotFound, 404, "document not found"),
+    (ResourceConflict, 409, "resource conflict"),
+    (PreconditionFailed, 412, "precondition failed"),
+    (ServerError, 502, "CouchDB connection failed"),
+)
+COUCHDB_EXCEPTIONS = tuple(cls for cls, _, _ in COUCHDB_ERRORS)
+
+
+def couchdb_error(ex):
+    """ HTTP status and message of a CouchDB error, or None if it is not
+    one of COUCHDB_EXCEPTIONS. """
+    for cls, status, message in COUCHDB_ERRORS:
+        if isinstance(ex, cls):
+            return status, message
+    return None
+
+
+def task_properties(name, version, description, parameters,
+                    task_id=None):
+    """ Properties of a new task for a simulation description. """
+    props = {
+        'name': name,
+        'command': description['command'],
+        'arguments': list(description.get('arguments', [])),
+        'parallelism': description.get('parallelism', '*'),
+        'version': version,
+        'input': parameters,
+    }
+    if 'ensemble' in parameters:
+        props['ensemble'] = parameters['ensemble']
+    if 'simulation' in parameters:
+        props['simulation'] = parameters['simulation']
+    if 'defaultFeatureType' in description:
+        props['defaultFeatureType'] = description['defaultFeatureType']
+    if 'resourceTypeUrl' in description:
+        props['typeUrl'] = description['resourceTypeUrl']
+    if task_id is not None:
+        props['_id'] = task_id
+
+    return props
+
+
+def split_parameters(parameters):
+    """ Copy of the parameters without _id, and the _id. """
+    if not isinstance(parameters, dict):
+        raise ValueError('parameters must be a json object')
+    parameters = dict(parameters)
+    return parameters, parameters.pop('_id', None)
+
+
+class BulkSubmission(object):
+    """ Parameter sets of a bulk submission.
+
+    The submission is either a list of parameter sets or an object with a
+    'sweep' parameter set as produced by ParameterSweep.transform. Parameter
+    sets are generated lazily each time they are iterated over, so a large
+    sweep is never held in memory.
+    """
+    def __init__(self, body, description, limit=None):
+        self.description = description
+        if isinstance(body, dict) and isinstance(body.get('sweep'), dict):
+            self.sweep = body['sweep']
+            self.items = None
+            self.count = ParameterSweep().count(description, self.sweep)
+        elif isinstance(body, list):
+            self.sweep = None
+            self.items = body
+            self.count = len(body)
+        else:
+            raise ValueError('request must contain a json array of '
+                             'parameters or a sweep object')
+
+        if limit is not None:
+            self.count = min(self.count, limit)
+
+    def __iter__(self):
+        if self.sweep is not None:
+            parameter_sets = ParameterSweep().expand(self.description,
+                                                     self.sweep)
+        else:
+            parameter_sets = iter(self.items)
+        return itertools.islice(parameter_sets, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def validate(self, validate, max_errors=100):
+        """ Validate all parameter sets without keeping them.
+
+        Returns a list of errors with the index of the parameter set. """
+        errors = []
+        for i, parameters in enumerate(self):
+            try:
+                validate(split_parameters(parameters)[0])
+            except ValueError as ex:
+                errors.append({'index': i, 'error': str(ex)})
+                if len(errors) >= max_errors:
+                    break
+        return errors
+
+    def tasks(self, name, version, fill_defaults):
+        """ Generate the properties of the tasks to create.
+
+        The parameter sets must be validated already; fill_defaults only sets
+        their missing parameters to the default values. """
+        for parameters in self:
+            query, task_id = split_parameters(parameters)
+            fill_defaults(query)
+            yield task_properties(name, version, self.description, query,
+                                  task_id=task_id)
+
+
+def chunks(iterable, size=BULK_CHUNK_SIZE):
+    """ Split an iterable into lists of at most size items. """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_save(database, docs, result=None):
+    """ Save documents with a single _bulk_docs request.
+
+    Parameters:
+    database: couchdb.Database
+    docs: list of document dicts
+    result: function making the result of a document from the ok, id and
+        rev or exception that couchdb.Database.update returns; bulk_result
+        by default
+
+    Returns a result per document, either {'id': id, 'rev': rev} or
+    {'id': id, 'error': message}. """
+    if not docs:
+        return []
+    if result is None:
+        result = bulk_result
+
+    return [result(ok, doc_id, rev_or_exc)
+            for ok, doc_id, rev_or_exc in database.update(docs)]
+
+
+def bulk_result(ok, doc_id, rev_or_exc):
+    if ok:
+        return {'id': doc_id, 'rev': rev_or_exc}
+    elif isinstance(rev_or_exc, ResourceConflict):
+        return {'id': doc_id, 'error': 'simulation name {0} already taken'
+                                       .format(doc_id)}
+    else:
+        return {'id': doc_id, 'error': str(rev_or_exc)}
+
+
+def parse_bulk_get(body, max_size=None):
+    """ Ids and fields of a bulk get request, {"ids": [...], "fields":
+    [...]}. fields is None if not given.
+
+    Raises ValueError if the request is invalid. """
+    if not isinstance(body, dict) or not isinstance(body.get('ids'), list):
+        raise ValueError('request must contain a list of ids')
+    ids = body['ids']
+    fields = body.get('fields')
+    if not all(isinstance(i, six.string_types) for i in ids):
+        raise ValueError('ids must be strings')
+    if max_size is not None and len(ids) > max_size:
+        raise ValueError('at most {0} ids can be requested at once'
+                         .format(max_size))
+    if fields is not None and (
+            not isinstance(fields, list) or
+            not all(isinstance(f, six.string_types) for f in fields)):
+        raise ValueError('fields must be a list of strings')
+    return ids, fields
+
+
+def bulk_get(query, ids, fields=None, chunk_size=BULK_CHUNK_SIZE):
+    """ Get documents with one _all_docs request per chunk of ids.
+
+    query(keys) must return the rows of _all_docs with include_docs for
+    given keys. Yields, in order of ids, {'id': id, 'doc': doc} or
+    {'id': id, 'error': 'not_found' or 'deleted'}. If fields is given,
+    only those fields of the documents are returned. """
+    for chunk in chunks(ids, chunk_size):
+        for row in query(chunk):
+            doc = row.get('doc')
+            if doc is not None:
+                if fields is not None:
+                    doc = project(doc, fields)
+                yield {'id': row['key'], 'doc': doc}
+            elif row.get('value', {}).get('deleted'):
+                yield {'id': row['key'], 'error': 'deleted'}
+            else:
+                yield {'id': row['key'],
+                       'error': row.get('error', 'not_found')}
+
+
+def parse_bulk_delete(body, max_size=None):
+    """ Documents or ensemble to delete in a bulk delete request.
+
+    The request is either {"docs": [{"id": id, "rev": rev}, ...]} or
+    {"name": name, "version": version, "ensemble": ensemble}. Returns a list
+    of (id, rev) pairs and None, or None and a (name, version, ensemble)
+    tuple. Raises ValueError if the request is invalid. """
+    if not isinstance(body, dict):
+        raise ValueError('request must contain a json object')
+
+    if 'docs' in body:
+        docs = body['docs']
+        if not isinstance(docs, list) or not all(
+                isinstance(doc, dict) and
+                isinstance(doc.get('id'), six.string_types) and
+                isinstance(doc.get('rev'), six.string_types)
+                for doc in docs):
+            raise ValueError('docs must be a list of objects with id and rev')
+        if max_size is not None and len(docs) > max_size:
+            raise ValueError('at most {0} simulations can be deleted at once'
+                             .format(max_size))
+        return [(doc['id'], doc['rev']) for doc in docs], None
+
+    selector = tuple(body.get(key) for key in ('name', 'version', 'ensemble'))
+    if not all(isinstance(value, six.string_types) for value in selector):
+        raise ValueError('request must contain docs, or a name, version '
+                         'and ensemble')
+    return None, selector
+
+
+def delete_result(ok, doc_id, rev_or_exc):
+    if ok:
+        return {'id': doc_id, 'ok': True, 'rev': rev_or_exc}
+    status = couchdb_error(rev_or_exc)
+    if status is None:
+        return {'id': doc_id, 'error': str(rev_or_exc)}
+    return {'id': doc_id, 'status': status[0], 'error': status[1]}
+
+
+def bulk_delete(database, docs, chunk_size=BULK_CHUNK_SIZE):
+    """ Delete documents with one _bulk_docs request per chunk.
+
+    docs is an iterable of (id, rev) pairs; yields the result of each
+    deletion, {'id': id, 'ok': True, 'rev': rev} or {'id': id, 'status':
+    status, 'error': message}. """
+    for chunk in chunks(docs, chunk_size):
+        deletions = [{'_id': doc_id, '_rev': rev, '_deleted': True}
+                     for doc_id, rev in chunk]
+        for result in bulk_save(database, deletions, result=delete_result):
+            yield result
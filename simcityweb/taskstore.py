@@ -0,0 +1,175 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .changes import task_status
+from .totals import TASK_CATEGORIES
+from .views import ListViewResults
+from collections import OrderedDict
+import bisect
+import itertools
+import threading
+
+
+class SortedView(object):
+    """ A CouchDB view over tasks keyed by their id, given as a sorted list
+    of ids, so that a page is found without sorting or scanning the rows.
+    Supports the limit, startkey and startkey_docid parameters. """
+    def __init__(self, rows, ids, lock):
+        self.rows = rows
+        self.ids = ids
+        self.lock = lock
+
+    def __call__(self, limit=None, startkey=None, startkey_docid=None):
+        with self.lock:
+            return self._query(limit, startkey, startkey_docid)
+
+    def _query(self, limit, startkey, startkey_docid):
+        ids = self.ids
+        offset = 0
+        if startkey is not None:
+            offset = bisect.bisect_left(ids, startkey)
+            # the key is the id, so a later docid skips the startkey row
+            if (offset < len(ids) and ids[offset] == startkey and
+                    startkey_docid is not None and startkey_docid > startkey):
+                offset += 1
+        end = len(ids) if limit is None else offset + limit
+        rows = [self.rows[task_id] for task_id in ids[offset:end]]
+        return ListViewResults(rows, len(ids), offset)
+
+
+class TaskStore(object):
+    """ In-memory task database of the mock webservice.
+
+    Tasks are stored as view rows {'id': id, 'key': id, 'value': doc}. They
+    are indexed by name and version, by name, version and ensemble, and by
+    status, so that views and totals do not scan all tasks. Rows must not
+    be changed in place; store a changed copy with put instead, so that the
+    indexes are updated. The update sequence increases with every change,
+    and the last change of every task is kept for the changes feed. The
+    store may be changed from several threads; the changed condition is
+    notified after every change.
+    """
+    def __init__(self):
+        self.update_seq = 0
+        self._rows = {}
+        self._ensembles = {}
+        self._statuses = dict((status, set()) for status in TASK_CATEGORIES)
+        self._lock = threading.RLock()
+        self.changed = threading.Condition(self._lock)
+        # sequence number of the last change of each task, in order
+        self._changes = OrderedDict()
+
+    def __contains__(self, task_id):
+        return task_id in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, task_id):
+        return self._rows[task_id]
+
+    def get(self, task_id, default=None):
+        return self._rows.get(task_id, default)
+
+    def put(self, row):
+        """ Add a task row or replace the task with the same id. """
+        task_id = row['id']
+        with self._lock:
+            if task_id in self._rows:
+                self._unindex(self._rows[task_id])
+            self._rows[task_id] = row
+            for key in self._keys(row['value']):
+                bisect.insort(self._ensembles.setdefault(key, []), task_id)
+            self._statuses[task_status(row['value'])].add(task_id)
+            self._changed(task_id)
+
+    def update(self, task_id, change):
+        """ Replace a task by change(row), a changed copy of its row, at
+        once. Returns the new row, or None if the task does not exist. """
+        with self._lock:
+            row = self._rows.get(task_id)
+            if row is None:
+                return None
+            row = change(row)
+            self.put(row)
+            return row
+
+    def delete(self, task_id):
+        """ Remove a task and return its row. Raises KeyError if it does not
+        exist. """
+        with self._lock:
+            row = self._rows.pop(task_id)
+            self._unindex(row)
+            self._changed(task_id)
+            return row
+
+    def changes(self, since):
+        """ (seq, id, row) of the last change of each task that changed
+        after update sequence since, in order of seq. The row of a deleted
+        task is None. """
+        with self._lock:
+            changes = []
+            for task_id in reversed(self._changes):
+                seq = self._changes[task_id]
+                if seq <= since:
+                    break
+                changes.append((seq, task_id, self._rows.get(task_id)))
+        changes.reverse()
+        return changes
+
+    def view(self, name, version, ensemble=None):
+        """ The tasks of a simulation version, or of one of its ensembles,
+        as a view. """
+        with self._lock:
+            ids = self._ensembles.get((name, version, ensemble), [])
+        return SortedView(self._rows, ids, self._lock)
+
+    def ids(self, name, version, ensemble=None):
+        """ Ids of the tasks of a simulation version or ensemble, sorted. """
+        with self._lock:
+            return list(self._ensembles.get((name, version, ensemble), ()))
+
+    def with_status(self, status, limit=None):
+        """ Ids of at most limit tasks with given status, in no particular
+        order. """
+        with self._lock:
+            return list(itertools.islice(self._statuses[status], limit))
+
+    def counts(self):
+        """ Number of tasks per status. """
+        with self._lock:
+            return dict((status, len(ids))
+                        for status, ids in self._statuses.items())
+
+    def _changed(self, task_id):
+        self.update_seq += 1
+        self._changes.pop(task_id, None)
+        self._changes[task_id] = self.update_seq
+        self.changed.notify_all()
+
+    def _keys(self, doc):
+        name, version = doc.get('name'), doc.get('version')
+        return set([(name, version, None),
+                    (name, version, doc.get('ensemble'))])
+
+    def _unindex(self, row):
+        task_id = row['id']
+        for key in self._keys(row['value']):
+            ids = self._ensembles[key]
+            del ids[bisect.bisect_left(ids, task_id)]
+            if not ids:
+                del self._ensembles[key]
+        self._statuses[task_status(row['value'])].discard(task_id)
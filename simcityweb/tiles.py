@@ -0,0 +1,270 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .cache import LRUCache
+from . import serialization
+import math
+import six
+
+# Highest zoom level of tiles that are served
+MAX_ZOOM = 24
+
+# Maximum number of grid cells per axis of a spatial index
+MAX_CELLS = 256
+
+
+def check_tile(z, x, y):
+    """ Raises ValueError if z/x/y is not a tile of the XYZ scheme. """
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError('zoom level must be between 0 and {0}'
+                         .format(MAX_ZOOM))
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError('tile {0}/{1}/{2} does not exist'.format(z, x, y))
+
+
+def tile_bounds(z, x, y):
+    """ (west, south, east, north) longitude and latitude of a tile of the
+    XYZ scheme of web maps, in which tile 0/0/0 covers the world in web
+    mercator. """
+    n = 2.0 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360.0 - 180.0, latitude(y + 1),
+            (x + 1) / n * 360.0 - 180.0, latitude(y))
+
+
+def precision(z):
+    """ Number of decimals of a longitude or latitude that distinguish the
+    pixels of a 256 pixel tile at zoom level z. """
+    degrees_per_pixel = 360.0 / (256 * 2 ** z)
+    return max(0, int(math.ceil(-math.log10(degrees_per_pixel))))
+
+
+def positions(coordinates):
+    """ All positions in the coordinates of a GeoJSON geometry. """
+    if coordinates and isinstance(coordinates[0],
+                                  six.integer_types + (float,)):
+        yield coordinates
+    else:
+        for item in coordinates or ():
+            for position in positions(item):
+                yield position
+
+
+def geometry_bounds(geometry):
+    """ (west, south, east, north) of a GeoJSON geometry, or None if it is
+    empty. """
+    if geometry is None:
+        return None
+    if geometry.get('type') == 'GeometryCollection':
+        bounds = [geometry_bounds(g) for g in geometry.get('geometries', ())]
+        bounds = [b for b in bounds if b is not None]
+    else:
+        bounds = [(p[0], p[1], p[0], p[1])
+                  for p in positions(geometry.get('coordinates'))]
+    if not bounds:
+        return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+def round_geometry(geometry, decimals):
+    """ A GeoJSON geometry with coordinates rounded to given decimals, and
+    without positions that became duplicates of the previous one. Rings
+    and lines that collapse are left out, and None is returned if nothing
+    is left. """
+    kind = geometry.get('type')
+    if kind == 'GeometryCollection':
+        geometries = [round_geometry(g, decimals)
+                      for g in geometry.get('geometries', ())]
+        geometries = [g for g in geometries if g is not None]
+        if not geometries:
+            return None
+        return {'type': kind, 'geometries': geometries}
+
+    def position(p):
+        return [round(p[0], decimals), round(p[1], decimals)] + list(p[2:])
+
+    def line(coordinates, minimum):
+        result = []
+        for p in coordinates:
+            p = position(p)
+            if not result or p[:2] != result[-1][:2]:
+                result.append(p)
+        return result if len(result) >= minimum else None
+
+    def polygon(rings):
+        rings = [line(ring, 4) for ring in rings]
+        if not rings or rings[0] is None:
+            return None
+        return [ring for ring in rings if ring is not None]
+
+    def parts(items, make):
+        items = [make(item) for item in items]
+        return [item for item in items if item is not None] or None
+
+    coordinates = geometry.get('coordinates')
+    if kind == 'Point':
+        coordinates = position(coordinates)
+    elif kind == 'MultiPoint':
+        coordinates = [position(p) for p in coordinates]
+    elif kind == 'LineString':
+        coordinates = line(coordinates, 2)
+    elif kind == 'MultiLineString':
+        coordinates = parts(coordinates, lambda c: line(c, 2))
+    elif kind == 'Polygon':
+        coordinates = polygon(coordinates)
+    elif kind == 'MultiPolygon':
+        coordinates = parts(coordinates, polygon)
+    if not coordinates:
+        return None
+    return {'type': kind, 'coordinates': coordinates}
+
+
+class TileIndex(object):
+    """ Spatial index of the features of a GeoJSON FeatureCollection, in
+    longitude and latitude, for cutting it into tiles.
+
+    The bounding box of the features is divided into a grid of about one
+    cell per feature, at most MAX_CELLS by MAX_CELLS; each cell lists the
+    features whose bounding box overlaps it. A tile contains the features
+    whose bounding box overlaps the tile, whole, so that a client can join
+    the features of adjacent tiles by id. Their coordinates are rounded to
+    the pixels of the tile, so that zoomed out tiles are smaller; features
+    smaller than a pixel are left out.
+
+    Raises ValueError if collection is not a FeatureCollection.
+    """
+    def __init__(self, collection):
+        if (not isinstance(collection, dict) or
+                collection.get('type') != 'FeatureCollection' or
+                not isinstance(collection.get('features'), list)):
+            raise ValueError('attachment is not a GeoJSON FeatureCollection')
+        self.features = []
+        self.bounds = []
+        for feature in collection['features']:
+            bounds = geometry_bounds(feature.get('geometry'))
+            if bounds is not None:
+                self.features.append(feature)
+                self.bounds.append(bounds)
+
+        self.cells = {}
+        if not self.features:
+            self.extent = None
+            return
+        self.extent = (min(b[0] for b in self.bounds),
+                       min(b[1] for b in self.bounds),
+                       max(b[2] for b in self.bounds),
+                       max(b[3] for b in self.bounds))
+        self.size = min(MAX_CELLS,
+                        int(math.ceil(math.sqrt(len(self.features)))))
+        for i, bounds in enumerate(self.bounds):
+            for cell in self._cells(bounds):
+                self.cells.setdefault(cell, []).append(i)
+
+    def _cells(self, bounds):
+        """ Grid cells that overlap bounds, clipped to the extent. """
+        west, south, east, north = self.extent
+        width = (east - west) or 1.0
+        height = (north - south) or 1.0
+
+        def column(lon):
+            return min(self.size - 1, max(0, int(
+                (lon - west) / width * self.size)))
+
+        def row(lat):
+            return min(self.size - 1, max(0, int(
+                (lat - south) / height * self.size)))
+
+        if (bounds[0] > east or bounds[2] < west or
+                bounds[1] > north or bounds[3] < south):
+            return
+        for i in range(column(bounds[0]), column(bounds[2]) + 1):
+            for j in range(row(bounds[1]), row(bounds[3]) + 1):
+                yield i, j
+
+    def query(self, bounds):
+        """ Indexes of the features whose bounding box overlaps bounds, in
+        the order of the collection. """
+        if self.extent is None:
+            return []
+        found = set()
+        for cell in self._cells(bounds):
+            found.update(self.cells.get(cell, ()))
+        west, south, east, north = bounds
+        return sorted(
+            i for i in found
+            if not (self.bounds[i][0] > east or self.bounds[i][2] < west or
+                    self.bounds[i][1] > north or self.bounds[i][3] < south))
+
+    def tile(self, z, x, y):
+        """ FeatureCollection of tile z/x/y. """
+        check_tile(z, x, y)
+        decimals = precision(z)
+        features = []
+        for i in self.query(tile_bounds(z, x, y)):
+            geometry = round_geometry(self.features[i]['geometry'], decimals)
+            if geometry is not None:
+                feature = dict(self.features[i])
+                feature['geometry'] = geometry
+                features.append(feature)
+        return {'type': 'FeatureCollection', 'features': features}
+
+
+class TileCache(object):
+    """ GeoJSON tiles of attachments, written once per attachment revision
+    to an attachments.AttachmentCache.
+
+    The tile index of an attachment is built on the first request of one of
+    its tiles, and the indexes of the max_indexes most recently used
+    attachments are kept in memory.
+    """
+    def __init__(self, files, max_indexes=16):
+        self.files = files
+        self.indexes = LRUCache(max_indexes)
+        self.tiles = 0
+
+    def get(self, key, path, z, x, y):
+        """ Path of tile z/x/y of the GeoJSON file at path, whose
+        attachment has cache key key. path may be a function that returns
+        the path, which is only called if neither the tile nor the index is
+        cached, e.g. to download the attachment. Raises ValueError if the
+        tile does not exist or the file is not a GeoJSON FeatureCollection.
+        """
+        check_tile(z, x, y)
+
+        def fetch(target):
+            tile = self.index(key, path).tile(z, x, y)
+            with open(target, 'w') as f:
+                serialization.dump(tile, f)
+            self.tiles += 1
+
+        return self.files.get('{0}-{1}-{2}-{3}'.format(key, z, x, y), fetch)
+
+    def index(self, key, path):
+        index = self.indexes.get(key)
+        if index is None:
+            if callable(path):
+                path = path()
+            with open(path) as f:
+                index = TileIndex(serialization.load(f))
+            self.indexes.put(key, index)
+        return index
+
+    def stats(self):
+        return {'tiles': self.tiles, 'indexes': self.indexes.stats()}
@@ -0,0 +1,279 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .changes import task_status
+from .conditional import value_etag
+from .views import iter_view
+import functools
+import threading
+import time
+
+TASK_CATEGORIES = ('pending', 'in_progress', 'done', 'error')
+JOB_CATEGORIES = ('pending_jobs', 'running_jobs', 'finished_jobs',
+                  'archived_jobs', 'active_jobs')
+
+
+def task_categories(doc):
+    """ Totals that a task document counts towards. """
+    if doc.get('type', 'task') != 'task':
+        return ()
+    return (task_status(doc),)
+
+
+def job_categories(doc):
+    """ Totals that a job document counts towards. """
+    if doc.get('type') != 'job':
+        return ()
+    if doc.get('archive', 0) > 0:
+        return ('archived_jobs',)
+    elif doc.get('done', 0) > 0:
+        return ('finished_jobs', 'active_jobs')
+    elif doc.get('start', 0) > 0:
+        return ('running_jobs', 'active_jobs')
+    else:
+        return ('pending_jobs', 'active_jobs')
+
+
+def seq_number(seq):
+    """ Number of a CouchDB update sequence, which is an integer, or, since
+    CouchDB 2.0, a string that starts with a number and a dash. """
+    if seq is None:
+        return 0
+    return int(str(seq).split('-', 1)[0])
+
+
+def view_counts(database, categories, attempts=3):
+    """ Number of documents per category and the update sequence they were
+    counted at, from the views of a simcity database named after the
+    categories, like simcity.overview_total counts them.
+
+    The first view is brought up to date; the others are read as they are,
+    so that all counts are of the same sequence. If the index was updated
+    in between, they are counted again. """
+    for _ in range(attempts):
+        counts, seqs = {}, set()
+        for i, category in enumerate(categories):
+            params = {'stale': 'ok'} if i > 0 else {}
+            view = database.view(category, limit=0, update_seq=True,
+                                 **params)
+            counts[category] = view.total_rows
+            seqs.add(view.update_seq)
+        if len(seqs) == 1:
+            break
+    return counts, max(seqs, key=seq_number)
+
+
+def view_members(database, category):
+    """ Ids of the documents of a category, from the view of a simcity
+    database named after it, a page at a time. """
+    return (row['id'] for row in iter_view(
+        functools.partial(database.view, category)))
+
+
+class ViewCategories(object):
+    """ Counts and members of the categories of the documents of a simcity
+    database, from its views, for CategoryCounter.
+
+    get_database returns the simcity database. """
+    def __init__(self, get_database, categories):
+        self.get_database = get_database
+        self.categories = categories
+
+    def update_seq(self):
+        return self.get_database().db.info()['update_seq']
+
+    def category_counts(self):
+        return view_counts(self.get_database(), self.categories)
+
+    def category_members(self, category):
+        return view_members(self.get_database(), category)
+
+
+class CategoryCounter(object):
+    """ Number of documents of a database per category, kept up to date
+    from the changes that a changes.ChangesFollower publishes.
+
+    source counts the documents per category, with the update sequence of
+    the counts, and lists the documents of a category, like
+    ViewCategories. The counts are seeded from the source before the
+    follower reads its feed; the follower may be shared with other
+    listeners. Without source, all counts are zero.
+
+    A change is counted by uncounting the previous categories of the
+    document. Only documents in transient categories, that they will leave,
+    are remembered; transient must list all categories that such documents
+    are in. Documents in other categories are only counted, so that memory
+    does not grow with the finished documents. A change of a document whose
+    categories are not remembered, because it was finished, deleted or
+    created again, makes the counter count again, at most once per
+    recount_interval seconds.
+    """
+    def __init__(self, source, categorize, categories, transient=(),
+                 recount_interval=10.0):
+        self.source = source
+        self.categorize = categorize
+        self.categories = categories
+        self.transient = frozenset(transient)
+        self.recount_interval = recount_interval
+        self.counts = dict((category, 0) for category in categories)
+        self.ready = False
+        self.version = 0
+        self.seq = None
+        self.recounts = 0
+        self._counted_seq = 0
+        self._last_count = 0
+        self._timer = None
+        self._documents = {}
+        self._kinds = {}
+        self._count_lock = threading.RLock()
+
+    def follow(self, follower):
+        """ Seed the counts when follower starts, and count the changes
+        that it publishes from then on. """
+        follower.seed = self.seed
+        follower.listeners.append(self.publish)
+
+    def seed(self):
+        """ List the documents of the transient categories and count all
+        documents. Returns the sequence to follow the changes from, which is
+        before the documents were listed; changes up to the sequence of the
+        counts update the remembered categories only. """
+        with self._count_lock:
+            if self.source is None:
+                self.ready = True
+                return 0
+            start = self.source.update_seq()
+            members = {}
+            for category in self.transient:
+                for doc_id in self.source.category_members(category):
+                    members.setdefault(doc_id, set()).add(category)
+            self._documents = dict((doc_id, self._kind(categories))
+                                   for doc_id, categories in members.items())
+            self._count()
+            self.ready = True
+            return start
+
+    def _kind(self, categories):
+        """ Shared frozenset of categories, so that remembered documents
+        take little memory. """
+        categories = frozenset(categories)
+        return self._kinds.setdefault(categories, categories)
+
+    def _count(self):
+        counts, seq = self.source.category_counts()
+        self.counts = dict((category, counts.get(category, 0))
+                           for category in self.categories)
+        self.seq = seq
+        self._counted_seq = seq_number(seq)
+        self._last_count = time.time()
+        self.recounts += 1
+        self.version += 1
+
+    def recount(self):
+        """ Count all documents again. """
+        with self._count_lock:
+            self._timer = None
+            self._recount_later()
+
+    def _recount_later(self):
+        """ Count again now, if the last count is at least recount_interval
+        seconds ago, or else when it is. If counting fails, it is tried
+        again after recount_interval seconds; the counts are off until
+        then. """
+        if self._timer is not None:
+            return
+        delay = self._last_count + self.recount_interval - time.time()
+        if delay <= 0:
+            try:
+                self._count()
+                return
+            except Exception:
+                self._last_count = time.time()
+                delay = self.recount_interval
+        self._timer = threading.Timer(delay, self.recount)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def publish(self, change):
+        if change['id'].startswith('_design/'):
+            return
+        if change.get('deleted'):
+            categories = self._kind(())
+        else:
+            categories = self._kind(self.categorize(change.get('doc') or {}))
+
+        with self._count_lock:
+            known = change['id'] in self._documents
+            previous = self._documents.pop(change['id'], self._kind(()))
+            if categories & self.transient:
+                self._documents[change['id']] = categories
+            if seq_number(change.get('seq')) <= self._counted_seq:
+                return  # already counted by the source
+            self.seq = change.get('seq', self.seq)
+
+            rev = (change.get('doc') or {}).get('_rev', '')
+            if not known and not rev.startswith('1-'):
+                if categories or change.get('deleted'):
+                    self._recount_later()
+                return
+            if previous == categories:
+                return
+            for category in previous:
+                self.counts[category] -= 1
+            for category in categories:
+                self.counts[category] += 1
+            self.version += 1
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'documents': len(self._documents),
+            'version': self.version,
+            'recounts': self.recounts,
+            'seq': self.seq,
+        }
+
+
+class OverviewTotals(object):
+    """ Totals of tasks and jobs, like simcity.overview_total, maintained
+    in memory from the changes of the task and job databases.
+
+    The totals are those of the update sequences of the databases, so that
+    all processes give the same totals the same ETag.
+    """
+    def __init__(self, tasks, jobs):
+        self.tasks = tasks
+        self.jobs = jobs
+
+    @property
+    def ready(self):
+        return self.tasks.ready and self.jobs.ready
+
+    def snapshot(self):
+        """ Current totals, with the sum of the update sequences as
+        update_seq, and their ETag, or None if the totals are not seeded
+        yet. """
+        if not self.ready:
+            return None
+        with self.tasks._count_lock, self.jobs._count_lock:
+            totals = dict(self.tasks.counts)
+            totals.update(self.jobs.counts)
+            totals['update_seq'] = (seq_number(self.tasks.seq) +
+                                    seq_number(self.jobs.seq))
+            return totals, value_etag('totals', self.tasks.seq, self.jobs.seq)
+
+    def stats(self):
+        return {'tasks': self.tasks.stats(), 'jobs': self.jobs.stats()}
@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from . import serialization
 from bottle import HTTPResponse
 import os
 import json
@@ -21,6 +22,8 @@ import yaml
 import six
 import abc
 import copy
+import hashlib
+import itertools
 
 try:
     FileNotFound = FileNotFoundError
@@ -36,6 +39,53 @@ def abort(status, message):
     raise error(status, message)
 
 
+def make_etag(data):
+    """ Strong ETag of given bytes. """
+    return '"{0}"'.format(hashlib.sha1(data).hexdigest())
+
+
+# Content encodings whose responses have an ETag of their own
+ETAG_ENCODINGS = ('br', 'gzip')
+
+
+def encoded_etag(etag, encoding):
+    """ ETag of a body sent in a content encoding. A strong ETag differs per
+    representation, so it is the ETag of the unencoded body with the
+    encoding as suffix. """
+    return '{0}-{1}"'.format(etag[:-1], encoding)
+
+
+def unencoded_etag(etag):
+    """ ETag of the unencoded body of an ETag made by encoded_etag. """
+    for encoding in ETAG_ENCODINGS:
+        suffix = '-{0}"'.format(encoding)
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def matching_etag(etag, if_none_match):
+    """ The tag of an If-None-Match header value that matches given ETag,
+    in any content encoding, or None if it does not match. """
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        strong = tag[2:] if tag.startswith('W/') else tag
+        if tag == '*' or unencoded_etag(strong) == etag:
+            return tag
+    return None
+
+
+def etag_matches(etag, if_none_match):
+    """ Whether an If-None-Match header value matches given ETag. """
+    return matching_etag(etag, if_none_match) is not None
+
+
+def not_modified(etag):
+    return HTTPResponse(status=304, ETag=etag)
+
+
 def to_new_dict(keys, dictionary):
     moved = []
     new_dict = {}
@@ -53,6 +103,78 @@ def remove_keys(keys, dictionary):
     return dictionary
 
 
+def project(doc, fields, keep=('_id', '_rev')):
+    """ Copy of a document with only given fields, and always the fields in
+    keep.
+
+    A field may be a dotted path into nested objects, like input.ensemble.
+    Fields that do not exist are left out. """
+    result = {}
+    for field in tuple(keep) + tuple(fields):
+        value, parts = doc, field.split('.')
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = result
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return result
+
+
+def parse_fields(value):
+    """ Parse the fields query parameter, a comma-separated list of
+    fields; None if not given. """
+    if value is None:
+        return None
+    fields = [field.strip() for field in value.split(',')]
+    fields = [field for field in fields if field]
+    return fields or None
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError('{0} is read-only'.format(type(self).__name__))
+
+
+class FrozenDict(dict):
+    """ Read-only dict. A deep copy of it is a normal, mutable dict. """
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict((copy.deepcopy(key, memo), copy.deepcopy(value, memo))
+                    for key, value in self.items())
+
+
+class FrozenList(list):
+    """ Read-only list. A deep copy of it is a normal, mutable list. """
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = _read_only
+    clear = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+
+def freeze(value):
+    """ Recursively convert dicts and lists into read-only versions. """
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(val)) for key, val in value.items())
+    elif isinstance(value, list):
+        return FrozenList(freeze(val) for val in value)
+    else:
+        return value
+
+
 class Transformer(object):
     __metaclass__ = abc.ABCMeta
 
@@ -86,6 +208,28 @@ class ParameterSweep(Transformer):
         print(json.dumps(descr, indent=4))
         return descr
 
+    def expand(self, description, parameters):
+        """ Generate all parameter sets of a sweep.
+
+        Given parameters in the form produced by transform, a swept
+        parameter given as a list of values takes each of those values in
+        turn. Yields the cartesian product of all swept parameters. """
+        sweep = [item for item in description.get('sweep', [])
+                 if isinstance(parameters.get(item), list)]
+        for values in itertools.product(*[parameters[item]
+                                          for item in sweep]):
+            combination = dict(parameters)
+            combination.update(zip(sweep, values))
+            yield combination
+
+    def count(self, description, parameters):
+        """ Number of parameter sets that expand will generate. """
+        count = 1
+        for item in description.get('sweep', []):
+            if isinstance(parameters.get(item), list):
+                count *= len(parameters[item])
+        return count
+
 
 class Simulation:
     def __init__(self, name, version, description):
@@ -178,7 +322,7 @@ def get_minified_json(path, name):
         (os.path.isfile(json_path) and os.path.getmtime(json_path) <=
          os.path.getmtime(minified_path)))):
             with open(minified_path, 'r') as f:
-                return json.load(f)
+                return serialization.load(f)
     else:
         data = minify_and_load_json(path, name)
         return data
@@ -193,14 +337,14 @@ def minify_and_load_json(path, name):
             data = yaml.load(f)
     elif os.path.isfile(json_path):
         with open(json_path) as f:
-            data = json.load(f)
+            data = serialization.load(f)
     else:
         raise IOError('Could not open {0} nor {1}'.format(yaml_path,
                                                           json_path))
 
     try:
         with open(minified_path, 'w') as f:
-            json.dump(data, f, separators=(',', ':'))
+            serialization.dump(data, f)
     except IOError:
         print('WARNING: cannot write minified json file {0}/{1}.min.json'
               .format(path, name))
@@ -222,10 +366,10 @@ def get_json(name, path, json_type):
                     'the server administrator.').format(name, json_type))
 
 
-def view_to_json(view):
+def view_to_json(view, rows=None):
     ret = {
         'total_rows': view.total_rows,
-        'rows': view.rows,
+        'rows': view.rows if rows is None else rows,
         'offset': view.offset,
     }
     if view.update_seq is not None:
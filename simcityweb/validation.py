@@ -0,0 +1,213 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import serialization
+from jsonschema import Draft4Validator, RefResolver
+from jsonschema.exceptions import best_match
+from jsonschema.validators import create, extend, validator_for
+import copy
+import os
+import threading
+import time
+
+
+def extend_with_default(validator_class):
+    """ Validator class that fills in default values of properties. """
+    validate_properties = validator_class.VALIDATORS['properties']
+
+    def set_defaults(validator, properties, instance, schema):
+        if isinstance(instance, dict):
+            for prop, subschema in properties.items():
+                if isinstance(subschema, dict) and 'default' in subschema:
+                    instance.setdefault(prop, copy.deepcopy(
+                        subschema['default']))
+
+        for error in validate_properties(validator, properties, instance,
+                                         schema):
+            yield error
+
+    return extend(validator_class, {'properties': set_defaults})
+
+
+# Keywords that lead to the properties of a schema
+STRUCTURE_KEYWORDS = ('$ref', 'allOf', 'items', 'properties')
+
+
+def default_filler(validator_class):
+    """ Validator class that only fills in default values of properties,
+    like extend_with_default, without checking the instance. """
+    keywords = extend_with_default(validator_class).VALIDATORS
+    return create(validator_class.META_SCHEMA,
+                  dict((keyword, keywords[keyword])
+                       for keyword in STRUCTURE_KEYWORDS
+                       if keyword in keywords))
+
+
+def find_refs(schema):
+    """ All non-local $ref values in a schema. """
+    refs = set()
+    if isinstance(schema, dict):
+        ref = schema.get('$ref')
+        if ref is not None and not ref.startswith('#'):
+            refs.add(ref.split('#')[0])
+        for value in schema.values():
+            refs |= find_refs(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            refs |= find_refs(value)
+    return refs
+
+
+class SchemaStore(object):
+    """ Resolves $ref URLs to the schemas in a local directory.
+
+    A reference is matched to a schema file by the last part of its path,
+    so both https://host/schema/point2d and https://host/explore/schema/point2d
+    resolve to point2d.json.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, ref):
+        name = ref.rstrip('/').rsplit('/', 1)[-1]
+        if name.endswith('.json'):
+            name = name[:-5]
+        if not name or name.startswith('.'):
+            return None
+        try:
+            with open(os.path.join(self.path, name + '.json')) as f:
+                return serialization.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def resolve(self, schema):
+        """ Map of all references from schema that can be resolved
+        locally, recursively. """
+        store = {}
+        todo = find_refs(schema)
+        while todo:
+            ref = todo.pop()
+            target = self.load(ref)
+            if target is None:
+                continue
+            store[ref] = target
+            todo |= find_refs(target) - set(store)
+        return store
+
+
+class ParameterValidator(object):
+    """ Compiled validator of the parameters of a simulation version.
+
+    Like simcity.parse_parameters, missing parameters are set to their
+    default value and a ValueError is raised if the parameters are invalid.
+    Parameters that are already validated can be given their defaults with
+    fill_defaults, which does not validate them again.
+    """
+    def __init__(self, simulation, schema_store=None):
+        schema = copy.deepcopy(simulation.description)
+        schema['type'] = 'object'
+        schema['additionalProperties'] = False
+
+        store = schema_store.resolve(schema) if schema_store else {}
+        resolver = RefResolver.from_schema(schema, store=store)
+        cls = validator_for(schema, default=Draft4Validator)
+        self.simulation = simulation
+        self.validator = extend_with_default(cls)(schema, resolver=resolver)
+        self.filler = default_filler(cls)(schema, resolver=resolver)
+
+    def validate(self, parameters):
+        error = best_match(self.validator.iter_errors(parameters))
+        if error is not None:
+            raise ValueError(error.message)
+
+    def fill_defaults(self, parameters):
+        """ Set missing parameters to their default value, as validate
+        does. """
+        for _ in self.filler.iter_errors(parameters):
+            pass
+
+
+class ValidatorCache(object):
+    """ Parameter validators per simulation version.
+
+    Validators are compiled on first use and recompiled when the simulation
+    file changes. Compilation and validation times are recorded.
+    """
+    def __init__(self, registry, schema_path):
+        self.registry = registry
+        self.schema_store = SchemaStore(schema_path)
+        self._validators = {}
+        self._lock = threading.Lock()
+        self.compilations = 0
+        self.compile_time = 0.0
+        self.validations = 0
+        self.validation_time = 0.0
+        self.max_validation_time = 0.0
+
+    def get(self, name, version=None):
+        """ Get the validator of a simulation version.
+
+        Raises the same errors as SimulationConfig.get_simulation. """
+        config = self.registry.get(name)
+        simulation = config.get_simulation(version)
+        key = (name, simulation.version)
+        entry = self._validators.get(key)
+        if entry is not None and entry[0] == config.signature:
+            return entry[1]
+
+        with self._lock:
+            start = time.time()
+            validator = ParameterValidator(simulation, self.schema_store)
+            self._validators[key] = (config.signature, validator)
+            self.compilations += 1
+            self.compile_time += time.time() - start
+        return validator
+
+    def validate(self, name, version, parameters):
+        """ Validate parameters and fill in defaults.
+
+        Returns the Simulation they were validated against and the time
+        validation took, in seconds. Raises ValueError if the parameters are
+        invalid. """
+        validator = self.get(name, version)
+        return validator.simulation, self.timed_validate(validator,
+                                                         parameters)
+
+    def timed_validate(self, validator, parameters):
+        """ Validate parameters with a validator from this cache.
+
+        Returns the time validation took, in seconds. Raises ValueError if
+        the parameters are invalid. """
+        start = time.time()
+        try:
+            validator.validate(parameters)
+        finally:
+            duration = time.time() - start
+            self.validations += 1
+            self.validation_time += duration
+            self.max_validation_time = max(self.max_validation_time,
+                                           duration)
+        return duration
+
+    def stats(self):
+        return {
+            'validators': len(self._validators),
+            'compilations': self.compilations,
+            'compile_seconds': self.compile_time,
+            'validations': self.validations,
+            'validation_seconds': self.validation_time,
+            'max_validation_seconds': self.max_validation_time,
+        }
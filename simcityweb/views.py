@@ -0,0 +1,164 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .util import view_to_json, project
+import json
+
+# Number of rows fetched from CouchDB at a time when streaming a view
+PAGE_SIZE = 1000
+
+
+# Fields of view values that are kept when projecting them
+VALUE_KEYS = ('id', 'rev', '_id', '_rev')
+
+
+def project_rows(rows, fields):
+    """ View rows with only given fields of their value, and always its id
+    and revision. Rows are returned unchanged if fields is None. """
+    if fields is None:
+        return rows
+    projected = []
+    for row in rows:
+        if isinstance(row.get('value'), dict):
+            row = dict(row)
+            row['value'] = project(row['value'], fields, keep=VALUE_KEYS)
+        projected.append(row)
+    return projected
+
+
+def view_page(query, limit=None, startkey=None, startkey_docid=None,
+              fields=None, update_seq=False):
+    """ Fetch a page of view rows.
+
+    Parameters:
+    query: function taking CouchDB view parameters and returning a
+        couchdb.client.ViewResults
+    limit: maximum number of rows, or None for all remaining rows
+    startkey, startkey_docid: first row of the page, as given by the cursor
+        of the previous page
+    fields: fields of the row values to return, as for util.project, or
+        None for the whole values
+    update_seq: whether the view results include the update sequence of
+        the database
+
+    Returns the view results, the rows of the page and the cursor of the next
+    page, a (key, docid) tuple, or None if there are no more rows.
+    """
+    params = {}
+    if limit is not None:
+        params['limit'] = limit + 1
+    if startkey is not None:
+        params['startkey'] = startkey
+    if startkey_docid is not None:
+        params['startkey_docid'] = startkey_docid
+    if update_seq:
+        params['update_seq'] = True
+
+    view = query(**params)
+    rows = view.rows
+    cursor = None
+    if limit is not None and len(rows) > limit:
+        rows, cursor = rows[:limit], (rows[limit]['key'], rows[limit]['id'])
+    return view, project_rows(rows, fields), cursor
+
+
+def page_to_json(view, rows, cursor):
+    """ A page given by view_page as a dict, with the cursor of the next
+    page as next_startkey and next_startkey_docid. """
+    ret = view_to_json(view, rows=rows)
+    if cursor is not None:
+        ret['next_startkey'], ret['next_startkey_docid'] = cursor
+    return ret
+
+
+def iter_view(query, startkey=None, startkey_docid=None,
+              page_size=PAGE_SIZE):
+    """ All rows of a view, fetched page_size rows at a time. """
+    cursor = (startkey, startkey_docid)
+    while cursor is not None:
+        _, rows, cursor = view_page(query, page_size, *cursor)
+        for row in rows:
+            yield row
+
+
+def stream_view(query, startkey=None, startkey_docid=None,
+                page_size=PAGE_SIZE, dumps=json.dumps, fields=None,
+                first_page=None):
+    """ Serialize all rows of a view as JSON, one page at a time.
+
+    Yields strings that together form the same object as view_to_json. At
+    most page_size rows are held in memory. first_page is the first page as
+    given by view_page, if it was already fetched. """
+    cursor = (startkey, startkey_docid)
+    first = None
+    separator = '{"rows":['
+    while cursor is not None:
+        if first_page is not None:
+            (view, rows, cursor), first_page = first_page, None
+        else:
+            view, rows, cursor = view_page(query, page_size, *cursor,
+                                           fields=fields)
+        if first is None:
+            first = view
+        if rows:
+            yield separator + ','.join(dumps(row) for row in rows)
+            separator = ','
+
+    if separator != ',':
+        yield separator
+
+    # offset and update_seq as seen by the first page
+    ret = view_to_json(first, rows=[])
+    del ret['rows']
+    yield '],' + dumps(ret)[1:]
+
+
+def stream_rows(rows, dumps=json.dumps, page_size=PAGE_SIZE):
+    """ Serialize rows as a JSON object {"rows": [...]}, page_size rows at
+    a time. """
+    separator = '{"rows":['
+    page = []
+    for row in rows:
+        page.append(dumps(row))
+        if len(page) == page_size:
+            yield separator + ','.join(page)
+            separator, page = ',', []
+    if page:
+        yield separator + ','.join(page)
+        separator = ','
+    yield ']}' if separator == ',' else separator + ']}'
+
+
+def parse_limit(value):
+    """ Parse the limit query parameter; None if not given.
+
+    Raises ValueError if the value is not a positive integer. """
+    if value is None or value == '':
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return limit
+
+
+class ListViewResults(object):
+    """ Results of a query of a view over in-memory rows, like
+    couchdb.client.ViewResults. """
+    def __init__(self, rows, total_rows, offset, update_seq=None):
+        self.rows = rows
+        self.total_rows = total_rows
+        self.offset = offset
+        self.update_seq = update_seq
@@ -17,4 +17,5 @@ echo "$TIME - connected successfully"
 
 # TODO: Make user and password settable through environment variable?  
 simcity init -u simcityadmin -p simcity &&
-  exec python -m bottle scripts.app --bind 0.0.0.0:9090 -s gevent
+  exec python -m simcityweb.prefork scripts.app --bind 0.0.0.0:9090 \
+    ${SIMCITY_WORKERS:+--workers $SIMCITY_WORKERS}
@@ -0,0 +1,47 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from simcityweb.views import ListViewResults, page_to_json, view_page
+import six
+
+
+def view_page_to_json(query, limit=None, startkey=None, startkey_docid=None,
+                      fields=None):
+    """ A page of a view as a dict, with the cursor of the next page as
+    next_startkey and next_startkey_docid. """
+    return page_to_json(*view_page(query, limit, startkey, startkey_docid,
+                                   fields))
+
+
+class ListView(object):
+    """ A CouchDB view over an in-memory list of rows.
+
+    Rows are dicts with a key and an id and are sorted like CouchDB sorts
+    them, by key and then by id. Supports the limit, startkey and
+    startkey_docid parameters. """
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: (row['key'], row['id']))
+
+    def __call__(self, limit=None, startkey=None, startkey_docid=None):
+        offset = 0
+        if startkey is not None:
+            start = (startkey, startkey_docid or six.text_type())
+            while (offset < len(self.rows) and
+                   (self.rows[offset]['key'],
+                    self.rows[offset]['id']) < start):
+                offset += 1
+        end = len(self.rows) if limit is None else offset + limit
+        return ListViewResults(self.rows[offset:end], len(self.rows), offset)
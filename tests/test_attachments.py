@@ -0,0 +1,121 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.attachments import AttachmentCache, attachment_key
+from pytest import raises
+import os
+import threading
+import time
+
+
+class Fetcher(object):
+    def __init__(self, data=b'0123456789', delay=0, fail=False):
+        self.data = data
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, target):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise IOError('download failed')
+        with open(target, 'wb') as f:
+            f.write(self.data)
+
+
+def test_attachment_key():
+    key = attachment_key('task', '1-a', 'md5-x', 'file.json')
+    assert key != attachment_key('task', '2-a', 'md5-x', 'file.json')
+    assert key == attachment_key('task', '1-a', 'md5-x', 'file.json')
+
+
+def test_cache_hit(tmpdir):
+    cache = AttachmentCache(str(tmpdir))
+    fetch = Fetcher()
+    path = cache.get('a', fetch)
+    assert path == cache.get('a', fetch)
+    assert 1 == fetch.calls
+    with open(path, 'rb') as f:
+        assert b'0123456789' == f.read()
+    assert {'hits': 1, 'misses': 1} == dict(
+        (k, v) for k, v in cache.stats().items() if k in ('hits', 'misses'))
+
+
+def test_cache_evict(tmpdir):
+    cache = AttachmentCache(str(tmpdir), max_size=25)
+    fetch = Fetcher()
+    cache.get('a', fetch)
+    cache.get('b', fetch)
+    cache.get('a', fetch)
+    cache.get('c', fetch)
+
+    assert 20 == cache.stats()['size']
+    assert not tmpdir.join('b').check()
+    assert tmpdir.join('a').check()
+
+    # a new cache picks up the existing files
+    assert 20 == AttachmentCache(str(tmpdir), max_size=25).size
+
+
+def test_cache_single_flight(tmpdir):
+    cache = AttachmentCache(str(tmpdir))
+    fetch = Fetcher(delay=0.1)
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(
+        cache.get('a', fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 1 == fetch.calls
+    assert 5 == len(paths)
+
+
+def test_cache_fetch_error(tmpdir):
+    cache = AttachmentCache(str(tmpdir))
+    with raises(IOError):
+        cache.get('a', Fetcher(fail=True))
+    assert [] == tmpdir.listdir()
+    assert cache.get('a', Fetcher())
+
+
+def test_cache_shared(tmpdir):
+    first = AttachmentCache(str(tmpdir))
+    second = AttachmentCache(str(tmpdir))
+    fetch = Fetcher()
+    first.get('a', fetch)
+    second.get('a', fetch)
+    assert 1 == fetch.calls
+    assert 10 == second.size
+
+    # evicted by the other process
+    tmpdir.join('a').remove()
+    first.get('a', fetch)
+    assert 2 == fetch.calls
+    assert 10 == first.size
+
+
+def test_cache_scan_downloads(tmpdir):
+    running = tmpdir.join('a.{0}.x.tmp'.format(os.getppid()))
+    running.write('')
+    tmpdir.join('b.{0}.x.tmp'.format(os.getpid())).write('')
+    tmpdir.join('c.x.tmp').mkdir()
+    AttachmentCache(str(tmpdir))
+    assert [running] == tmpdir.listdir()
@@ -0,0 +1,170 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.cache import LRUCache, ViewCache, DocumentCache
+from pytest import raises
+
+
+class DesignDocs(object):
+    """ Stand-in for simcity.ensemble_view that counts calls. """
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, db, name, version, ensemble=None):
+        self.calls.append((name, version, ensemble))
+        if name in self.fail:
+            raise ValueError('cannot create view')
+        return '{0}_{1}_{2}'.format(name, version, ensemble or 'all')
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    stats = cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+
+
+def test_view_cache():
+    create = DesignDocs()
+    views = ViewCache(create, max_size=10)
+    assert views.get(None, 'sim', '0.1', 'ens') == 'sim_0.1_ens'
+    assert views.get(None, 'sim', '0.1', 'ens') == 'sim_0.1_ens'
+    assert views.get(None, 'sim', '0.1') == 'sim_0.1_all'
+    assert len(create.calls) == 2
+
+    views.invalidate('sim', '0.1', 'ens')
+    views.get(None, 'sim', '0.1', 'ens')
+    assert len(create.calls) == 3
+
+
+def test_view_cache_warm():
+    create = DesignDocs(fail=('broken',))
+    views = ViewCache(create)
+    queried = []
+    sims = [('sim', '0.1'), ('broken', '0.1'), ('sim', '0.2')]
+    thread = views.start_warm(
+        'db', sims, lambda db, design_doc: queried.append(design_doc))
+    thread.join()
+    assert queried == ['sim_0.1_all', 'sim_0.2_all']
+
+    views.get('db', 'sim', '0.2')
+    assert len(create.calls) == 3
+
+
+def test_lru_cache_weigh():
+    cache = LRUCache(max_size=10, weigh=len)
+    cache.put('a', 'xxxx')
+    cache.put('b', 'xxxx')
+    assert cache.size == 8
+    cache.put('c', 'xxxx')
+    assert 'a' not in cache
+    assert cache.size == 8
+    cache.put('b', 'x')
+    assert cache.size == 5
+    assert cache.pop('c') == 'xxxx'
+    assert cache.size == 1
+
+
+class TaskDatabase(object):
+    """ Stand-in for the task database that counts requests. """
+    def __init__(self, docs):
+        self.docs = docs
+        self.fetches = 0
+        self.heads = 0
+
+    def fetch(self, doc_id):
+        self.fetches += 1
+        if doc_id not in self.docs:
+            raise ValueError('not found')
+        return dict(self.docs[doc_id])
+
+    def revision(self, doc_id):
+        self.heads += 1
+        doc = self.docs.get(doc_id)
+        return None if doc is None else doc['_rev']
+
+
+def test_document_cache():
+    db = TaskDatabase({
+        'done': {'_id': 'done', '_rev': '3-a', 'lock': 1, 'done': 2},
+        'running': {'_id': 'running', '_rev': '2-a', 'lock': 1, 'done': 0},
+    })
+    documents = DocumentCache(db.fetch, db.revision)
+    documents.get('done')
+    assert documents.get('done')['_rev'] == '3-a'
+    assert db.fetches == 1
+    assert db.heads == 0
+
+    documents.get('running')
+    documents.get('running')
+    assert db.fetches == 2
+    assert db.heads == 1
+
+    db.docs['running'] = {'_id': 'running', '_rev': '3-b', 'lock': 1,
+                          'done': 5}
+    assert documents.get('running')['_rev'] == '3-b'
+    assert db.fetches == 3
+
+    stats = documents.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 3
+    assert stats['entries'] == 2
+
+
+def test_document_cache_changes():
+    db = TaskDatabase({'done': {'_id': 'done', '_rev': '3-a', 'done': 2}})
+    documents = DocumentCache(db.fetch, db.revision)
+    documents.get('done')
+
+    documents.changed({'id': 'done', 'doc': {'_rev': '3-a'}})
+    documents.get('done')
+    assert db.fetches == 1
+
+    documents.changed({'id': 'done', 'doc': {'_rev': '4-b'}})
+    documents.get('done')
+    assert db.fetches == 2
+
+    del db.docs['done']
+    documents.changed({'id': 'done', 'deleted': True})
+    raises(ValueError, documents.get, 'done')
+    assert documents.stats()['invalidations'] == 2
+
+
+def test_document_cache_max_size():
+    docs = dict(('task_{0}'.format(i), {'_rev': '1-a', 'done': 1,
+                                        'output': 'x' * 100})
+                for i in range(10))
+    db = TaskDatabase(docs)
+    documents = DocumentCache(db.fetch, db.revision, max_size=500)
+    for doc_id in docs:
+        documents.get(doc_id)
+    stats = documents.stats()
+    assert stats['size'] <= 500
+    assert stats['entries'] < 10
+    assert stats['evictions'] > 0
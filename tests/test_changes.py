@@ -0,0 +1,142 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.changes import (ChangesFeed, Subscription, task_status,
+                                task_event, sse_message)
+from pytest import raises
+import json
+
+
+def change(task_id, seq, ensemble='ens', lock=0, done=0):
+    return {'id': task_id, 'seq': seq, 'doc': {
+        '_id': task_id, '_rev': '1-a', 'type': 'task', 'name': 'sim',
+        'version': '0.1', 'ensemble': ensemble, 'lock': lock, 'done': done,
+        'error': []}}
+
+
+def test_task_status():
+    assert task_status({'lock': 0, 'done': 0}) == 'pending'
+    assert task_status({'lock': 10, 'done': 0}) == 'in_progress'
+    assert task_status({'lock': 10, 'done': 20}) == 'done'
+    assert task_status({'lock': -1, 'done': 0}) == 'error'
+
+
+def test_task_event():
+    event = task_event(change('a', 3, lock=10))
+    assert event['status'] == 'in_progress'
+    assert event['ensemble'] == 'ens'
+    assert task_event({'id': '_design/x', 'seq': 1,
+                       'doc': {'_id': '_design/x', 'type': 'view'}}) is None
+    assert task_event({'id': 'a', 'seq': 4, 'deleted': True}) == {
+        'id': 'a', 'status': 'deleted', 'seq': 4}
+
+
+def test_sse_message():
+    message = sse_message({'id': 'a'}, event='status', event_id=3)
+    assert message == 'id: 3\nevent: status\ndata: {"id":"a"}\n\n'
+
+
+def test_subscription_filter():
+    feed = ChangesFeed()
+    by_id = feed.subscribe(ids=['a'])
+    by_ensemble = feed.subscribe(ensemble='other')
+    everything = feed.subscribe()
+
+    feed.publish(change('a', 1))
+    feed.publish(change('b', 2, ensemble='other'))
+    feed.publish({'id': 'a', 'seq': 3, 'deleted': True})
+
+    assert [by_id.get(0)['seq'], by_id.get(0)['seq']] == [1, 3]
+    assert by_ensemble.get(0)['id'] == 'b'
+    assert by_ensemble.get(0) is None
+    assert [everything.get(0)['seq'] for _ in range(3)] == [1, 2, 3]
+    assert feed.since == 3
+    assert feed.events == 3
+
+
+def test_subscription_overflow():
+    subscription = Subscription(max_size=2)
+    subscription.put({'id': 'a'})
+    subscription.put({'id': 'b'})
+    assert not subscription.closed
+    subscription.put({'id': 'c'})
+    assert subscription.closed
+
+
+def test_stream():
+    feed = ChangesFeed()
+    subscription = feed.subscribe()
+    stream = feed.stream(subscription, heartbeat=0.01)
+    assert next(stream).startswith('retry:')
+    assert next(stream) == ': keepalive\n\n'
+
+    feed.publish(change('a', 5, done=10))
+    message = next(stream)
+    assert message.startswith('id: 5\nevent: status\n')
+    data = json.loads(message.split('data: ')[1])
+    assert data['status'] == 'done'
+
+    stream.close()
+    assert feed.stats()['subscribers'] == 0
+
+
+def test_feed_resumes():
+    calls = []
+
+    def changes(since):
+        calls.append(since)
+        if len(calls) == 1:
+            return iter([change('a', 1), {'last_seq': 2}])
+        raise IOError('connection lost')
+
+    feed = ChangesFeed(changes, since=0)
+    subscription = Subscription()
+    feed._subscriptions.add(subscription)
+    assert feed.consume()
+    assert subscription.get(0)['id'] == 'a'
+    assert feed.since == 2
+    raises(IOError, feed.consume)
+    assert calls == [0, 2]
+
+
+def test_feed_seed():
+    seen = []
+    feed = ChangesFeed(lambda since: iter([change('b', since + 1)]))
+    feed.seed = lambda: 5
+    feed.listeners.append(seen.append)
+    assert feed.consume()
+    assert [('b', 6)] == [(c['id'], c['seq']) for c in seen]
+    assert feed.seeded and feed.since == 6
+
+
+def test_failing_listener():
+    seen = []
+
+    def fail(change):
+        raise KeyError('broken listener')
+
+    feed = ChangesFeed(lambda since: iter([change('a', 1), change('b', 2)]),
+                       since=0)
+    subscription = Subscription()
+    feed._subscriptions.add(subscription)
+    feed.listeners.extend([fail, seen.append])
+    assert feed.consume()
+    assert ['a', 'b'] == [c['id'] for c in seen]
+    assert ['a', 'b'] == [subscription.get(0)['id'] for _ in range(2)]
+    assert 2 == feed.stats()['listener_errors']
+    assert 2 == feed.since
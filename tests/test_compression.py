@@ -0,0 +1,186 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.compression import (negotiate, compressible, compress,
+                                    precompress, static_file, add_vary,
+                                    CompressionPlugin)
+from wsgiref.util import setup_testing_defaults
+import bottle
+import gzip
+import io
+import json
+import os
+import time
+
+
+def call(app, path, headers=None, method='GET'):
+    """ Call a WSGI app, returning status, headers and body. """
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+    setup_testing_defaults(environ)
+    for key, value in (headers or {}).items():
+        environ['HTTP_' + key.upper().replace('-', '_')] = value
+
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result['status'] = int(status.split()[0])
+        result['headers'] = dict(response_headers)
+
+    body = b''.join(app(environ, start_response))
+    return result['status'], result['headers'], body
+
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+
+def make_app(root=None):
+    app = bottle.Bottle()
+    app.uninstall('json')
+    app.install(CompressionPlugin(threshold=100))
+    app.install(bottle.JSONPlugin())
+
+    @app.get('/large')
+    def large():
+        return {'values': list(range(1000))}
+
+    @app.get('/varying')
+    def varying():
+        bottle.response.set_header('Vary', 'Cookie')
+        bottle.response.set_header('ETag', '"large"')
+        return {'values': list(range(1000))}
+
+    @app.get('/small')
+    def small():
+        return {'value': 1}
+
+    @app.get('/stream')
+    def stream():
+        bottle.response.content_type = 'application/json'
+        return (str(i) for i in range(1000))
+
+    @app.get('/file/<name>')
+    def file(name):
+        return static_file(name, root=root, mimetype='application/json')
+
+    return app
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert 'gzip' == negotiate('gzip, deflate')
+    assert 'gzip' == negotiate('*')
+    assert negotiate('gzip;q=0') is None
+    assert negotiate('identity') is None
+    assert 'gzip' == negotiate('br;q=0.5, gzip', encodings=('br', 'gzip'))
+    assert 'br' == negotiate('br, gzip', encodings=('br', 'gzip'))
+
+
+def test_compressible():
+    assert compressible('application/json')
+    assert compressible('application/geo+json; charset=utf-8')
+    assert compressible('text/html')
+    assert not compressible('text/event-stream')
+    assert not compressible('image/png')
+    assert not compressible(None)
+
+
+def test_compress():
+    data = json.dumps(list(range(1000))).encode('utf-8')
+    assert data == gunzip(compress(data, 'gzip', 6))
+
+
+def test_precompress(tmpdir):
+    f = tmpdir.join('data.json')
+    f.write('[1, 2, 3]')
+    variant = precompress(str(f), 'gzip')
+    assert str(f) + '.gz' == variant
+    with open(variant, 'rb') as v:
+        assert b'[1, 2, 3]' == gunzip(v.read())
+
+    mtime = os.path.getmtime(variant)
+    assert variant == precompress(str(f), 'gzip')
+    assert mtime == os.path.getmtime(variant)
+
+    f.write('[4]')
+    later = time.time() + 10
+    os.utime(str(f), (later, later))
+    with open(precompress(str(f), 'gzip'), 'rb') as v:
+        assert b'[4]' == gunzip(v.read())
+
+
+def test_plugin():
+    app = make_app()
+    status, headers, body = call(app, '/large', {'Accept-Encoding': 'gzip'})
+    assert 200 == status
+    assert 'gzip' == headers['Content-Encoding']
+    assert 'Accept-Encoding' == headers['Vary']
+    assert list(range(1000)) == json.loads(gunzip(body).decode())['values']
+
+    status, headers, body = call(app, '/large')
+    assert 'Content-Encoding' not in headers
+    assert 'Accept-Encoding' == headers['Vary']
+
+    status, headers, body = call(app, '/small', {'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in headers
+    assert b'{"value": 1}' == body
+
+    status, headers, body = call(app, '/stream', {'Accept-Encoding': 'gzip'})
+    assert 'gzip' == headers['Content-Encoding']
+    assert ''.join(str(i) for i in range(1000)) == gunzip(body).decode()
+
+
+def test_add_vary():
+    response = bottle.HTTPResponse()
+    add_vary(response, 'Accept-Encoding')
+    assert 'Accept-Encoding' == response.get_header('Vary')
+    response.set_header('Vary', 'Cookie, accept-encoding')
+    add_vary(response, 'Accept-Encoding')
+    assert 'Cookie, accept-encoding' == response.get_header('Vary')
+    response.set_header('Vary', '*')
+    add_vary(response, 'Accept-Encoding')
+    assert '*' == response.get_header('Vary')
+
+
+def test_plugin_headers():
+    app = make_app()
+    status, headers, body = call(app, '/varying', {'Accept-Encoding': 'gzip'})
+    assert 'Cookie, Accept-Encoding' == headers['Vary']
+    assert '"large-gzip"' == headers['Etag']
+
+    status, headers, body = call(app, '/varying')
+    assert '"large"' == headers['Etag']
+
+
+def test_static_file(tmpdir):
+    data = json.dumps(list(range(1000)))
+    tmpdir.join('data.json').write(data)
+    app = make_app(root=str(tmpdir))
+
+    status, headers, body = call(app, '/file/data.json',
+                                 {'Accept-Encoding': 'gzip'})
+    assert 200 == status
+    assert 'gzip' == headers['Content-Encoding']
+    assert data == gunzip(body).decode()
+    assert tmpdir.join('data.json.gz').check()
+
+    status, headers, body = call(app, '/file/data.json',
+                                 {'Accept-Encoding': 'gzip',
+                                  'Range': 'bytes=0-9'})
+    assert 206 == status
+    assert data[:10] == body.decode()
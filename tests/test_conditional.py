@@ -0,0 +1,156 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.compression import CompressionPlugin, static_file
+from simcityweb.conditional import (ConditionalPlugin, check_etag, file_etag,
+                                    value_etag, rev_etag, document_rev)
+from couchdb.http import ResourceNotFound
+from test_compression import call
+import bottle
+import os
+
+
+class Resource(object):
+    """ Stand-in for couchdb.http.Resource that answers HEAD requests. """
+    def __init__(self, docs, path=()):
+        self.docs = docs
+        self.path = path
+
+    def __call__(self, *path):
+        return Resource(self.docs, self.path + path)
+
+    def head(self):
+        doc_id = '/'.join(self.path)
+        if doc_id not in self.docs:
+            raise ResourceNotFound()
+        return 200, {'ETag': '"{0}"'.format(self.docs[doc_id])}, None
+
+
+class Database(object):
+    def __init__(self, docs):
+        self.resource = Resource(docs)
+
+
+def make_app(root=None):
+    app = bottle.Bottle()
+    app.uninstall('json')
+    app.install(CompressionPlugin())
+    app.install(ConditionalPlugin())
+    app.install(bottle.JSONPlugin())
+    calls = []
+
+    @app.get('/doc')
+    def doc():
+        check_etag(rev_etag('1-abc'))
+        calls.append('doc')
+        return {'_rev': '1-abc'}
+
+    @app.get('/hashed')
+    def hashed():
+        return {'value': 1}
+
+    @app.get('/large')
+    def large():
+        return {'values': list(range(1000))}
+
+    @app.post('/hashed')
+    def post_hashed():
+        return {'value': 1}
+
+    @app.get('/file/<name>')
+    def file(name):
+        return static_file(name, root=root, mimetype='application/json')
+
+    return app, calls
+
+
+def test_etags(tmpdir):
+    assert rev_etag('1-abc') == '"1-abc"'
+    assert value_etag(1, 'a') == value_etag(1, 'a')
+    assert value_etag(1, 'a') != value_etag(2, 'a')
+
+    f = tmpdir.join('a.json')
+    f.write('{}')
+    etag = file_etag(str(f))
+    assert etag == file_etag(str(f))
+    os.utime(str(f), (1, 1))
+    assert etag != file_etag(str(f))
+    assert file_etag(str(tmpdir.join('missing')))
+
+
+def test_document_rev():
+    database = Database({'task_1': '2-abc', '_design/x': '1-def'})
+    assert document_rev(database, 'task_1') == '2-abc'
+    assert document_rev(database, '_design/x') == '1-def'
+    assert document_rev(database, 'task_2') is None
+
+
+def test_check_etag():
+    app, calls = make_app()
+    status, headers, body = call(app, '/doc')
+    assert 200 == status
+    assert '"1-abc"' == headers['Etag']
+
+    status, headers, body = call(app, '/doc', {'If-None-Match': '"1-abc"'})
+    assert 304 == status
+    assert b'' == body
+    assert ['doc'] == calls
+
+
+def test_plugin():
+    app, _ = make_app()
+    status, headers, body = call(app, '/hashed')
+    assert 200 == status
+    etag = headers['Etag']
+
+    status, headers, body = call(app, '/hashed', {'If-None-Match': etag})
+    assert 304 == status
+    assert etag == headers['Etag']
+
+    # the compressed body has an ETag of its own, which is revalidated too
+    status, headers, body = call(app, '/large', {'Accept-Encoding': 'gzip'})
+    assert 'gzip' == headers['Content-Encoding']
+    gzip_etag = headers['Etag']
+    assert gzip_etag.endswith('-gzip"')
+    status, headers, _ = call(app, '/large')
+    assert gzip_etag != headers['Etag']
+    status, headers, body = call(app, '/large', {'Accept-Encoding': 'gzip',
+                                                 'If-None-Match': gzip_etag})
+    assert 304 == status
+    assert gzip_etag == headers['Etag']
+
+    status, headers, body = call(app, '/hashed', method='POST')
+    assert 200 == status
+    assert 'Etag' not in headers
+
+
+def test_static_file(tmpdir):
+    tmpdir.join('data.json').write('[1, 2, 3]')
+    app, _ = make_app(root=str(tmpdir))
+    status, headers, body = call(app, '/file/data.json')
+    assert 200 == status
+    etag = headers['Etag']
+    assert etag.startswith('"')
+
+    status, headers, body = call(app, '/file/data.json',
+                                 {'If-None-Match': etag})
+    assert 304 == status
+
+    status, headers, body = call(app, '/file/missing.json',
+                                 {'If-None-Match': etag})
+    assert 404 == status
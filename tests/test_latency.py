@@ -0,0 +1,69 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.latency import LatencyPlugin, parse_latency
+from simcityweb.serve import parse_bind
+from wsgiref.util import setup_testing_defaults
+from pytest import raises
+import bottle
+
+
+def call(app, path, method='GET'):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+    setup_testing_defaults(environ)
+    return b''.join(app(environ, lambda status, headers, exc_info=None: None))
+
+
+def test_parse_latency():
+    assert [('/explore/view/*', 0.05, 0.02), ('*', 0.01, 0)] == parse_latency(
+        '/explore/view/*=0.05~0.02; *=0.01')
+    assert [] == parse_latency('')
+    for value in ('/explore', '=0.1', '*=fast', '*=-1', '*=1~-1'):
+        with raises(ValueError):
+            parse_latency(value)
+
+
+def test_latency_plugin():
+    delays = []
+    plugin = LatencyPlugin(parse_latency(
+        'POST /task/*=1; /task*=0.5~0.1; /free=0'), sleep=delays.append)
+    app = bottle.Bottle()
+    app.install(plugin)
+
+    @app.route('/task/<name>', method=['GET', 'POST'])
+    def task(name):
+        return name
+
+    @app.get('/free')
+    def free():
+        return 'free'
+
+    assert b'a' == call(app, '/task/a')
+    assert 0.4 <= delays[-1] <= 0.6
+    call(app, '/task/a', method='POST')
+    assert 1 == delays[-1]
+    call(app, '/free')
+    assert 2 == len(delays)
+    assert {'rules': 3, 'delayed': 2} == plugin.stats()
+
+
+def test_parse_bind():
+    assert ('0.0.0.0', 9090) == parse_bind('0.0.0.0:9090')
+    assert ('localhost', 8080) == parse_bind(':8080')
+    with raises(ValueError):
+        parse_bind('localhost')
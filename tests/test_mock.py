@@ -0,0 +1,53 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.mock import mock_config, mock_storage, load_tasks
+import json
+import os
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_mock_config():
+    config = mock_config()
+    assert 'mock' == config.section('Simulations')['storage']
+    assert {} == config.section('task-db')
+    assert ['Simulations'] == config.sections()
+
+
+def test_load_tasks(tmpdir):
+    row = {'id': 'a', 'key': 'a', 'value': {'_id': 'a', '_rev': '1-a'}}
+    tmpdir.mkdir('sub').join('a.json').write(json.dumps(row))
+    tmpdir.join('notes.txt').write('not a task')
+    assert [row] == load_tasks(str(tmpdir))
+
+
+def test_mock_storage():
+    storage = mock_storage(
+        {'SIMCITY_MOCK_TASKS': '20', 'SIMCITY_MOCK_SEED': '1',
+         'SIMCITY_MOCK_SIMULATIONS': 'sim:1'},
+        tasks=os.path.join(PROJECT_DIR, 'mock_tasks'),
+        results=os.path.join(PROJECT_DIR, 'mock_results'))
+    examples = len(load_tasks(os.path.join(PROJECT_DIR, 'mock_tasks')))
+    assert examples + 20 == storage.stats()['tasks']
+    assert 20 == storage.view('sim', '1')().total_rows
+    counts, seq = storage.category_counts()
+    assert examples + 20 == sum(counts.values()) == seq
+    assert storage.attachment_file(
+        'synthetic_0000000', 'WardGeoResponse.json') is not None
+    assert 0 == storage.stats()['transitions']['transitions']
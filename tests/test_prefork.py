@@ -0,0 +1,121 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.prefork import Supervisor, listen, main
+from six.moves.urllib.request import urlopen
+import json
+import time
+
+APP = '''
+import bottle
+import os
+
+
+@bottle.get('/pid')
+def pid():
+    return {'pid': os.getpid()}
+'''
+
+
+def get_pid(port, timeout=10):
+    """ Pid of the worker that answers, waiting for workers to start. """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            response = urlopen('http://127.0.0.1:{0}/pid'.format(port))
+            return json.loads(response.read().decode('utf-8'))['pid']
+        except IOError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_supervisor(tmpdir, monkeypatch):
+    tmpdir.join('prefork_app.py').write(APP)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    supervisor = Supervisor('prefork_app', workers=2, timeout=5.0,
+                            graceful_timeout=1.0, heartbeat=0.1)
+    supervisor.socket = listen('127.0.0.1', 0)
+    port = supervisor.socket.getsockname()[1]
+    try:
+        supervisor.spawn()
+        supervisor.spawn()
+        assert get_pid(port) in supervisor.workers
+        supervisor.read_heartbeats(timeout=1.0)
+
+        # a worker without heartbeat is killed
+        worker = next(iter(supervisor.workers.values()))
+        worker.last_beat = 0
+        supervisor.check()
+        assert 1 == supervisor.kills
+        deadline = time.time() + 5
+        while worker.pid in supervisor.workers and time.time() < deadline:
+            supervisor.reap()
+            time.sleep(0.05)
+        assert 1 == supervisor.running()
+        assert get_pid(port) in supervisor.workers
+    finally:
+        for worker in list(supervisor.workers.values()):
+            worker.stop()
+        supervisor.shutdown()
+        supervisor.socket.close()
+    assert {} == supervisor.workers
+
+
+def test_supervisor_startup(tmpdir, monkeypatch):
+    tmpdir.join('slow_app.py').write('import time\ntime.sleep(1.0)\n' + APP)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    supervisor = Supervisor('slow_app', workers=1, timeout=0.5,
+                            graceful_timeout=1.0, heartbeat=0.1,
+                            startup_timeout=5.0)
+    supervisor.socket = listen('127.0.0.1', 0)
+    port = supervisor.socket.getsockname()[1]
+    try:
+        supervisor.spawn()
+        worker = next(iter(supervisor.workers.values()))
+        # loading the application takes longer than the heartbeat timeout
+        deadline = time.time() + 5
+        while not worker.ready and time.time() < deadline:
+            supervisor.read_heartbeats(timeout=0.1)
+            supervisor.check()
+        assert worker.ready
+        assert 0 == supervisor.kills
+        assert worker.pid == get_pid(port)
+
+        # a worker that does not start in time is killed
+        worker.ready = False
+        worker.last_beat = time.time() - 6.0
+        supervisor.check()
+        assert 1 == supervisor.kills
+    finally:
+        for worker in list(supervisor.workers.values()):
+            worker.stop()
+        supervisor.shutdown()
+        supervisor.socket.close()
+    assert {} == supervisor.workers
+
+
+def test_main_bind(monkeypatch):
+    supervisors = []
+    monkeypatch.setattr(Supervisor, 'run',
+                        lambda supervisor: supervisors.append(supervisor))
+    main(['scripts.app', '--bind', ':9091'])
+    main(['scripts.app', '-b', '0.0.0.0:9092', '--startup-timeout', '5'])
+    assert [('localhost', 9091), ('0.0.0.0', 9092)] == [
+        (supervisor.host, supervisor.port) for supervisor in supervisors]
+    assert 5 == supervisors[1].startup_timeout
@@ -0,0 +1,123 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.registry import SimulationRegistry, SimulationCatalogue
+from simcityweb.util import freeze
+from bottle import HTTPResponse
+from pytest import raises
+import copy
+import json
+import os
+import time
+
+
+def write_spec(tmpdir, spec, mtime=None):
+    f = tmpdir.join('test.json')
+    f.write(json.dumps(spec))
+    if mtime is not None:
+        os.utime(str(f), (mtime, mtime))
+    return f
+
+
+def test_freeze():
+    frozen = freeze({'a': [1, {'b': 2}]})
+    with raises(TypeError):
+        frozen['c'] = 3
+    with raises(TypeError):
+        frozen['a'].append(3)
+    with raises(TypeError):
+        frozen['a'][1]['b'] = 3
+
+    thawed = copy.deepcopy(frozen)
+    thawed['a'][1]['b'] = 3
+    assert 2 == frozen['a'][1]['b']
+    assert '{"a":[1,{"b":2}]}' == json.dumps(frozen, separators=(',', ':'))
+
+
+def test_registry_cached(tmpdir):
+    write_spec(tmpdir, {'latest': '1.0', '1.0': {'command': 'a'}})
+    registry = SimulationRegistry(str(tmpdir))
+
+    config = registry.get('test')
+    assert config is registry.get('test')
+    assert '1.0' == config.get_simulation('latest').version
+    with raises(TypeError):
+        config.get_simulation('1.0').description['name'] = 'test'
+
+
+def test_registry_reload(tmpdir):
+    write_spec(tmpdir, {'latest': '1.0', '1.0': {}}, mtime=time.time() + 10)
+    registry = SimulationRegistry(str(tmpdir))
+    assert ['1.0', 'latest'] == registry.get('test').get_versions()
+
+    write_spec(tmpdir, {'latest': '1.1', '1.0': {}, '1.1': {}},
+               mtime=time.time() + 20)
+    assert ['1.0', '1.1', 'latest'] == registry.get('test').get_versions()
+    assert '1.1' == registry.get('test').get_simulation('latest').version
+
+
+def test_registry_simulations(tmpdir):
+    write_spec(tmpdir, {'latest': '1.1', '1.0': {}, '1.1': {}})
+    tmpdir.join('broken.json').write('{')
+    registry = SimulationRegistry(str(tmpdir))
+    assert [('test', '1.0'), ('test', '1.1')] == registry.simulations()
+
+
+def test_registry_removed(tmpdir):
+    f = write_spec(tmpdir, {'latest': '1.0', '1.0': {}})
+    registry = SimulationRegistry(str(tmpdir))
+    registry.get('test')
+    f.remove()
+    tmpdir.join('test.min.json').remove()
+
+    with raises(HTTPResponse):
+        registry.get('test')
+
+
+def test_catalogue(tmpdir):
+    write_spec(tmpdir, {'latest': '1.0', '1.0': {}})
+    catalogue = SimulationCatalogue(SimulationRegistry(str(tmpdir)),
+                                    interval=0)
+    catalogue.refresh()
+    assert ({'test': {'name': 'test', 'versions': ['1.0', 'latest']}} ==
+            json.loads(catalogue.body.decode('utf-8')))
+    etag = catalogue.etag
+    catalogue.refresh()
+    assert etag == catalogue.etag
+
+    tmpdir.join('other.json').write('{"0.1": {}}')
+    catalogue.refresh()
+    assert ['other', 'test'] == sorted(
+        json.loads(catalogue.body.decode('utf-8')))
+    assert etag != catalogue.etag
+
+    tmpdir.join('other.json').remove()
+    catalogue.refresh()
+    assert etag == catalogue.etag
+
+
+def test_catalogue_interval(tmpdir):
+    write_spec(tmpdir, {'latest': '1.0', '1.0': {}})
+    catalogue = SimulationCatalogue(SimulationRegistry(str(tmpdir)),
+                                    interval=3600)
+    catalogue.refresh()
+    tmpdir.join('other.json').write('{"0.1": {}}')
+    catalogue.refresh()
+    assert b'other' not in catalogue.body
+    catalogue.refresh(force=True)
+    assert b'other' in catalogue.body
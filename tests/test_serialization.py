@@ -0,0 +1,62 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb import serialization
+from pytest import fixture, raises
+import json
+
+VALUE = {'id': 'task_1', 'url': '/couchdb/db/task_1', 'done': 0,
+         'input': {'fires': [[77.5, 13.1], [77.6, 13.2]], 'name': u'é'},
+         'error': [], 'ok': True, 'missing': None}
+
+
+@fixture(params=list(serialization.BACKENDS))
+def backend(request):
+    previous = serialization.backend()
+    serialization.use_backend(request.param)
+    yield request.param
+    serialization.use_backend(previous)
+
+
+def test_round_trip(backend):
+    text = serialization.dumps(VALUE)
+    assert ', ' not in text and ': ' not in text
+    assert VALUE == json.loads(text)
+    assert VALUE == serialization.loads(text)
+    assert VALUE == serialization.loads(text.encode('utf-8'))
+
+
+def test_dumps_fallback(backend):
+    assert '[100000000000000000000,{"1":2}]' == serialization.dumps(
+        [10 ** 20, {1: 2}])
+    assert '{"a":1,"b":2}' == serialization.dumps({'b': 2, 'a': 1},
+                                                  sort_keys=True)
+
+
+def test_loads_invalid(backend):
+    raises(ValueError, serialization.loads, '{"a":')
+
+
+def test_use_backend():
+    previous = serialization.backend()
+    try:
+        serialization.use_backend()
+        assert serialization.backend() == list(serialization.BACKENDS)[0]
+        raises(ValueError, serialization.use_backend, 'unknown')
+    finally:
+        serialization.use_backend(previous)
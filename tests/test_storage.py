@@ -0,0 +1,262 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.storage import (LocalStorage, CouchDBStorage, MockStorage,
+                                next_rev)
+from simcityweb.tasks import bulk_save, bulk_delete, bulk_get
+from simcityweb.totals import CategoryCounter, task_categories
+from simcityweb.views import ListViewResults
+from helpers import view_page_to_json
+from couchdb.http import ResourceConflict, ResourceNotFound
+from pytest import raises, mark
+import threading
+
+
+def task(task_id, ensemble=None, lock=0, done=0, version='1'):
+    doc = {'_id': task_id, 'name': 'sim', 'version': version, 'lock': lock,
+           'done': done}
+    if ensemble is not None:
+        doc['ensemble'] = ensemble
+    return doc
+
+
+def test_next_rev():
+    assert next_rev(None).startswith('1-')
+    assert next_rev('9-abc').startswith('10-')
+
+
+@mark.parametrize('driver', [LocalStorage, MockStorage])
+def test_save_get_delete(driver):
+    storage = driver()
+    doc = task('a')
+    doc_id, rev = storage.save(doc)
+    assert ('a', rev) == (doc_id, doc['_rev'])
+    assert doc == storage.get('a')
+    assert rev == storage.rev('a')
+
+    with raises(ResourceConflict):
+        storage.save(task('a'))
+    doc['done'] = 5
+    _, rev2 = storage.save(doc)
+    assert rev2.startswith('2-') and 5 == storage.get('a')['done']
+
+    with raises(ResourceConflict):
+        storage.delete('a', rev)
+    storage.delete('a', rev2)
+    with raises(ResourceNotFound):
+        storage.get('a')
+    with raises(ResourceNotFound):
+        storage.delete('a', rev2)
+    assert storage.rev('a') is None
+    # a deleted document can be created again
+    storage.save(task('a'))
+    assert 4 == storage.update_seq()
+
+
+def test_bulk_operations():
+    storage = LocalStorage()
+    storage.save(task('b'))
+    results = bulk_save(storage, [task('a'), task('b'), task('c')])
+    assert ['a', 'c'] == [r['id'] for r in results if 'rev' in r]
+    assert 'already taken' in results[1]['error']
+
+    rows = list(bulk_get(storage.rows, ['a', 'x', 'c'], fields=['done']))
+    assert {'id': 'a', 'doc': {'_id': 'a', '_rev': storage.rev('a'),
+                               'done': 0}} == rows[0]
+    assert {'id': 'x', 'error': 'not_found'} == rows[1]
+
+    results = list(bulk_delete(storage, [('a', storage.rev('a')),
+                                         ('c', 'wrong'), ('x', '1-a')]))
+    assert results[0]['ok']
+    assert [409, 404] == [r['status'] for r in results[1:]]
+    assert {'id': 'a', 'error': 'deleted'} == next(bulk_get(storage.rows,
+                                                            ['a']))
+    assert {'pending': 2, 'in_progress': 0, 'done': 0,
+            'error': 0} == storage.counts()
+
+
+def test_views():
+    storage = LocalStorage()
+    for i in range(5):
+        storage.save(task('t{0}'.format(i), ensemble='e{0}'.format(i % 2),
+                          done=i))
+    storage.save(task('t9', version='2'))
+
+    page = view_page_to_json(storage.view('sim', '1'), 2, 't1', 't1')
+    assert ['t1', 't2'] == [row['id'] for row in page['rows']]
+    assert 't3' == page['next_startkey_docid']
+    assert 5 == page['total_rows'] and 1 == page['offset']
+    assert 2 == page['rows'][1]['value']['done']
+
+    assert storage.view('sim', '1')(limit=0).update_seq is None
+    assert 6 == storage.view('sim', '1')(limit=0, update_seq=True).update_seq
+
+    view = storage.view('sim', '1', 'e0')
+    assert ['t2', 't4'] == [row['id'] for row in view(startkey='t1').rows]
+    rows = view(startkey='t2', startkey_docid='t3').rows
+    assert ['t4'] == [row['id'] for row in rows]
+    assert [('t1', storage.rev('t1')), ('t3', storage.rev('t3'))] == list(
+        storage.revisions('sim', '1', 'e1'))
+    assert {'pending': 2, 'in_progress': 0, 'done': 4,
+            'error': 0} == storage.counts()
+
+
+def test_changes():
+    storage = LocalStorage(heartbeat=0.05)
+    storage.save(task('a'))
+    storage.save(task('b'))
+    storage.delete('a', storage.rev('a'))
+
+    snapshot = storage.snapshot(0)
+    assert 3 == snapshot['last_seq']
+    assert [('b', False), ('a', True)] == [
+        (change['id'], change.get('deleted', False))
+        for change in snapshot['results']]
+
+    feed = storage.changes('now')
+    assert {'last_seq': 3} == next(feed)
+    threading.Timer(0.01, storage.save, [task('c')]).start()
+    change = next(feed)
+    assert ('c', 4) == (change['id'], change['seq'])
+
+    counter = CategoryCounter(storage, task_categories, ('pending', 'done'),
+                              transient=('pending',))
+    assert 4 == counter.seed()
+    assert {'pending': 2, 'done': 0} == counter.counts
+    assert ['b', 'c'] == sorted(storage.category_members('pending'))
+
+
+def test_persistence(tmpdir):
+    path = str(tmpdir.join('tasks.sqlite'))
+    storage = LocalStorage(path)
+    storage.save(task('a', ensemble='e'))
+    storage = LocalStorage(path)
+    assert 'e' == storage.get('a')['ensemble']
+    storage.save(task('b'))
+    assert 2 == storage.update_seq()
+
+
+def test_shared_file(tmpdir):
+    path = str(tmpdir.join('tasks.sqlite'))
+    first, second = LocalStorage(path), LocalStorage(path, heartbeat=0.05)
+    feed = second.changes('now')
+    assert {'last_seq': 0} == next(feed)
+    first.save(task('a'))
+    second.save(task('b'))
+    first.delete('b', first.rev('b'))
+    assert 3 == first.update_seq() == second.update_seq()
+    assert [('a', 1), ('b', 3)] == [
+        (change['id'], change['seq']) for change in (next(feed), next(feed))]
+    doc = second.get('a')
+    first.save(first.get('a'))
+    raises(ResourceConflict, second.save, doc)
+    assert 4 == second.update_seq()
+
+
+def test_mock_storage(tmpdir):
+    tmpdir.join('result.json').write('{}')
+    storage = MockStorage(results=str(tmpdir), heartbeat=0.05)
+    for i in range(3):
+        storage.save(task('t{0}'.format(i), ensemble='e', done=i))
+    results = bulk_save(storage, [task('t0'), task('t3', version='2')])
+    assert 'already taken' in results[0]['error'] and 'rev' in results[1]
+
+    page = view_page_to_json(storage.view('sim', '1'), 2)
+    assert ['t0', 't1'] == [row['id'] for row in page['rows']]
+    assert 3 == page['total_rows']
+    assert 4 == storage.view('sim', '1', 'e')(update_seq=True).update_seq
+    assert [('t1', storage.rev('t1'))] == list(
+        storage.revisions('sim', '1', 'e'))[1:2]
+
+    rows = list(bulk_get(storage.rows, ['t3', 'x'], fields=['done']))
+    assert {'_id': 't3', '_rev': storage.rev('t3'), 'done': 0} == rows[0][
+        'doc']
+    assert {'id': 'x', 'error': 'not_found'} == rows[1]
+    results = list(bulk_delete(storage, [('t3', storage.rev('t3')),
+                                         ('t2', 'wrong')]))
+    assert results[0]['ok'] and 409 == results[1]['status']
+
+    feed = storage.changes(3)
+    change = next(feed)
+    assert ('t3', True) == (change['id'], change['deleted'])
+    assert {'last_seq': 5} == next(feed)
+    threading.Timer(0.01, storage.save, [task('t4')]).start()
+    change = next(feed)
+    assert ('t4', 6, storage.rev('t4')) == (
+        change['id'], change['seq'], change['doc']['_rev'])
+
+    assert ({'pending': 2, 'in_progress': 0, 'done': 2, 'error': 0},
+            6) == storage.category_counts()
+    assert ['t0', 't4'] == sorted(storage.category_members('pending'))
+    assert str(tmpdir.join('result.json')) == storage.attachment_file(
+        't0', 'result.json')
+    assert storage.attachment_file('t0', 'missing.json') is None
+    assert MockStorage().attachment_file('t0', 'result.json') is None
+
+
+class FakeDatabase(object):
+    """ simcity task database with a couchdb.Database as db. """
+    url = 'http://couch/tasks/'
+
+    def __init__(self):
+        self.db = self
+        self.docs = {}
+        self.design_docs = []
+
+    def get(self, doc_id):
+        return self.docs.get(doc_id)
+
+    def view(self, name, design_doc=None, **params):
+        if design_doc not in self.design_docs:
+            raise ResourceNotFound()
+        return ListViewResults([], 0, 0)
+
+
+class FakeViews(object):
+    def __init__(self):
+        self.created = 0
+
+    def get(self, db, name, version, ensemble=None):
+        self.created += 1
+        db.design_docs.append(self.created)
+        return self.created
+
+    def invalidate(self, name, version, ensemble=None):
+        pass
+
+
+def test_couchdb_storage():
+    database, views = FakeDatabase(), FakeViews()
+    storage = CouchDBStorage(lambda: database, views)
+    database.docs['a'] = {'_id': 'a'}
+    assert {'_id': 'a'} == storage.get('a')
+    with raises(ResourceNotFound):
+        storage.get('b')
+
+    query = storage.view('sim', '1')
+    assert [] == query(limit=1).rows
+    # a removed design document is created again
+    database.design_docs = []
+    assert [] == query(limit=1).rows
+    assert 2 == views.created
+
+    assert 'http://couch/tasks/a/x.json' == storage.attachment_url(
+        'a', 'x.json')
+    storage.public_url = 'https://example.com/tasks'
+    assert 'https://example.com/tasks/a/x.json' == storage.attachment_url(
+        'a', 'x.json')
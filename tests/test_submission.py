@@ -0,0 +1,87 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.submission import SubmissionScheduler
+import time
+
+
+class Submitter(object):
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, host):
+        self.calls.append(host)
+        if self.fail:
+            raise IOError('cannot connect')
+        return {'_id': 'job'}
+
+
+def test_coalesce():
+    submit = Submitter()
+    scheduler = SubmissionScheduler(submit, interval=10)
+    scheduler.start = lambda: None  # process manually
+    for _ in range(500):
+        scheduler.request('host')
+    assert 500 == scheduler.stats()['queue_depth']
+
+    assert scheduler.process(now=100) is None
+    assert ['host'] == submit.calls
+    assert 0 == scheduler.stats()['queue_depth']
+
+    scheduler.request('host')
+    assert 10 == scheduler.process(now=100)
+    assert 5 == scheduler.process(now=105)
+    assert 1 == len(submit.calls)
+    scheduler.process(now=110)
+    assert 2 == len(submit.calls)
+
+    host = scheduler.stats()['hosts']['host']
+    assert 501 == host['requests']
+    assert 2 == host['checks']
+    assert 'submitted' == host['last_outcome']
+
+
+def test_backoff():
+    submit = Submitter(fail=True)
+    scheduler = SubmissionScheduler(submit, interval=10, max_backoff=30)
+    scheduler.start = lambda: None
+    scheduler.request('host')
+
+    assert 20 == scheduler.process(now=0)
+    assert 30 == scheduler.process(now=20)
+    assert 30 == scheduler.process(now=50)
+    host = scheduler.stats()['hosts']['host']
+    assert 3 == host['failures']
+    assert host['last_outcome'].startswith('error')
+    assert 1 == host['pending']
+
+    submit.fail = False
+    scheduler.process(now=80)
+    assert 0 == scheduler.stats()['hosts']['host']['failures']
+
+
+def test_background():
+    submit = Submitter()
+    scheduler = SubmissionScheduler(submit, interval=10)
+    scheduler.request('host')
+    for _ in range(100):
+        if submit.calls:
+            break
+        time.sleep(0.01)
+    assert ['host'] == submit.calls
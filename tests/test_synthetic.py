@@ -0,0 +1,128 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.changes import task_status
+from simcityweb.synthetic import (TaskGenerator, StatusSimulator,
+                                  parse_distribution, parse_simulations)
+from simcityweb.taskstore import TaskStore
+from pytest import raises, approx
+
+EXAMPLES = [
+    {'_id': 'a', '_rev': '1-a', 'name': 'sim', 'version': '1', 'lock': 0,
+     'done': 0, 'error': [], 'uploads': {}, 'input': {'ensemble': 'x'}},
+    {'_id': 'b', '_rev': '1-b', 'name': 'sim', 'version': '1', 'lock': 10,
+     'done': 20, 'error': [], 'status': 'done', 'input': {'ensemble': 'x'},
+     'uploads': {'out.json': '/explore/simulation/b/out.json'}},
+]
+
+
+def test_parse_distribution():
+    assert {'pending': 0.25, 'done': 0.75} == approx(
+        parse_distribution('pending=1, done=3'))
+    with raises(ValueError):
+        parse_distribution('running=1')
+    with raises(ValueError):
+        parse_distribution('done=-1,pending=2')
+    with raises(ValueError):
+        parse_distribution('done=0')
+    with raises(ValueError):
+        parse_distribution('done')
+
+
+def test_parse_simulations():
+    assert [('matsim', '0.5'), ('matsim', '0.4')] == parse_simulations(
+        'matsim:0.5, matsim:0.4')
+    with raises(ValueError):
+        parse_simulations('matsim')
+
+
+def test_generator():
+    generator = TaskGenerator(EXAMPLES, ensembles=3, seed=1)
+    rows = list(generator.tasks(200))
+    assert 200 == len(set(row['id'] for row in rows))
+    statuses = [task_status(row['value']) for row in rows]
+    same_seed = TaskGenerator(EXAMPLES, ensembles=3, seed=1).tasks(200)
+    assert [(row['value']['ensemble'], task_status(row['value']))
+            for row in same_seed] == [
+        (row['value']['ensemble'], status)
+        for row, status in zip(rows, statuses)]
+
+    for row in rows:
+        doc = row['value']
+        assert row['id'] == doc['_id'] and 'status' not in doc
+        assert ('sim', '1') == (doc['name'], doc['version'])
+        assert doc['ensemble'] in ('ensemble_0', 'ensemble_1', 'ensemble_2')
+        assert doc['ensemble'] == doc['input']['ensemble']
+        if task_status(doc) == 'done':
+            assert 0 < doc['lock'] <= doc['done']
+            assert {'out.json': '/explore/simulation/{0}/out.json'.format(
+                row['id'])} == doc['uploads']
+        else:
+            assert {} == doc['uploads']
+    assert set(statuses) == set(['pending', 'in_progress', 'done', 'error'])
+    # the examples are not changed
+    assert 'x' == EXAMPLES[0]['input']['ensemble']
+
+
+def test_generator_simulations():
+    generator = TaskGenerator(EXAMPLES, simulations=[('a', '1'), ('b', '2')],
+                              distribution={'error': 1.0}, seed=2)
+    docs = [row['value'] for row in generator.tasks(20)]
+    assert set([('a', '1'), ('b', '2')]) == set(
+        (doc['name'], doc['version']) for doc in docs)
+    assert all(task_status(doc) == 'error' for doc in docs)
+    with raises(ValueError):
+        TaskGenerator([])
+
+
+def test_simulator():
+    store = TaskStore()
+    generator = TaskGenerator(EXAMPLES, distribution={'pending': 1.0},
+                              seed=3)
+    for row in generator.tasks(10):
+        store.put(row)
+    simulator = StatusSimulator(store, generator, error_rate=0)
+    seq = store.update_seq
+
+    simulator.step(4)
+    assert 4 == store.counts()['in_progress']
+    assert 6 == store.counts()['pending']
+    simulator.step(4)
+    counts = store.counts()
+    assert (4, 4, 2) == (counts['done'], counts['in_progress'],
+                         counts['pending'])
+    assert 12 == simulator.transitions
+    changes = store.changes(seq)
+    assert 8 == len(changes)
+    last_seq, _, row = changes[-1]
+    assert store.update_seq == last_seq
+    assert 'in_progress' == task_status(row['value'])
+
+    simulator.error_rate = 1
+    simulator.step(10)
+    counts = store.counts()
+    assert (4, 4, 2, 0) == (counts['done'], counts['error'],
+                            counts['in_progress'], counts['pending'])
+    assert {'rate': 10.0, 'transitions': 18} == simulator.stats()
+
+
+def test_simulator_missing_task():
+    store = TaskStore()
+    simulator = StatusSimulator(store, TaskGenerator(EXAMPLES))
+    simulator.advance('missing', 'done')
+    assert 0 == simulator.transitions
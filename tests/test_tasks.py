@@ -0,0 +1,181 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.tasks import (task_properties, bulk_save, chunks,
+                              BulkSubmission, parse_bulk_get, bulk_get,
+                              parse_bulk_delete, bulk_delete, couchdb_error)
+from couchdb.http import ResourceConflict, ResourceNotFound, ServerError
+from pytest import raises
+
+
+class BulkDatabase(object):
+    """ Stand-in for couchdb.Database that records bulk updates. """
+    def __init__(self, existing=()):
+        self.docs = dict((doc_id, {}) for doc_id in existing)
+        self.requests = 0
+
+    def update(self, docs):
+        self.requests += 1
+        results = []
+        for i, doc in enumerate(docs):
+            doc_id = doc.get('_id', 'generated_{0}'.format(i))
+            if doc_id in self.docs:
+                results.append((False, doc_id, ResourceConflict()))
+            else:
+                self.docs[doc_id] = doc
+                results.append((True, doc_id, '1-abc'))
+        return results
+
+
+def test_task_properties():
+    description = {'command': 'run.sh', 'resourceTypeUrl': '/resource/a'}
+    props = task_properties('sim', '1.0', description,
+                            {'ensemble': 'e', 'a': 1}, task_id='t')
+    assert 't' == props['_id']
+    assert 'run.sh' == props['command']
+    assert [] == props['arguments']
+    assert '*' == props['parallelism']
+    assert 'e' == props['ensemble']
+    assert '/resource/a' == props['typeUrl']
+    assert 'simulation' not in props
+    assert {'ensemble': 'e', 'a': 1} == props['input']
+
+
+def test_bulk_save():
+    db = BulkDatabase(existing=['b'])
+    results = bulk_save(db, [{'_id': 'a'}, {'_id': 'b'}, {}])
+    assert 1 == db.requests
+    assert {'id': 'a', 'rev': '1-abc'} == results[0]
+    assert 'b' == results[1]['id']
+    assert 'already taken' in results[1]['error']
+    assert 'rev' in results[2]
+
+
+def test_bulk_save_empty():
+    db = BulkDatabase()
+    assert [] == bulk_save(db, [])
+    assert 0 == db.requests
+
+
+def test_chunks():
+    assert [[0, 1], [2, 3], [4]] == list(chunks(range(5), 2))
+    assert [] == list(chunks([], 2))
+
+
+def test_bulk_submission_list():
+    submission = BulkSubmission([{'a': 1}, {'_id': 'x', 'a': 2}, 3], {})
+    assert 3 == len(submission)
+    errors = submission.validate(lambda query: None)
+    assert [2] == [err['index'] for err in errors]
+
+    submission = BulkSubmission([{'a': 1}, {'_id': 'x', 'a': 2}],
+                                {'command': 'run.sh'}, limit=5)
+    tasks = list(submission.tasks('sim', '1.0',
+                                  lambda query: query.setdefault('b', 0)))
+    assert 'x' == tasks[1]['_id']
+    assert {'a': 2, 'b': 0} == tasks[1]['input']
+
+
+def test_bulk_submission_sweep():
+    description = {'command': 'run.sh', 'sweep': ['a', 'b']}
+    body = {'sweep': {'a': list(range(100)), 'b': list(range(100))}}
+    submission = BulkSubmission(body, description)
+    assert 10000 == len(submission)
+
+    submission = BulkSubmission(body, description, limit=150)
+    assert 150 == len(submission)
+    tasks = submission.tasks('sim', '1.0', lambda query: None)
+    assert {'a': 0, 'b': 0} == next(tasks)['input']
+    assert 149 == len(list(tasks))
+
+
+def test_bulk_submission_invalid():
+    with raises(ValueError):
+        BulkSubmission({'a': 1}, {})
+
+
+def test_parse_bulk_get():
+    assert (['a'], None) == parse_bulk_get({'ids': ['a']})
+    assert (['a'], ['done']) == parse_bulk_get({'ids': ['a'],
+                                                'fields': ['done']})
+    raises(ValueError, parse_bulk_get, ['a'])
+    raises(ValueError, parse_bulk_get, {'ids': [1]})
+    raises(ValueError, parse_bulk_get, {'ids': ['a'], 'fields': 'done'})
+    raises(ValueError, parse_bulk_get, {'ids': ['a', 'b']}, max_size=1)
+
+
+def test_bulk_get():
+    docs = {'a': {'_id': 'a', '_rev': '1-a', 'done': 1, 'input': {'x': 1}},
+            'b': {'_id': 'b', '_rev': '2-b', 'done': 0, 'input': {'x': 2}}}
+    requests = []
+
+    def query(keys):
+        requests.append(keys)
+        rows = []
+        for key in keys:
+            if key in docs:
+                rows.append({'id': key, 'key': key, 'doc': docs[key],
+                             'value': {'rev': docs[key]['_rev']}})
+            elif key == 'deleted':
+                rows.append({'id': key, 'key': key, 'doc': None,
+                             'value': {'rev': '2-c', 'deleted': True}})
+            else:
+                rows.append({'key': key, 'error': 'not_found'})
+        return rows
+
+    rows = list(bulk_get(query, ['b', 'deleted', 'missing', 'a'],
+                         fields=['input.x'], chunk_size=3))
+    assert [['b', 'deleted', 'missing'], ['a']] == requests
+    assert {'id': 'b', 'doc': {'_id': 'b', '_rev': '2-b',
+                               'input': {'x': 2}}} == rows[0]
+    assert {'id': 'deleted', 'error': 'deleted'} == rows[1]
+    assert {'id': 'missing', 'error': 'not_found'} == rows[2]
+    assert 'a' == rows[3]['id']
+
+
+def test_couchdb_error():
+    assert (409, 'resource conflict') == couchdb_error(ResourceConflict())
+    assert 404 == couchdb_error(ResourceNotFound())[0]
+    assert 502 == couchdb_error(ServerError((500, 'oops')))[0]
+    assert couchdb_error(ValueError()) is None
+
+
+def test_parse_bulk_delete():
+    assert ([('a', '1-a')], None) == parse_bulk_delete(
+        {'docs': [{'id': 'a', 'rev': '1-a'}]})
+    assert (None, ('sim', '1', 'ens')) == parse_bulk_delete(
+        {'name': 'sim', 'version': '1', 'ensemble': 'ens'})
+    raises(ValueError, parse_bulk_delete, [])
+    raises(ValueError, parse_bulk_delete, {'docs': [{'id': 'a'}]})
+    raises(ValueError, parse_bulk_delete, {'name': 'sim', 'version': '1'})
+    raises(ValueError, parse_bulk_delete,
+           {'docs': [{'id': 'a', 'rev': '1'}, {'id': 'b', 'rev': '1'}]},
+           max_size=1)
+
+
+def test_bulk_delete():
+    db = BulkDatabase(existing=['b'])
+    result = list(bulk_delete(db, [('a', '1-a'), ('b', '1-b'), ('c', '1-c')],
+                              chunk_size=2))
+    assert db.requests == 2
+    assert db.docs['a'] == {'_id': 'a', '_rev': '1-a', '_deleted': True}
+    assert result == [
+        {'id': 'a', 'ok': True, 'rev': '1-abc'},
+        {'id': 'b', 'status': 409, 'error': 'resource conflict'},
+        {'id': 'c', 'ok': True, 'rev': '1-abc'},
+    ]
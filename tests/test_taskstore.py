@@ -0,0 +1,89 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.taskstore import TaskStore
+from helpers import view_page_to_json
+from pytest import raises
+
+
+def task(task_id, ensemble=None, lock=0, done=0, version='1'):
+    doc = {'_id': task_id, '_rev': '1-a', 'name': 'sim', 'version': version,
+           'lock': lock, 'done': done}
+    if ensemble is not None:
+        doc['ensemble'] = ensemble
+    return {'id': task_id, 'key': task_id, 'value': doc}
+
+
+def test_store_views():
+    store = TaskStore()
+    for i in range(5):
+        store.put(task('t{0}'.format(i), ensemble='e{0}'.format(i % 2)))
+    store.put(task('t9', version='2'))
+
+    assert 6 == len(store) and 't9' in store
+    assert ['t0', 't1', 't2', 't3', 't4'] == store.ids('sim', '1')
+    assert ['t1', 't3'] == store.ids('sim', '1', 'e1')
+    assert [] == store.ids('sim', '3')
+
+    page = view_page_to_json(store.view('sim', '1'), 2, 't1', 't1')
+    assert ['t1', 't2'] == [row['id'] for row in page['rows']]
+    assert 't3' == page['next_startkey_docid']
+    assert 5 == page['total_rows'] and 1 == page['offset']
+
+    view = store.view('sim', '1', 'e0')
+    assert ['t2', 't4'] == [row['id'] for row in view(startkey='t1').rows]
+    rows = view(startkey='t2', startkey_docid='t3').rows
+    assert ['t4'] == [row['id'] for row in rows]
+
+
+def test_store_counts():
+    store = TaskStore()
+    store.put(task('a'))
+    store.put(task('b', lock=1))
+    store.put(task('c', lock=1, done=2))
+    store.put(task('d', lock=-1))
+    assert {'pending': 1, 'in_progress': 1, 'done': 1,
+            'error': 1} == store.counts()
+
+    seq = store.update_seq
+    store.put(task('b', ensemble='e', lock=1, done=3))
+    store.delete('d')
+    assert seq + 2 == store.update_seq
+    assert {'pending': 1, 'in_progress': 0, 'done': 2,
+            'error': 0} == store.counts()
+    assert ['a', 'b', 'c'] == store.ids('sim', '1')
+    assert ['b'] == store.ids('sim', '1', 'e')
+
+    store.delete('b')
+    assert [] == store.ids('sim', '1', 'e')
+    with raises(KeyError):
+        store.delete('b')
+
+
+def test_store_changes():
+    store = TaskStore()
+    store.put(task('a'))
+    store.put(task('b'))
+    store.put(task('a', lock=1))
+    store.delete('b')
+    assert [(3, 'a'), (4, 'b')] == [
+        (seq, task_id) for seq, task_id, _ in store.changes(0)]
+    seq, _, row = store.changes(2)[0]
+    assert 1 == row['value']['lock']
+    assert [(4, 'b', None)] == store.changes(3)
+    assert [] == store.changes(4)
@@ -0,0 +1,150 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.attachments import AttachmentCache
+from simcityweb.cache import LRUCache
+from simcityweb.tiles import (TileIndex, TileCache, tile_bounds, check_tile,
+                              precision, geometry_bounds, round_geometry)
+from pytest import raises, approx
+import json
+import os
+
+WARDS = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                     'mock_results', 'WardGeoResponse.json')
+
+
+def square(x, y, size=1.0):
+    return {'type': 'Polygon', 'coordinates': [[
+        [x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+def collection(*geometries):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': i, 'geometry': g, 'properties': {}}
+        for i, g in enumerate(geometries)]}
+
+
+def test_tile_bounds():
+    assert (-180, -85.0511, 180, 85.0511) == approx(tile_bounds(0, 0, 0),
+                                                    abs=1e-4)
+    west, south, east, north = tile_bounds(1, 1, 0)
+    assert (0, 0, 180) == approx((west, south, east))
+    check_tile(2, 3, 3)
+    for z, x, y in ((-1, 0, 0), (2, 4, 0), (2, 0, -1), (30, 0, 0)):
+        with raises(ValueError):
+            check_tile(z, x, y)
+
+
+def test_precision():
+    assert 0 == precision(0)
+    assert 4 == precision(12)
+    assert precision(18) > precision(12)
+
+
+def test_geometry_bounds():
+    assert (1, 2, 2, 3) == geometry_bounds(square(1, 2))
+    assert (0, 0, 5, 6) == geometry_bounds({
+        'type': 'GeometryCollection', 'geometries': [
+            {'type': 'Point', 'coordinates': [5, 6]}, square(0, 0)]})
+    assert geometry_bounds(None) is None
+    assert geometry_bounds({'type': 'MultiPolygon', 'coordinates': []}) \
+        is None
+
+
+def test_round_geometry():
+    line = {'type': 'LineString',
+            'coordinates': [[0.01, 0.01], [0.02, 0.02], [1.04, 1.0]]}
+    assert [[0.0, 0.0], [1.0, 1.0]] == round_geometry(
+        line, 0)['coordinates']
+    assert round_geometry(square(0, 0, 0.001), 1) is None
+    multi = {'type': 'MultiPolygon', 'coordinates': [
+        square(0, 0, 0.001)['coordinates'], square(1, 1)['coordinates']]}
+    assert [square(1, 1)['coordinates']] == round_geometry(
+        multi, 2)['coordinates']
+
+
+def test_tile_index():
+    index = TileIndex(collection(square(1, 1), square(100, 50), None,
+                                 square(-170, -80, 340)))
+    assert 3 == len(index.features)
+    # 1/1/0 is the north-east quarter of the world
+    tile = index.tile(1, 1, 0)
+    assert [0, 1, 3] == [feature['id'] for feature in tile['features']]
+    assert [3] == [feature['id'] for feature in index.tile(1, 0, 1)[
+        'features']]
+    assert [] == index.tile(10, 0, 0)['features']
+    assert [] == TileIndex(collection()).tile(0, 0, 0)['features']
+    for value in ([], {'type': 'Feature'}, {'type': 'FeatureCollection'}):
+        with raises(ValueError):
+            TileIndex(value)
+
+
+def test_tile_index_wards():
+    with open(WARDS) as f:
+        wards = json.load(f)
+    index = TileIndex(wards)
+    assert 332 == len(index.features)
+
+    # the grid finds the same features as checking them all
+    for z, x, y in ((10, 732, 474), (12, 2930, 1899), (14, 11723, 7596)):
+        west, south, east, north = tile_bounds(z, x, y)
+        expected = [i for i, b in enumerate(index.bounds)
+                    if b[0] <= east and b[2] >= west and
+                    b[1] <= north and b[3] >= south]
+        assert expected == index.query((west, south, east, north))
+        assert 0 < len(expected) < 332
+    tile = index.tile(14, 11723, 7596)
+    assert len(json.dumps(tile)) < len(json.dumps(wards)) / 10
+
+
+def test_tile_cache(tmpdir):
+    files = AttachmentCache(str(tmpdir.join('cache')))
+    cache = TileCache(files)
+    path = cache.get('key', WARDS, 12, 2930, 1899)
+    with open(path) as f:
+        assert 'FeatureCollection' == json.load(f)['type']
+    assert path == cache.get('key', WARDS, 12, 2930, 1899)
+    cache.get('key', WARDS, 12, 2930, 1900)
+    assert 2 == cache.stats()['tiles']
+    assert 1 == cache.stats()['indexes']['misses']
+
+    with raises(ValueError):
+        cache.get('key', WARDS, 12, 2 ** 12, 0)
+    not_geojson = tmpdir.join('list.json')
+    not_geojson.write('[1, 2]')
+    with raises(ValueError):
+        cache.get('other', str(not_geojson), 0, 0, 0)
+    assert not os.path.exists(files.filename('other-0-0-0'))
+
+
+def test_tile_cache_lazy_path(tmpdir):
+    cache = TileCache(AttachmentCache(str(tmpdir.join('cache'))))
+    downloads = []
+
+    def download():
+        downloads.append(WARDS)
+        return WARDS
+
+    path = cache.get('key', download, 12, 2930, 1899)
+    assert path == cache.get('key', download, 12, 2930, 1899)
+    cache.get('key', download, 12, 2930, 1900)
+    assert [WARDS] == downloads
+    # a cached tile needs neither the index nor the file
+    cache.indexes = LRUCache(1)
+    assert path == cache.get('key', download, 12, 2930, 1899)
+    assert [WARDS] == downloads
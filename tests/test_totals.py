@@ -0,0 +1,254 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.changes import ChangesFollower
+from simcityweb.totals import (CategoryCounter, OverviewTotals,
+                               task_categories, job_categories,
+                               TASK_CATEGORIES, JOB_CATEGORIES, seq_number,
+                               view_counts, view_members)
+from simcityweb.views import ListViewResults
+
+
+class ChangesLog(object):
+    """ Stand-in for the changes feed of a database, and for the counts and
+    members of its categories. """
+    def __init__(self, categorize=task_categories):
+        self.changes = []
+        self.categorize = categorize
+        self.counted = 0
+
+    def add(self, doc_id, deleted=False, **doc):
+        doc['_id'] = doc_id
+        revisions = len([c for c in self.changes if c['id'] == doc_id])
+        doc['_rev'] = '{0}-a'.format(revisions + 1)
+        change = {'id': doc_id, 'seq': len(self.changes) + 1, 'doc': doc}
+        if deleted:
+            change['deleted'] = True
+        self.changes.append(change)
+
+    def documents(self):
+        docs = {}
+        for change in self.changes:
+            if change.get('deleted'):
+                docs.pop(change['id'], None)
+            elif not change['id'].startswith('_design/'):
+                docs[change['id']] = change['doc']
+        return docs
+
+    def update_seq(self):
+        return len(self.changes)
+
+    def category_counts(self):
+        self.counted += 1
+        counts = {}
+        for doc in self.documents().values():
+            for category in self.categorize(doc):
+                counts[category] = counts.get(category, 0) + 1
+        return counts, len(self.changes)
+
+    def category_members(self, category):
+        return [doc_id for doc_id, doc in self.documents().items()
+                if category in self.categorize(doc)]
+
+    def continuous(self, since):
+        return iter(self.changes[since:])
+
+
+def counter(log, categorize=task_categories, categories=TASK_CATEGORIES,
+            transient=('pending', 'in_progress')):
+    """ Counter following the log, and the follower that it listens to. """
+    follower = ChangesFollower(log.continuous, since=None)
+    tasks = CategoryCounter(log, categorize, categories, transient=transient,
+                            recount_interval=0)
+    tasks.follow(follower)
+    return tasks, follower
+
+
+def test_job_categories():
+    assert job_categories({'type': 'job', 'queue': 1}) == (
+        'pending_jobs', 'active_jobs')
+    assert job_categories({'type': 'job', 'start': 1}) == (
+        'running_jobs', 'active_jobs')
+    assert job_categories({'type': 'job', 'start': 1, 'done': 2}) == (
+        'finished_jobs', 'active_jobs')
+    assert job_categories({'type': 'job', 'done': 2, 'archive': 3}) == (
+        'archived_jobs',)
+    assert job_categories({'type': 'task'}) == ()
+
+
+def test_seed_and_follow():
+    log = ChangesLog()
+    log.add('a', type='task', lock=0, done=0)
+    log.add('b', type='task', lock=1, done=0)
+    log.add('_design/x', language='javascript')
+    log.add('d', type='task', lock=1, done=2)
+    tasks, follower = counter(log)
+    assert not tasks.ready
+    follower.consume()
+    assert tasks.ready
+    assert follower.since == 4
+    assert tasks.counts == {'pending': 1, 'in_progress': 1, 'done': 1,
+                            'error': 0}
+    # finished tasks are not remembered
+    assert 2 == tasks.stats()['documents']
+
+    log.add('b', type='task', lock=1, done=2)
+    log.add('a', deleted=True)
+    log.add('c', type='task', lock=-1, done=0)
+    follower.consume()
+    assert tasks.counts == {'pending': 0, 'in_progress': 0, 'done': 2,
+                            'error': 1}
+    assert follower.since == 7
+    assert 1 == log.counted
+    assert 0 == tasks.stats()['documents']
+
+
+def test_changes_during_seed():
+    log = ChangesLog()
+    log.add('a', type='task', lock=0, done=0)
+    tasks, follower = counter(log)
+    # the feed starts before the documents are listed, so the changes up to
+    # the counts update the remembered categories only
+    follower.seed = lambda: tasks.seed() - 1
+    log.add('a', type='task', lock=1, done=0)
+    follower.consume()
+    assert tasks.counts['in_progress'] == 1 and tasks.counts['pending'] == 0
+    log.add('a', type='task', lock=1, done=2)
+    follower.consume()
+    assert tasks.counts == {'pending': 0, 'in_progress': 0, 'done': 1,
+                            'error': 0}
+
+
+def test_recount():
+    log = ChangesLog()
+    log.add('a', type='task', lock=1, done=2)
+    log.add('b', type='task', lock=1, done=2)
+    tasks, follower = counter(log)
+    follower.consume()
+    assert 1 == log.counted
+
+    # a finished task is reset or deleted; the tasks are counted again, up
+    # to the last change
+    log.add('a', type='task', lock=0, done=0)
+    log.add('b', deleted=True)
+    follower.consume()
+    assert 2 == log.counted
+    assert tasks.counts == {'pending': 1, 'in_progress': 0, 'done': 0,
+                            'error': 0}
+
+    tasks.recount_interval = 60
+    log.add('c', type='task', lock=0, done=0)
+    log.add('c', type='task', lock=1, done=2)
+    follower.consume()
+    # a new task is counted without counting again
+    assert 2 == log.counted
+    assert tasks.counts == {'pending': 1, 'in_progress': 0, 'done': 1,
+                            'error': 0}
+
+    # counting again waits for the interval
+    log.add('c', deleted=True)
+    follower.consume()
+    assert 2 == log.counted
+    assert tasks._timer is not None
+    tasks._timer.cancel()
+
+
+def test_unchanged_category():
+    log = ChangesLog()
+    log.add('a', type='task', lock=0, done=0)
+    tasks, follower = counter(log)
+    follower.consume()
+    version = tasks.version
+    log.add('a', type='task', lock=0, done=0, output={})
+    follower.consume()
+    assert tasks.version == version
+
+
+def test_overview_totals():
+    task_log, job_log = ChangesLog(), ChangesLog(job_categories)
+    task_log.add('a', type='task', lock=0, done=0)
+    job_log.add('j', type='job', queue=1, start=0)
+    tasks, task_follower = counter(task_log)
+    jobs, job_follower = counter(
+        job_log, job_categories, JOB_CATEGORIES,
+        transient=('pending_jobs', 'running_jobs', 'finished_jobs',
+                   'active_jobs'))
+    totals = OverviewTotals(tasks, jobs)
+    assert totals.snapshot() is None
+
+    task_follower.consume()
+    job_follower.consume()
+    counts, etag = totals.snapshot()
+    assert counts['pending'] == 1
+    assert counts['active_jobs'] == 1
+    assert counts['pending_jobs'] == 1
+    assert counts['update_seq'] == 2
+
+    job_log.add('j', type='job', queue=1, start=2)
+    job_follower.consume()
+    counts, new_etag = totals.snapshot()
+    assert counts['update_seq'] == 3
+    assert new_etag != etag
+    assert counts['running_jobs'] == 1
+    assert counts['pending_jobs'] == 0
+    assert counts['active_jobs'] == 1
+
+    # another process gives the same totals the same ETag
+    other = OverviewTotals(counter(task_log)[0],
+                           counter(job_log, job_categories, JOB_CATEGORIES)[0])
+    other.tasks.seed()
+    other.jobs.seed()
+    assert new_etag == other.snapshot()[1]
+
+
+def test_seq_number():
+    assert 0 == seq_number(None)
+    assert 12 == seq_number(12)
+    assert 12 == seq_number('12-g1AAAAFTeJzLYWBg4MhgTmHgz8tPSTV0MDQy')
+
+
+class Database(object):
+    """ simcity database with views named after categories. """
+    def __init__(self, rows, seqs):
+        self.rows = rows
+        self.seqs = list(seqs)
+        self.queries = []
+
+    def view(self, name, **params):
+        self.queries.append((name, params))
+        rows = self.rows[name]
+        if 'startkey' in params:
+            rows = [row for row in rows if row['id'] >= params['startkey']]
+        if params.get('limit'):
+            rows = rows[:params['limit']]
+        update_seq = self.seqs.pop(0) if params.get('update_seq') else None
+        return ListViewResults(rows, len(self.rows[name]), 0,
+                               update_seq=update_seq)
+
+
+def test_view_categories():
+    rows = {'done': [{'id': 'a', 'key': 'a'}, {'id': 'b', 'key': 'b'}],
+            'error': []}
+    # the index was updated between the first views
+    database = Database(rows, ['5-x', '6-y', '6-y', '6-y'])
+    assert ({'done': 2, 'error': 0}, '6-y') == view_counts(
+        database, ('done', 'error'))
+    assert [('done', {'limit': 0, 'update_seq': True}),
+            ('error', {'limit': 0, 'update_seq': True, 'stale': 'ok'})] == \
+        database.queries[2:]
+    assert ['a', 'b'] == list(view_members(database, 'done'))
@@ -16,7 +16,10 @@
 
 from __future__ import print_function
 
-from simcityweb.util import (error, abort, get_minified_json, SimulationConfig)
+from simcityweb.util import (error, abort, get_minified_json, SimulationConfig,
+                             make_etag, etag_matches, encoded_etag,
+                             unencoded_etag, ParameterSweep, project,
+                             parse_fields)
 from bottle import HTTPResponse
 from pytest import raises
 import os
@@ -84,3 +87,54 @@ def test_get_simulation_config(tmpdir):
 
     assert '1.0' == config.get_versions()[0]
     assert '1.0' == config.get_simulation('latest').version
+
+
+def test_etag_matches():
+    etag = make_etag(b'data')
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag, '"other", ' + etag)
+    assert etag_matches(etag, '*')
+    assert not etag_matches(etag, '"other"')
+    assert not etag_matches(etag, None)
+
+
+def test_encoded_etag():
+    etag = make_etag(b'data')
+    gzip_etag = encoded_etag(etag, 'gzip')
+    assert gzip_etag != etag and gzip_etag.endswith('-gzip"')
+    assert etag == unencoded_etag(gzip_etag)
+    assert etag == unencoded_etag(etag)
+    assert 'W/"a-br"' == encoded_etag('W/"a"', 'br')
+    assert etag_matches(etag, gzip_etag)
+    assert etag_matches(etag, 'W/' + encoded_etag(etag, 'br'))
+    assert not etag_matches(gzip_etag, etag)
+
+
+def test_parameter_sweep_expand():
+    description = {'sweep': ['a', 'b', 'c']}
+    sets = list(ParameterSweep().expand(
+        description, {'a': [1, 2], 'b': ['x', 'y', 'z'], 'c': 0, 'd': [5]}))
+    assert 6 == len(sets)
+    assert {'a': 1, 'b': 'x', 'c': 0, 'd': [5]} == sets[0]
+    assert {'a': 2, 'b': 'z', 'c': 0, 'd': [5]} == sets[-1]
+
+
+def test_project():
+    doc = {'_id': 'a', '_rev': '1-a', 'done': 1,
+           'input': {'ensemble': 'e', 'x': 1}}
+    assert {'_id': 'a', '_rev': '1-a', 'done': 1} == project(doc, ['done'])
+    assert {'_id': 'a', '_rev': '1-a', 'input': {'ensemble': 'e'}} == project(
+        doc, ['input.ensemble', 'input.missing', 'missing', 'done.x'])
+
+
+def test_project_keep():
+    value = {'id': 'a', 'rev': '1-a', 'done': 1, 'lock': 2}
+    assert {'id': 'a', 'rev': '1-a', 'done': 1} == project(
+        value, ['done'], keep=('id', 'rev'))
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields(' , ') is None
+    assert ['done', 'input.x'] == parse_fields('done, input.x,')
@@ -0,0 +1,115 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.registry import SimulationRegistry
+from simcityweb.util import Simulation
+from simcityweb.validation import ParameterValidator, ValidatorCache
+from pytest import raises, fixture
+import json
+import os
+import shutil
+import time
+
+project_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+spec = {
+    'latest': '1.0',
+    '1.0': {
+        'command': 'run.sh',
+        'properties': {
+            'factor': {'type': 'number', 'default': 0.1},
+            'fires': {
+                'type': 'array',
+                'items': {
+                    '$ref': 'https://example.com/schema/point2d'
+                },
+            },
+        },
+        'required': ['fires'],
+    }
+}
+
+
+@fixture
+def validators(tmpdir):
+    tmpdir.mkdir('simulations').join('test.json').write(json.dumps(spec))
+    shutil.copytree(os.path.join(project_dir, 'schemas'),
+                    str(tmpdir.join('schemas')))
+    registry = SimulationRegistry(str(tmpdir.join('simulations')))
+    return ValidatorCache(registry, str(tmpdir.join('schemas')))
+
+
+def test_validate_defaults(validators):
+    params = {'fires': [{'x': 1, 'y': 2}]}
+    sim, duration = validators.validate('test', 'latest', params)
+    assert '1.0' == sim.version
+    assert 0.1 == params['factor']
+    assert duration >= 0
+
+
+def test_validate_invalid(validators):
+    with raises(ValueError):
+        validators.validate('test', None, {})
+    with raises(ValueError):
+        validators.validate('test', None, {'fires': [], 'other': 1})
+    with raises(ValueError):
+        validators.validate('test', None, {'fires': [{'x': 1}]})
+    assert 3 == validators.stats()['validations']
+
+
+def test_fill_defaults():
+    validator = ParameterValidator(Simulation('test', '1.0', {
+        'command': 'run.sh',
+        'properties': {
+            'factor': {'type': 'number', 'default': 0.1},
+            'fires': {
+                'type': 'array',
+                'items': {'allOf': [{
+                    'properties': {'size': {'type': 'number', 'default': 1}},
+                }]},
+            },
+        },
+        'required': ['fires'],
+    }))
+    params = {'fires': [{'x': 1}, {'size': 'large'}], 'other': 1}
+    validator.fill_defaults(params)
+    assert 0.1 == params['factor']
+    assert [{'x': 1, 'size': 1}, {'size': 'large'}] == params['fires']
+
+    params = {'fires': [{'x': 1}]}
+    validator.validate(params)
+    assert {'fires': [{'x': 1, 'size': 1}], 'factor': 0.1} == params
+
+    # fill_defaults does not check the parameters
+    validator.fill_defaults({})
+
+
+def test_validator_cached(validators):
+    validator = validators.get('test', 'latest')
+    assert validator is validators.get('test', '1.0')
+    assert 1 == validators.stats()['compilations']
+
+
+def test_validator_recompiled(validators, tmpdir):
+    validator = validators.get('test', 'latest')
+    f = tmpdir.join('simulations', 'test.json')
+    f.write(json.dumps(spec))
+    mtime = time.time() + 10
+    os.utime(str(f), (mtime, mtime))
+
+    assert validator is not validators.get('test', 'latest')
@@ -0,0 +1,125 @@
+# SIM-CITY webservice
+#
+# Copyright 2015 Netherlands eScience Center
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from simcityweb.views import (parse_limit, stream_view, stream_rows, view_page,
+                              page_to_json, iter_view, project_rows)
+from simcityweb.util import view_to_json
+from helpers import ListView, view_page_to_json
+from pytest import raises
+import json
+
+
+def make_view(n):
+    ids = ['task_{0:03d}'.format(i) for i in range(n)]
+    return ListView([{'id': i, 'key': i, 'value': {'id': i}} for i in ids])
+
+
+class CountingView(ListView):
+    def __init__(self, rows):
+        super(CountingView, self).__init__(rows)
+        self.limits = []
+
+    def __call__(self, **params):
+        self.limits.append(params.get('limit'))
+        return super(CountingView, self).__call__(**params)
+
+
+def test_parse_limit():
+    assert parse_limit(None) is None
+    assert parse_limit('') is None
+    assert parse_limit('10') == 10
+    raises(ValueError, parse_limit, '0')
+    raises(ValueError, parse_limit, 'a')
+
+
+def test_view_pages():
+    view = make_view(5)
+    page = view_page_to_json(view, 2)
+    assert [row['id'] for row in page['rows']] == ['task_000', 'task_001']
+    assert page['next_startkey_docid'] == 'task_002'
+    assert page['total_rows'] == 5
+
+    page = view_page_to_json(view, 2, 'task_004', 'task_004')
+    assert [row['id'] for row in page['rows']] == ['task_004']
+    assert page['offset'] == 4
+    assert 'next_startkey_docid' not in page
+
+    page = view_page_to_json(view)
+    assert len(page['rows']) == 5
+    assert 'next_startkey_docid' not in page
+
+
+def test_stream_view():
+    view = CountingView(make_view(5).rows)
+    result = json.loads(''.join(stream_view(view, page_size=2)))
+    assert result == view_to_json(make_view(5)())
+    assert view.limits == [3, 3, 3]
+
+
+def test_stream_view_first_page():
+    view = CountingView(make_view(5).rows)
+    page = view_page(view, 2)
+    assert page_to_json(*page) == view_page_to_json(view, 2)
+    result = json.loads(''.join(stream_view(view, page_size=2,
+                                            first_page=page)))
+    assert result == view_to_json(make_view(5)())
+    assert view.limits == [3, 3, 3, 3]
+
+
+def test_stream_view_empty():
+    result = json.loads(''.join(stream_view(make_view(0))))
+    assert result == {'total_rows': 0, 'offset': 0, 'rows': []}
+
+
+def test_stream_view_start():
+    result = json.loads(''.join(stream_view(make_view(5), 'task_003',
+                                            'task_003', page_size=1)))
+    assert [row['id'] for row in result['rows']] == ['task_003', 'task_004']
+
+
+def test_stream_rows():
+    for n in (0, 1, 4, 5):
+        rows = [{'id': i} for i in range(n)]
+        result = ''.join(stream_rows(iter(rows), page_size=2))
+        assert {'rows': rows} == json.loads(result)
+
+
+def test_iter_view():
+    view = CountingView(make_view(5).rows)
+    rows = list(iter_view(view, 'task_001', 'task_001', page_size=2))
+    assert [row['id'] for row in rows] == ['task_001', 'task_002', 'task_003',
+                                           'task_004']
+    assert view.limits == [3, 3]
+
+
+def test_project_rows():
+    value = {'id': 'a', 'rev': '1-a', 'done': 1, 'input': {'x': 1}}
+    rows = [{'id': 'a', 'key': 'a', 'value': value},
+            {'key': 'b', 'error': 'not_found'}]
+    assert project_rows(rows, None) is rows
+    assert project_rows(rows, ['done']) == [
+        {'id': 'a', 'key': 'a', 'value': {'id': 'a', 'rev': '1-a', 'done': 1}},
+        {'key': 'b', 'error': 'not_found'}]
+    assert 'input' in rows[0]['value']
+
+
+def test_stream_view_fields():
+    result = json.loads(''.join(stream_view(make_view(3), page_size=2,
+                                            fields=['missing'])))
+    assert [row['value'] for row in result['rows']] == [
+        {'id': 'task_000'}, {'id': 'task_001'}, {'id': 'task_002'}]